@@ -2,13 +2,15 @@ __all__ = ["setup_logging", "run", "main"]
 import os
 import sys
 import argparse
-import json
 from aiohttp import web
 import asyncio
-import websockets
 import logging
 from aiotesttoolkit_remoteviewer.app import Application
 from aiotesttoolkit_remoteviewer import configuration
+from aiotesttoolkit_remoteviewer.pipeline import Pipeline
+from aiotesttoolkit_remoteviewer import recording as _recording
+from aiotesttoolkit_remoteviewer.ingest import IngestWorkers
+from aiotesttoolkit_remoteviewer.relay import Relay
 sys.path.append("C:/Users/jeremy/Documents/Projects/aiotesttoolkit")
 import aiotesttoolkit
 from aiotesttoolkit import reporting
@@ -52,23 +54,145 @@ def setup_logging(
         )
 
 
-def run(*, base_url: str, port: int, jinja2_templates_dir:str, static_dir:str, master:dict):
-    clients = []
+def run(
+    *,
+    base_url: str,
+    port: int,
+    jinja2_templates_dir: str,
+    static_dir: str,
+    master: dict,
+    websocket: dict = None,
+    aggregation: dict = None,
+    events: dict = None,
+    timeseries: dict = None,
+    timeline: dict = None,
+    recording: dict = None,
+    replay: str = None,
+    speed: float = 1.0,
+    ingest_workers: int = 0,
+    relay: dict = None,
+    alerts: dict = None,
+    clock: dict = None,
+    runs: dict = None,
+    overload: dict = None,
+    codec: dict = None
+):
+    """Run the viewer.
+
+    Stats are received from slaves by a `reporting.MasterReporter`, or
+    read from a recording when `replay` is set. Dashboards are served
+    by the same application and event loop, on `base_url + "ws"`.
+
+    :param events: event stream options of passive dashboards, see `sse`
+    :param replay: recording to replay instead of receiving stats
+    :param speed: replay speed, `0` for as fast as possible
+    :param ingest_workers: number of processes receiving slave reports,
+                           `0` to receive them in this process, see
+                           `ingest` for what their stats don't reach
+    :param relay: relay options, window summaries are forwarded to the
+                  parent viewer at `upstream` if set, and partials of
+                  child viewers are received if `accept` is set, with
+                  the shared `token` if any
+    :param alerts: dict of alert rule name to declaration, see `alerts`
+    :param clock: clock estimation options, see `clock`
+    :param runs: run snapshot options, see `runs`
+    :param overload: overload options, see `overload`
+    :param codec: codec options, see `codec`
+    """
+    if ingest_workers > 0 and not replay and (recording or {}).get("directory"):
+        raise ValueError(
+            "Calls aggregated by ingest workers can't be recorded, "
+            "disable recording or ingest workers"
+        )
+    websocket = websocket or {}
+    relay = relay or {}
+    codec = codec or {}
+    partial_codec = codec.get("partial", configuration.DEFAULT_CODEC_PARTIAL)
+    heartbeat = websocket.get(
+        "ping_interval", configuration.DEFAULT_WEBSOCKET_PING_INTERVAL
+    )
+    pipeline = Pipeline(
+        websocket=websocket,
+        aggregation=aggregation,
+        events=events,
+        timeseries=timeseries,
+        timeline=timeline,
+        recording=recording if not replay else None,
+        alerts=alerts,
+        # Arrival times of replayed stats say nothing about slave clocks
+        clock=clock if not replay else dict(clock or {}, correct=False),
+        runs=runs,
+        overload=overload,
+        codec=codec,
+    )
+    handler = pipeline
+    if relay.get("upstream", None):
+        handler = Relay(
+            relay["upstream"],
+            pipeline=pipeline,
+            interval=relay.get("interval", configuration.DEFAULT_RELAY_INTERVAL),
+            heartbeat=heartbeat,
+            codec=partial_codec,
+            token=relay.get("token", None),
+        )
+    reporter = None
+    if replay:
+        reporter = None
+    elif ingest_workers > 0:
+        reporter = IngestWorkers(
+            ingest_workers,
+            host=master["host"],
+            port=master["port"],
+            handle_partial=handler.handle_partial,
+            codec=partial_codec,
+        )
+    else:
+        reporter = reporting.MasterReporter(
+            master["host"], master["port"], handle_stat=handler.handle_stat
+        )
 
-    async def handle_client(websocket, path):
-        clients.append(websocket)
-        while True:
-            await asyncio.sleep(0)
+    async def on_startup(app):
+        await pipeline.start()
+        if handler is not pipeline:
+            pipeline.create_task(handler.run())
+        if reporter:
+            await reporter.start()
+        else:
+            pipeline.create_task(
+                _recording.replay(
+                    replay,
+                    handler.handle_stat,
+                    speed=speed,
+                    codec=codec.get("json", configuration.DEFAULT_CODEC_JSON),
+                )
+            )
 
-    async def handle_stat(stat):
-        for _ in clients:
-            await _.send(json.dumps(stat))
+    async def on_cleanup(app):
+        if reporter:
+            await reporter.stop()
+        await pipeline.stop()
 
-    reporter = reporting.MasterReporter("0.0.0.0", 8081, handle_stat=handle_stat)
-    asyncio.get_event_loop().run_until_complete(reporter.start())
-    socket = asyncio.get_event_loop().run_until_complete(websockets.serve(handle_client, "0.0.0.0", 8082))
-    print(socket)
-    app = Application(base_url=base_url, jinja2_templates_dir=jinja2_templates_dir, static_dir=static_dir)
+    app = Application(
+        base_url=base_url,
+        jinja2_templates_dir=jinja2_templates_dir,
+        static_dir=static_dir,
+        clients=pipeline.clients,
+        events=pipeline.events,
+        store=pipeline.store,
+        timeline=pipeline.timeline,
+        monitor=pipeline.monitor,
+        relay=(
+            handler.handle_partial
+            if relay.get("accept", configuration.DEFAULT_RELAY_ACCEPT)
+            else None
+        ),
+        relay_token=relay.get("token", None),
+        runs=pipeline.runs,
+        snapshot_run=pipeline.snapshot_run,
+        heartbeat=heartbeat,
+    )
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
     web.run_app(app, port=port)
 
 
@@ -76,6 +200,37 @@ def main(argv=None):
     parser = argparse.ArgumentParser(prog="Service", description="Help")
     parser.add_argument("directory", type=str, help="config directory")
     parser.add_argument("-v", "--verbose", action="store_true", help="Verbosity level")
+    parser.add_argument(
+        "--replay", type=str, metavar="FILE", help="replay a recording"
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        metavar="N",
+        help="replay speed, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--ingest-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="number of processes receiving slave reports",
+    )
+    parser.add_argument(
+        "--upstream",
+        type=str,
+        default=None,
+        metavar="URL",
+        help="forward window summaries to the parent viewer at this url",
+    )
+    parser.add_argument(
+        "--tag",
+        type=str,
+        action="append",
+        metavar="TAG",
+        help="tag of saved runs, can be repeated",
+    )
     args = parser.parse_args(args=argv)
 
     config_dir = args.directory
@@ -86,6 +241,13 @@ def main(argv=None):
 
     logging.basicConfig(level=logging.INFO)
 
+    try:
+        import uvloop
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
     setup_logging(
         access_logfile=config["logging"].get("access-logfile", None),
         access_maxbytes=int(config["logging"].get("access-maxbytes", None)),
@@ -103,7 +265,79 @@ def main(argv=None):
         master={
             "host": config["master"]["host"],
             "port": int(config["master"]["port"])
-        }
+        },
+        websocket={
+            "ping_interval": float(config["websocket"]["ping-interval"]),
+            "queue_size": int(config["websocket"]["queue-size"]),
+            "queue_policy": config["websocket"]["queue-policy"],
+        },
+        aggregation={"window": float(config["aggregation"]["window"])},
+        events={
+            "interval": float(config["events"]["interval"]),
+            "max_buffer": int(config["events"]["max-buffer"]),
+            "metrics": [
+                _.strip() for _ in config["events"]["metrics"].split(",") if _.strip()
+            ],
+        },
+        timeseries={
+            "capacity": int(config["timeseries"]["capacity"]),
+            "backfill": float(config["timeseries"]["backfill"]),
+            "backfill_points": int(config["timeseries"]["backfill-points"]),
+            "max_metrics": int(config["timeseries"]["max-metrics"]),
+        },
+        timeline={
+            "capacity": int(config["timeline"]["capacity"]),
+            "retention": float(config["timeline"]["retention"]),
+            "buckets": int(config["timeline"]["buckets"]),
+        },
+        recording={
+            "directory": config["recording"].get("directory", None),
+            "segment_size": int(config["recording"]["segment-size"]),
+            "fsync_interval": float(config["recording"]["fsync-interval"]),
+        },
+        replay=args.replay,
+        speed=args.speed,
+        ingest_workers=(
+            args.ingest_workers
+            if args.ingest_workers is not None
+            else int(config["master"]["ingest-workers"])
+        ),
+        relay={
+            "upstream": (
+                args.upstream
+                if args.upstream is not None
+                else config["relay"].get("upstream", None)
+            ),
+            "interval": float(config["relay"]["interval"]),
+            "accept": str(config["relay"]["accept"]).lower()
+            in ("1", "true", "yes", "on"),
+            "token": config["relay"].get("token", None) or None,
+        },
+        alerts=config["alerts"],
+        clock={
+            "correct": str(config["clock"]["correct"]).lower()
+            in ("1", "true", "yes", "on"),
+            "bucket": float(config["clock"]["bucket"]),
+            "buckets": int(config["clock"]["buckets"]),
+        },
+        runs={
+            "directory": config["runs"].get("directory", None),
+            "tags": [
+                _.strip()
+                for _ in config["runs"].get("tags", "").split(",")
+                if _.strip()
+            ]
+            + (args.tag or []),
+        },
+        overload={
+            "queue_size": int(config["overload"]["queue-size"]),
+            "max_lag": float(config["overload"]["max-lag"]),
+            "max_ratio": int(config["overload"]["max-ratio"]),
+        },
+        codec={
+            "json": config["codec"]["json"],
+            "partial": config["codec"]["partial"],
+        },
     )
 
 
@@ -1,4 +1,6 @@
 from aiotesttoolkit_remoteviewer import main
 
 
-main()
+# Guarded so ingest worker processes can import this module
+if __name__ == "__main__":
+    main()
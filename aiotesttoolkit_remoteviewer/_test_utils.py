@@ -3,12 +3,22 @@ __all__ = [
     "load_tests_from_class",
     "load_tests_from_module",
     "load_tests",
+    "iter_tests",
+    "load_timings",
+    "run_parallel",
     "run",
 ]
+import asyncio
 import unittest
 import logging
 import json
 import importlib
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import time
+import traceback
 import nose
 from nose.plugins.cover import Coverage
 import coverage
@@ -104,6 +114,193 @@ def load_tests(config_filename, **kwargs):
     return suite
 
 
+def iter_tests(suite):
+    """Iterate over all tests of nested suites."""
+    for _ in suite:
+        if isinstance(_, unittest.TestSuite):
+            yield from iter_tests(_)
+        else:
+            yield _
+
+
+def load_timings(filename):
+    """Load durations of tests from a previous run.
+
+    :param filename: timing report written by `run`
+    :returns: Dict of test id to duration in seconds.
+    """
+    try:
+        with open(filename, "r") as f:
+            report = json.loads(f.read())
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        logger.warning("Could not load {}".format(filename))
+        return {}
+    return {k: v["duration"] for k, v in report.get("tests", {}).items()}
+
+
+# Coverage of the current worker process
+_worker_coverage = None
+
+
+def _save_coverage():
+    _worker_coverage.stop()
+    _worker_coverage.save()
+
+
+def _init_worker(cover_package, with_coverage):
+    """Initialize a worker process of `run`."""
+    global _worker_coverage
+    # Each worker has its own event loop
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    if with_coverage:
+        _worker_coverage = coverage.Coverage(
+            data_suffix=True, source=[cover_package] if cover_package else None
+        )
+        _worker_coverage.start()
+        # Pool workers don't run atexit handlers
+        multiprocessing.util.Finalize(None, _save_coverage, exitpriority=16)
+
+
+def _run_test(task):
+    """Run one test in a worker process of `run`.
+
+    :param task: test id, module, class and method names and options
+    :returns: Test id and its result.
+    """
+    test_id, module, name, method, options = task
+    result = unittest.TestResult()
+    start = time.perf_counter()
+    try:
+        clazz = getattr(importlib.import_module(module), name)
+        # A suite runs class and module fixtures around the test
+        unittest.TestSuite([clazz(method, options=options)]).run(result)
+    except Exception:
+        result.errors.append((None, traceback.format_exc()))
+    duration = time.perf_counter() - start
+    if result.errors:
+        status, details = "error", result.errors[0][1]
+    elif result.failures:
+        status, details = "fail", result.failures[0][1]
+    elif result.unexpectedSuccesses:
+        status, details = "fail", "unexpected success"
+    elif result.skipped:
+        status, details = "skip", result.skipped[0][1]
+    else:
+        status, details = "ok", None
+    return (
+        test_id,
+        {
+            "status": status,
+            "duration": duration,
+            "worker": os.getpid(),
+            "details": details,
+        },
+    )
+
+
+def run_parallel(
+    suite,
+    *,
+    workers,
+    timings="test-timings.json",
+    cover_package=None,
+    cover_html=None,
+    with_coverage=True
+):
+    """Run tests of a suite in a pool of processes.
+
+    Tests are sent one at a time to the first idle worker, longest first
+    according to durations of the previous run, so long stress tests
+    don't end up last. Tests that never ran are considered the longest.
+    Coverage data of workers is combined at the end and a timing report
+    of all tests is written, that is used to schedule the next run.
+
+    :param suite: suite returned by `load_tests`
+    :param workers: number of worker processes
+    :param timings: path of the timing report
+    :param cover_package: restrict coverage to this package
+    :param cover_html: write an html coverage report
+    :param with_coverage: measure coverage
+    :returns: If all tests passed.
+    """
+    if workers <= 0:
+        raise ValueError("workers must be positive")
+    history = load_timings(timings) if timings else {}
+    unknown = max(history.values(), default=0.0) + 1.0
+    tasks = [
+        (
+            _.id(),
+            type(_).__module__,
+            type(_).__name__,
+            _._testMethodName,
+            getattr(_, "options", None),
+        )
+        for _ in iter_tests(suite)
+    ]
+    tasks.sort(key=lambda _: history.get(_[0], unknown), reverse=True)
+
+    results = {}
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(
+        workers, initializer=_init_worker, initargs=(cover_package, with_coverage)
+    )
+    try:
+        for test_id, result in pool.imap_unordered(_run_test, tasks):
+            results[test_id] = result
+            sys.stderr.write(
+                "{} ... {} ({:.3f}s)\n".format(
+                    test_id, result["status"], result["duration"]
+                )
+            )
+            if result["status"] in ("fail", "error"):
+                sys.stderr.write(result["details"] + "\n")
+    finally:
+        # Let workers exit by themselves so they save their coverage
+        pool.close()
+        pool.join()
+    wall = time.perf_counter() - start
+
+    total = sum(_["duration"] for _ in results.values())
+    counts = {}
+    for _ in results.values():
+        counts[_["status"]] = counts.get(_["status"], 0) + 1
+    sys.stderr.write(
+        "Ran {} tests in {:.3f}s on {} workers ({:.3f}s of tests): {}\n".format(
+            len(results),
+            wall,
+            workers,
+            total,
+            ", ".join("{} {}".format(v, k) for k, v in sorted(counts.items())),
+        )
+    )
+    if timings:
+        report = {
+            "workers": workers,
+            "wall": wall,
+            "total": total,
+            "tests": dict(
+                sorted(results.items(), key=lambda _: _[1]["duration"], reverse=True)
+            ),
+        }
+        with open(timings, "w") as f:
+            f.write(json.dumps(report, indent=2))
+
+    if with_coverage:
+        cov = coverage.Coverage(source=[cover_package] if cover_package else None)
+        cov.combine()
+        cov.save()
+        try:
+            cov.report()
+            if cover_html:
+                cov.html_report()
+        except coverage.CoverageException as e:
+            logger.warning("Could not report coverage: {}".format(e))
+    return all(_["status"] not in ("fail", "error") for _ in results.values())
+
+
 def run(config_filename, **kwargs):
     """Run all configured tests.
 
@@ -117,10 +314,36 @@ def run(config_filename, **kwargs):
     You can use custom options that will be automatically
     passed to your tests.
     :param parent_module: parent module path
+    :param workers: run tests in this number of processes, see
+                    `run_parallel`, instead of serially under nose
+    :param timings: path of the timing report of parallel runs
+    :param with_coverage: measure coverage of parallel runs
     """
     parent_module = kwargs["parent_module"]
     cover_package = kwargs.get("cover_package", None)
     cover_html = kwargs.get("cover_html", None)
+    workers = kwargs.get("workers", 0)
+    with_coverage = kwargs.get("with_coverage", True)
+
+    if workers:
+        cov = None
+        if with_coverage:
+            cov = coverage.Coverage(
+                data_suffix=True, source=[cover_package] if cover_package else None
+            )
+            cov.start()
+        suite = load_tests(config_filename, parent_module=parent_module)
+        if cov:
+            cov.stop()
+            cov.save()
+        return run_parallel(
+            suite,
+            workers=workers,
+            timings=kwargs.get("timings", "test-timings.json"),
+            cover_package=cover_package,
+            cover_html=cover_html,
+            with_coverage=with_coverage,
+        )
 
     cov = coverage.Coverage()
     # cov.load()
@@ -0,0 +1,339 @@
+__all__ = [
+    "Histogram",
+    "WindowStats",
+    "Aggregator",
+    "encode_partial",
+    "decode_partial",
+    "decode_partial_async",
+]
+import asyncio
+import logging
+import math
+import time
+from aiotesttoolkit_remoteviewer import codec as _codec
+from aiotesttoolkit_remoteviewer import stats
+
+logger = logging.getLogger("remoteviewer.aggregation")
+
+# Number of bits kept from each value: relative error is 1 / 2 ** SUB_BITS
+SUB_BITS = 5
+_SUB_COUNT = 1 << SUB_BITS
+# Values are recorded with a resolution of one microsecond
+_RESOLUTION = 1e-6
+
+
+def _bucket(value: int) -> int:
+    """Index of the log-linear bucket containing an integer value."""
+    if value < 2 * _SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift + 1) * _SUB_COUNT + (value >> shift) - _SUB_COUNT
+
+
+def _bucket_value(index: int) -> float:
+    """Middle of the range of integer values covered by a bucket."""
+    if index < 2 * _SUB_COUNT:
+        return float(index)
+    shift = index // _SUB_COUNT - 1
+    mantissa = index % _SUB_COUNT + _SUB_COUNT
+    return ((mantissa << shift) + ((mantissa + 1) << shift) - 1) / 2.0
+
+
+class Histogram:
+    """Sparse log-linear histogram of durations.
+
+    Buckets have the same layout in every histogram, so merging two
+    histograms is an exact sum of bucket counts and percentiles of merged
+    histograms are the same as if all values were recorded in one.
+    """
+
+    __slots__ = ("counts", "count")
+
+    def __init__(self, counts: dict = None):
+        self.counts = dict(counts or {})
+        self.count = sum(self.counts.values())
+
+    def add(self, value: float, count: int = 1):
+        """Record a value.
+
+        :param value: duration in seconds
+        :param count: number of times to record it
+        """
+        index = _bucket(max(0, int(value / _RESOLUTION)))
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+
+    def merge(self, other: "Histogram"):
+        """Add all values recorded by another histogram.
+
+        :param other: histogram to merge
+        """
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+
+    def subtract(self, other: "Histogram"):
+        """Remove all values of a histogram merged before.
+
+        :param other: histogram to subtract
+        """
+        counts = self.counts
+        for index, count in other.counts.items():
+            left = counts.get(index, 0) - count
+            if left > 0:
+                counts[index] = left
+            else:
+                counts.pop(index, None)
+        self.count -= other.count
+
+    def percentiles(self, *ranks: float) -> list:
+        """Compute percentiles in a single pass.
+
+        :param ranks: percentiles to compute, between 0 and 100
+        :return: values in seconds, or `None` if empty
+        """
+        if not self.count:
+            return [None for _ in ranks]
+        targets = sorted(
+            (max(1, math.ceil(rank / 100.0 * self.count)), i)
+            for i, rank in enumerate(ranks)
+        )
+        result = [None] * len(ranks)
+        seen = 0
+        pos = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while pos < len(targets) and targets[pos][0] <= seen:
+                result[targets[pos][1]] = _bucket_value(index) * _RESOLUTION
+                pos += 1
+            if pos == len(targets):
+                break
+        return result
+
+    def to_dict(self) -> dict:
+        return {str(k): v for k, v in self.counts.items()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Histogram":
+        return cls({int(k): v for k, v in data.items()})
+
+
+class WindowStats:
+    """Stats of one scenario node over a time window.
+
+    :param node: name of the scenario node
+    """
+
+    __slots__ = ("node", "count", "errors", "total", "sumsq", "min", "max", "histogram")
+
+    def __init__(self, node: str):
+        self.node = node
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.sumsq = 0.0
+        self.min = None
+        self.max = None
+        self.histogram = Histogram()
+
+    def add(self, value: float, *, error: bool = False):
+        """Record a profiled call.
+
+        :param value: duration in seconds
+        :param error: if the call failed
+        """
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total += value
+        self.sumsq += value * value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.histogram.add(value)
+
+    def merge(self, other: "WindowStats"):
+        """Add all calls recorded by another window.
+
+        :param other: window to merge
+        """
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+        self.sumsq += other.sumsq
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        self.histogram.merge(other.histogram)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else None
+
+    def summary(self) -> dict:
+        """Compact summary sent to dashboards."""
+        p50, p95, p99 = self.histogram.percentiles(50, 95, 99)
+        return {
+            "node": self.node,
+            "count": self.count,
+            "errors": self.errors,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "p50": p50,
+            "p95": p95,
+            "p99": p99,
+        }
+
+    def to_dict(self) -> dict:
+        """Lossless representation that can be merged elsewhere."""
+        return {
+            "node": self.node,
+            "count": self.count,
+            "errors": self.errors,
+            "total": self.total,
+            "sumsq": self.sumsq,
+            "min": self.min,
+            "max": self.max,
+            "histogram": self.histogram.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WindowStats":
+        result = cls(data["node"])
+        result.count = data["count"]
+        result.errors = data["errors"]
+        result.total = data["total"]
+        result.sumsq = data["sumsq"]
+        result.min = data["min"]
+        result.max = data["max"]
+        result.histogram = Histogram.from_dict(data["histogram"])
+        return result
+
+
+# Partials smaller than this cost less to decode than to hand to a thread
+OFFLOAD_SIZE = 64 * 1024
+
+
+def encode_partial(
+    start: float, windows: list, others: list = None, *, codec=None
+) -> bytes:
+    """Serialize partial windows aggregated by another process or viewer.
+
+    :param start: start time of the partial windows
+    :param windows: partial `WindowStats`
+    :param others: stats that are not profiled calls
+    :param codec: `codec.Codec`, defaults to the fastest installed
+    :return: encoded partial
+    """
+    if codec is None:
+        codec = _codec.get(binary=True)
+    return codec.dumps(
+        {
+            "start": start,
+            "windows": [_.to_dict() for _ in windows],
+            "stats": others or [],
+        }
+    )
+
+
+def decode_partial(data) -> tuple:
+    """Counterpart of `encode_partial`.
+
+    The codec that encoded the partial is detected.
+
+    :param data: encoded partial
+    :return: partial `WindowStats` and stats that are not profiled calls
+    """
+    partial = _codec.detect(data).loads(data)
+    return (
+        [WindowStats.from_dict(_) for _ in partial["windows"]],
+        partial.get("stats", None) or [],
+    )
+
+
+async def decode_partial_async(data, *, offload_size: int = OFFLOAD_SIZE) -> tuple:
+    """Same as `decode_partial`, in a thread for big partials.
+
+    :param data: encoded partial
+    :param offload_size: size in bytes from which the partial is decoded
+                         in a thread
+    :return: partial `WindowStats` and stats that are not profiled calls
+    """
+    if len(data) < offload_size:
+        return decode_partial(data)
+    return await asyncio.get_event_loop().run_in_executor(None, decode_partial, data)
+
+
+class Aggregator:
+    """Fold profiled stats per scenario node into fixed time windows.
+
+    Only one summary per node and per window is published, so the number
+    of messages sent to dashboards doesn't depend on the number of bots.
+    Stats are folded into the window they arrive in: their timestamp,
+    corrected or not, is ignored, as are the ones of partial windows
+    aggregated by ingest workers and relays.
+
+    :param window: length of windows in seconds
+    """
+
+    def __init__(self, *, window: float = 1.0):
+        if window <= 0:
+            raise ValueError("window must be positive")
+        self.window = window
+        self._start = time.time()
+        self._nodes = {}
+
+    def add(self, record: stats.StatRecord) -> bool:
+        """Fold a stat into the current window.
+
+        :param record: `stats.StatRecord` of a received stat
+        :return: if the stat was a profiled call
+        """
+        value = record.duration
+        if value is None:
+            return False
+        # Windows are indexed by node id
+        window = self._nodes.get(record.node, None)
+        if window is None:
+            window = self._nodes[record.node] = WindowStats(record.node_name)
+        window.add(value, error=record.error)
+        return True
+
+    def merge(self, window: WindowStats):
+        """Fold a partial window aggregated elsewhere into the current one.
+
+        :param window: partial window
+        """
+        symbol = stats.SYMBOLS.intern(window.node)
+        current = self._nodes.get(symbol, None)
+        if current is None:
+            current = self._nodes[symbol] = WindowStats(window.node)
+        current.merge(window)
+
+    def flush(self) -> tuple:
+        """Close the current window and start a new one.
+
+        :return: start time of the closed window and its `WindowStats`
+        """
+        start, windows = self._start, list(self._nodes.values())
+        self._start = time.time()
+        self._nodes = {}
+        return start, windows
+
+    async def run(self, publish):
+        """Periodically flush windows and publish their summaries.
+
+        :param publish: callable receiving the start time of the window
+                        and the list of `WindowStats`
+        """
+        while True:
+            # Align windows on multiples of the window length
+            now = time.time()
+            await asyncio.sleep(self.window - now % self.window)
+            try:
+                publish(*self.flush())
+            except Exception:
+                logger.exception("Failed to publish window")
@@ -0,0 +1,314 @@
+"""Alert rules evaluated on window summaries.
+
+Rules are declared in the `[alerts]` section of the configuration, one
+per option, as `<metric> of <node> <operator> <threshold> [for <duration>]`:
+
+    match-latency = p99 of match > 250ms for 30s
+    create-errors = error_rate of create_game > 1% for 10s
+
+Metrics are `count`, `errors`, `rate` (calls per second), `error_rate`,
+`mean`, `min`, `max` and percentiles such as `p50` or `p99`. The node is
+an exact name or a prefix ending with `*`. The operator is `>`, `>=`,
+`<`, `<=`, `above` or `below`. Durations accept `us`, `ms` and `s` units
+and rates `%`. The metric is computed over a sliding window of the
+given duration, or over the last window if it is omitted.
+
+Each rule keeps one accumulator per matching node. Each closed window
+adds one entry to it and expired entries are removed, so evaluating a
+rule costs the same whatever the length of its sliding window. Rules on
+percentiles keep the histogram of the sliding window instead, windows
+are merged in and subtracted exactly, and the percentile is compared to
+the threshold. The value of their alerts is that percentile, in seconds.
+"""
+
+__all__ = ["FIRING", "RESOLVED", "Rule", "AlertEvaluator", "parse_rule"]
+import collections
+import logging
+import operator
+import re
+from aiotesttoolkit_remoteviewer.aggregation import Histogram
+
+logger = logging.getLogger("remoteviewer.alerts")
+
+FIRING = "firing"
+RESOLVED = "resolved"
+
+_RULE = re.compile(
+    r"^\s*(?P<metric>\w+)\s+of\s+(?P<node>\S+)\s*"
+    r"(?P<op>>=|<=|>|<|above|below)\s*"
+    r"(?P<threshold>[0-9]*\.?[0-9]+)\s*(?P<unit>us|ms|s|%)?"
+    r"(?:\s+for\s+(?P<duration>[0-9]*\.?[0-9]+)\s*(?P<duration_unit>ms|s|m)?)?\s*$"
+)
+_OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "above": operator.gt,
+    "<": operator.lt,
+    "<=": operator.le,
+    "below": operator.lt,
+}
+_UNITS = {None: 1.0, "s": 1.0, "ms": 1e-3, "us": 1e-6, "m": 60.0, "%": 0.01}
+_DURATION_METRICS = ("mean", "min", "max")
+_COUNT_METRICS = ("count", "errors", "rate")
+_METRICS = _COUNT_METRICS + ("error_rate",) + _DURATION_METRICS
+_PERCENTILE = re.compile(r"^p([0-9]+(?:\.[0-9]+)?)$")
+
+
+class Rule:
+    """A parsed alert rule.
+
+    :param name: name of the rule
+    :param metric: metric checked
+    :param node: exact node name or prefix ending with `*`
+    :param op: operator comparing the metric to the threshold
+    :param threshold: threshold in seconds, calls per second or ratio
+    :param duration: length of the sliding window in seconds, `0` for
+                     the last window only
+    :param text: rule as declared
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        metric: str,
+        node: str,
+        op: str,
+        threshold: float,
+        duration: float = 0.0,
+        text: str = None
+    ):
+        match = _PERCENTILE.match(metric)
+        if metric not in _METRICS and not match:
+            raise ValueError("unknown metric {} in rule {}".format(metric, name))
+        if op not in _OPERATORS:
+            raise ValueError("unknown operator {} in rule {}".format(op, name))
+        self.name = name
+        self.metric = metric
+        self.node = node
+        self.op = op
+        self.threshold = threshold
+        self.duration = duration
+        self.text = text or name
+        # Percentile checked, min and max are the 0th and 100th
+        self.rank = None
+        if match:
+            self.rank = float(match.group(1))
+            if self.rank > 100:
+                raise ValueError("invalid percentile in rule {}".format(name))
+        elif metric == "min":
+            self.rank = 0.0
+        elif metric == "max":
+            self.rank = 100.0
+
+    def matches(self, node: str) -> bool:
+        if self.node.endswith("*"):
+            return node is not None and node.startswith(self.node[:-1])
+        return node == self.node
+
+    def sample(self, window, length: float) -> tuple:
+        """Numerator and denominator contributed by one window.
+
+        :param window: `WindowStats` of a node
+        :param length: length of the window in seconds
+        :return: numerator and denominator
+        """
+        if self.rank is not None:
+            # Accumulated in the histogram of the sliding window
+            return window, window.count
+        if self.metric == "count":
+            return window.count, 1
+        if self.metric == "errors":
+            return window.errors, 1
+        if self.metric == "rate":
+            return window.count, length
+        if self.metric == "error_rate":
+            return window.errors, window.count
+        return window.total, window.count
+
+    def accumulator(self) -> "_Sliding":
+        """New accumulator of the sliding window of a node."""
+        return _Sliding(histogram=self.rank is not None)
+
+    def check(self, state: "_Sliding") -> tuple:
+        """If the alert fires for accumulated values.
+
+        :param state: accumulator of the sliding window
+        :return: if the alert fires and the value of the metric
+        """
+        if not state.denominator:
+            return False, None
+        if self.metric == "min":
+            value = min(_[1].min for _ in state.entries if _[1].count)
+        elif self.metric == "max":
+            value = max(_[1].max for _ in state.entries if _[1].count)
+        elif self.rank is not None:
+            value = state.histogram.percentiles(self.rank)[0]
+        elif self.metric in ("count", "errors"):
+            value = state.numerator
+        else:
+            value = state.numerator / state.denominator
+        return _OPERATORS[self.op](value, self.threshold), value
+
+
+def parse_rule(name: str, text: str) -> Rule:
+    """Parse a rule declared in the configuration.
+
+    :param name: name of the rule
+    :param text: declaration of the rule
+    :return: parsed rule
+    """
+    match = _RULE.match(text)
+    if not match:
+        raise ValueError("invalid alert rule {}: {}".format(name, text))
+    metric = match.group("metric")
+    unit = match.group("unit")
+    if unit == "%" and metric != "error_rate":
+        raise ValueError("% is only valid for error_rate in rule {}".format(name))
+    if (
+        unit in ("s", "ms", "us")
+        and metric not in _DURATION_METRICS
+        and not _PERCENTILE.match(metric)
+    ):
+        raise ValueError("{} is only valid for durations in rule {}".format(unit, name))
+    return Rule(
+        name,
+        metric=metric,
+        node=match.group("node"),
+        op=match.group("op"),
+        threshold=float(match.group("threshold")) * _UNITS[unit],
+        duration=float(match.group("duration") or 0.0)
+        * _UNITS[match.group("duration_unit")],
+        text=text.strip(),
+    )
+
+
+class _Sliding:
+    """Sums of numerators and denominators over a sliding window.
+
+    With `histogram`, numerators are `WindowStats` whose histograms are
+    merged in `histogram`.
+    """
+
+    __slots__ = ("entries", "numerator", "denominator", "histogram", "firing")
+
+    def __init__(self, *, histogram: bool = False):
+        self.entries = collections.deque()
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.histogram = Histogram() if histogram else None
+        self.firing = False
+
+    def add(self, start: float, numerator, denominator: float):
+        self.entries.append((start, numerator, denominator))
+        if self.histogram is not None:
+            self.histogram.merge(numerator.histogram)
+        else:
+            self.numerator += numerator
+        self.denominator += denominator
+
+    def expire(self, since: float):
+        """Remove entries of windows started before a time."""
+        entries = self.entries
+        while entries and entries[0][0] < since:
+            _, numerator, denominator = entries.popleft()
+            if self.histogram is not None:
+                self.histogram.subtract(numerator.histogram)
+            else:
+                self.numerator -= numerator
+            self.denominator -= denominator
+        if not entries:
+            # Don't accumulate rounding errors
+            self.numerator = 0.0
+            self.denominator = 0.0
+
+
+class AlertEvaluator:
+    """Evaluate alert rules on each closed window.
+
+    :param rules: list of `Rule`
+    """
+
+    def __init__(self, rules: list = None):
+        self.rules = list(rules or [])
+        # Accumulators of each rule, by node
+        self._state = {_.name: {} for _ in self.rules}
+
+    @classmethod
+    def from_config(cls, section: dict) -> "AlertEvaluator":
+        """Parse rules of the `[alerts]` section.
+
+        :param section: dict of rule name to declaration
+        """
+        return cls([parse_rule(k, v) for k, v in section.items() if v])
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def active(self) -> list:
+        """Alerts currently firing, as messages for dashboards."""
+        return [
+            _message(rule, node, FIRING, None, None)
+            for rule in self.rules
+            for node, state in self._state[rule.name].items()
+            if state.firing
+        ]
+
+    def evaluate(self, start: float, windows: list, length: float) -> list:
+        """Update rules with a closed window.
+
+        :param start: start time of the window
+        :param windows: `WindowStats` of nodes with calls in the window
+        :param length: length of the window in seconds
+        :return: messages of alerts that fired or resolved
+        """
+        result = []
+        for rule in self.rules:
+            nodes = self._state[rule.name]
+            for window in windows:
+                if rule.matches(window.node):
+                    state = nodes.get(window.node, None)
+                    if state is None:
+                        state = nodes[window.node] = rule.accumulator()
+                    state.add(start, *rule.sample(window, length))
+            if rule.metric in _COUNT_METRICS:
+                # A node without calls counts as zero, so throughput
+                # drops are detected
+                for node, state in nodes.items():
+                    if not state.entries or state.entries[-1][0] != start:
+                        state.add(start, 0, 1 if rule.metric != "rate" else length)
+            # Keep windows started in the last `duration` seconds
+            since = start - max(rule.duration, length) + length / 2.0
+            for node, state in list(nodes.items()):
+                state.expire(since)
+                firing, value = rule.check(state)
+                if firing != state.firing:
+                    state.firing = firing
+                    if firing:
+                        logger.warning(
+                            "Alert {} firing for {}: {} (value {})".format(
+                                rule.name, node, rule.text, value
+                            )
+                        )
+                    else:
+                        logger.info("Alert {} resolved for {}".format(rule.name, node))
+                    result.append(
+                        _message(
+                            rule, node, FIRING if firing else RESOLVED, start, value
+                        )
+                    )
+                if not state.entries and not state.firing:
+                    del nodes[node]
+        return result
+
+
+def _message(rule, node, status, start, value) -> dict:
+    return {
+        "type": "alert",
+        "rule": rule.name,
+        "text": rule.text,
+        "node": node,
+        "status": status,
+        "time": start,
+        "value": value,
+    }
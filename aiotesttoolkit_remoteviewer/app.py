@@ -1,9 +1,19 @@
+import functools
+import hmac
 import json
-from aiohttp import web
+import logging
+import struct
+import sys
+from aiohttp import web, WSMsgType, HttpVersion11
 import aiohttp_cors
 import aiohttp_jinja2
 import jinja2
 from typing import Callable, Any, List
+from aiotesttoolkit_remoteviewer import protocol
+from aiotesttoolkit_remoteviewer.aggregation import decode_partial_async
+from aiotesttoolkit_remoteviewer.assets import Asset, AssetStore
+
+logger = logging.getLogger("remoteviewer.app")
 
 
 def validate_required_params(_fun=None, *, names):
@@ -46,17 +56,486 @@ def validate_required_params(_fun=None, *, names):
     return wrapper if not _fun else wrapper(_fun)
 
 
-def IndexView() -> web.View:
+# Fingerprinted urls never change content
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Other urls are revalidated with their ETag
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def asset_response(request: web.Request, asset, *, cache_control: str):
+    """Serve the best representation of an `assets.Asset`.
+
+    :param request: received request
+    :param asset: asset to serve
+    :param cache_control: value of the `Cache-Control` header
+    :return: response, `304 Not Modified` if the client has it already
+    """
+    encoding, body, etag = asset.select(request.headers.get("Accept-Encoding", ""))
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if etag in (_.strip() for _ in request.headers.get("If-None-Match", "").split(",")):
+        return web.Response(status=304, headers=headers)
+    content_type = asset.content_type
+    if content_type.startswith("text/") or content_type.endswith("javascript"):
+        content_type += "; charset=utf-8"
+    headers["Content-Type"] = content_type
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return web.Response(body=body, headers=headers)
+
+
+def IndexView(*, base_url: str, assets) -> web.View:
+    """Dashboard page, rendered once then served like an asset.
+
+    :param base_url: base url of the application
+    :param assets: `assets.AssetStore` of static files
+    """
+    cache = []
+
+    class Wrapper(web.View):
+        async def get(self, **_):
+            if not cache:
+                text = aiohttp_jinja2.render_string(
+                    "index.html",
+                    self.request,
+                    {
+                        "base_url": base_url,
+                        "static": functools.partial(assets.url, base_url + "static/"),
+                    },
+                )
+                cache.append(
+                    Asset(text.encode("utf-8"), content_type="text/html")
+                )
+            return asset_response(
+                self.request, cache[0], cache_control=REVALIDATE_CACHE_CONTROL
+            )
+
+    return Wrapper
+
+
+def StaticView(*, assets) -> web.View:
+    """Files of the static directory.
+
+    Urls with the `v` query parameter built by `assets.AssetStore.url`
+    are cached forever, as long as they match the current content.
+
+    :param assets: `assets.AssetStore` of static files
+    """
+
+    class Wrapper(web.View, aiohttp_cors.CorsViewMixin):
+        async def get(self, **_):
+            asset = assets.get(self.request.match_info["path"])
+            if asset is None:
+                raise web.HTTPNotFound()
+            if self.request.rel_url.query.get("v", None) == asset.digest:
+                cache_control = IMMUTABLE_CACHE_CONTROL
+            else:
+                cache_control = REVALIDATE_CACHE_CONTROL
+            return asset_response(self.request, asset, cache_control=cache_control)
+
+    return Wrapper
+
+
+def WebSocketView(*, clients, heartbeat: float = None) -> web.View:
+    """Live stream of stats for dashboards.
+
+    :param clients: a `ConnectionRegistry`
+    :param heartbeat: seconds between keepalive pings
+    """
+
+    class Wrapper(web.View):
+        async def get(self, **_):
+            ws = web.WebSocketResponse(
+                protocols=protocol.SUBPROTOCOLS, heartbeat=heartbeat
+            )
+            await ws.prepare(self.request)
+            await clients.handle(ws)
+            return ws
+
+    return Wrapper
+
+
+def EventStreamView(*, stream) -> web.View:
+    """Server-Sent Events for passive dashboards.
+
+    :param stream: a `sse.EventStream`
+    """
+
     class Wrapper(web.View):
-        @aiohttp_jinja2.template('index.html')
         async def get(self, **_):
-            return {}
+            response = web.StreamResponse(
+                headers={
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                    # Don't let reverse proxies buffer events
+                    "X-Accel-Buffering": "no",
+                }
+            )
+            chunked = self.request.version >= HttpVersion11
+            if chunked:
+                response.enable_chunked_encoding()
+            await response.prepare(self.request)
+            await response.write(stream.snapshot())
+            # Events are framed by the stream and written to the transport
+            await stream.handle(self.request.transport, chunked=chunked)
+            return response
+
+    return Wrapper
+
+
+def RelayView(
+    *, handle_partial, heartbeat: float = None, token: str = None
+) -> web.View:
+    """Partial windows sent by child viewers in relay mode.
+
+    Big partials are decoded in a thread. With a `token`, child viewers
+    must send it as `Authorization: Bearer <token>`.
+
+    :param handle_partial: coroutine function receiving the partial
+                           `WindowStats` and other stats
+    :param heartbeat: seconds between keepalive pings
+    :param token: token shared with child viewers
+    """
+
+    class Wrapper(web.View):
+        async def get(self, **_):
+            if token and not hmac.compare_digest(
+                self.request.headers.get("Authorization", "").encode("utf-8"),
+                "Bearer {}".format(token).encode("utf-8"),
+            ):
+                logger.warning("Refused relay from {}".format(self.request.remote))
+                raise web.HTTPUnauthorized(reason="invalid relay token")
+            ws = web.WebSocketResponse(heartbeat=heartbeat)
+            await ws.prepare(self.request)
+            logger.info("Relay connected from {}".format(self.request.remote))
+            async for message in ws:
+                if message.type not in (WSMsgType.TEXT, WSMsgType.BINARY):
+                    continue
+                try:
+                    await handle_partial(*await decode_partial_async(message.data))
+                except Exception:
+                    logger.exception("Failed to handle relayed partial")
+            logger.info("Relay disconnected from {}".format(self.request.remote))
+            return ws
+
+    return Wrapper
+
+
+SERIES_FORMATS = ("json", "csv", "columnar")
+COLUMNAR_MAGIC = b"RVCOL01\n"
+_COLUMNAR_BATCH = struct.Struct("<I")
+
+
+def SeriesListView(*, store) -> web.View:
+    """List metrics kept in a `TimeSeriesStore`.
+
+    :param store: a `TimeSeriesStore`
+    """
+
+    class Wrapper(web.View):
+        async def get(self, **_):
+            return web.json_response({"metrics": store.metrics()})
+
+    return Wrapper
+
+
+def _float_param(query, name):
+    if name not in query:
+        return None
+    try:
+        return float(query[name])
+    except ValueError:
+        raise web.HTTPBadRequest(reason="{} parameter must be a number".format(name))
+
+
+def _columns(times, values, size):
+    for i in range(0, len(times), size):
+        yield times[i : i + size], values[i : i + size]
+
+
+async def _write_json(response, metric, chunks):
+    head = '{{"metric": {}, "points": ['.format(json.dumps(metric))
+    await response.write(head.encode("utf-8"))
+    sep = ""
+    for times, values in chunks:
+        body = ",".join("[{!r},{!r}]".format(*_) for _ in zip(times, values))
+        await response.write((sep + body).encode("utf-8"))
+        sep = ","
+    await response.write(b"]}")
+
+
+async def _write_csv(response, metric, chunks):
+    await response.write(b"t,v\n")
+    for times, values in chunks:
+        body = "".join("{!r},{!r}\n".format(*_) for _ in zip(times, values))
+        await response.write(body.encode("utf-8"))
+
+
+async def _write_columnar(response, metric, chunks):
+    # Batches of little-endian float64 columns, ended by an empty batch
+    await response.write(COLUMNAR_MAGIC)
+    for times, values in chunks:
+        if sys.byteorder != "little":
+            times.byteswap()
+            values.byteswap()
+        await response.write(_COLUMNAR_BATCH.pack(len(times)))
+        await response.write(times.tobytes())
+        await response.write(values.tobytes())
+    await response.write(_COLUMNAR_BATCH.pack(0))
+
+
+_SERIES_WRITERS = {
+    "json": ("application/json", _write_json),
+    "csv": ("text/csv", _write_csv),
+    "columnar": ("application/octet-stream", _write_columnar),
+}
+
+
+def SeriesView(*, store, chunk_size: int = 8192) -> web.View:
+    """Query a metric kept in a `TimeSeriesStore`.
+
+    Query parameters are `since` and `until` timestamps, a `step` in
+    seconds to average samples per step and the `format` of the body,
+    one of `SERIES_FORMATS`. The body is streamed by chunks of samples
+    so exporting a whole run doesn't build it in memory.
+
+    :param store: a `TimeSeriesStore`
+    :param chunk_size: max number of samples per chunk
+    """
+
+    class Wrapper(web.View):
+        async def get(self, **_):
+            metric = self.request.match_info["metric"]
+            if metric not in store:
+                raise web.HTTPNotFound(reason="unknown metric {}".format(metric))
+            query = self.request.rel_url.query
+            since = _float_param(query, "since")
+            until = _float_param(query, "until")
+            step = _float_param(query, "step")
+            fmt = query.get("format", "json")
+            if fmt not in _SERIES_WRITERS:
+                raise web.HTTPBadRequest(
+                    reason="format must be one of {}".format(
+                        ", ".join(SERIES_FORMATS)
+                    )
+                )
+            if step is not None and step <= 0:
+                raise web.HTTPBadRequest(reason="step parameter must be positive")
+
+            series = store[metric]
+            if step:
+                # Steps are aligned on multiples of step when since is not set
+                chunks = _columns(
+                    *series.downsample(since or 0.0, until, step), chunk_size
+                )
+            else:
+                chunks = series.chunks(since, until, chunk_size)
+
+            content_type, write = _SERIES_WRITERS[fmt]
+            response = web.StreamResponse()
+            response.content_type = content_type
+            response.enable_chunked_encoding()
+            await response.prepare(self.request)
+            await write(response, metric, chunks)
+            await response.write_eof()
+            return response
+
+    return Wrapper
+
+
+# Bounds of viewport queries of the timeline
+TIMELINE_MAX_WIDTH = 4000
+TIMELINE_MAX_ROWS = 500
+TIMELINE_MAX_LIMIT = 100000
+
+
+def _int_param(query, name, default, maximum):
+    value = _float_param(query, name)
+    if value is None:
+        return default
+    if value < 0 or value != int(value):
+        raise web.HTTPBadRequest(
+            reason="{} parameter must be a positive integer".format(name)
+        )
+    return min(int(value), maximum)
+
+
+def TimelineView(*, timeline) -> web.View:
+    """Query a viewport of a `SpanIndex`.
+
+    Query parameters are `since` and `until` timestamps, the `width` of
+    the viewport in pixels, the `first` lane shown and the number of
+    `rows`. `since` defaults to `length` seconds before `until`, that
+    defaults to the end of the last span. The response has a bounded
+    number of spans or buckets, see `SpanIndex.query`.
+
+    :param timeline: a `SpanIndex`
+    """
+
+    class Wrapper(web.View):
+        async def get(self, **_):
+            query = self.request.rel_url.query
+            until = _float_param(query, "until")
+            if until is None:
+                until = timeline.last or 0.0
+            since = _float_param(query, "since")
+            if since is None:
+                since = until - (_float_param(query, "length") or 60.0)
+            if until <= since:
+                raise web.HTTPBadRequest(reason="until must be after since")
+            width = _int_param(query, "width", 1000, TIMELINE_MAX_WIDTH)
+            rows = _int_param(query, "rows", 50, TIMELINE_MAX_ROWS)
+            limit = _int_param(query, "limit", 20000, TIMELINE_MAX_LIMIT)
+            if not width or not rows or not limit:
+                raise web.HTTPBadRequest(
+                    reason="width, rows and limit parameters must be positive"
+                )
+            result = timeline.query(
+                since,
+                until,
+                width=width,
+                first=_int_param(query, "first", 0, sys.maxsize),
+                rows=rows,
+                limit=limit,
+            )
+            result["total_lanes"] = len(timeline.lane_names)
+            return web.json_response(result)
+
+    return Wrapper
+
+
+def RunListView(*, runs, snapshot) -> web.View:
+    """Saved runs, and snapshots of the current run.
+
+    `GET` lists runs having all the `tag` query parameters. `POST` saves
+    the current run, with an optional JSON body of its `id`, `tags`,
+    `config` and if a new run starts once saved with `reset`.
+
+    :param runs: a `RunIndex`
+    :param snapshot: function saving the current run, see
+                     `Pipeline.snapshot_run`
+    """
+
+    class Wrapper(web.View):
+        async def get(self, **_):
+            tags = self.request.rel_url.query.getall("tag", [])
+            return web.json_response({"runs": runs.list(tags=tags)})
+
+        async def post(self, **_):
+            data = {}
+            if self.request.body_exists:
+                try:
+                    data = await self.request.json()
+                except ValueError:
+                    raise web.HTTPBadRequest(reason="body must be a JSON object")
+                if not isinstance(data, dict):
+                    raise web.HTTPBadRequest(reason="body must be a JSON object")
+            run_id = data.get("id", None)
+            if run_id is not None and not isinstance(run_id, str):
+                raise web.HTTPBadRequest(reason="id must be a string")
+            tags = data.get("tags", None) or []
+            if isinstance(tags, str):
+                tags = [tags]
+            if not isinstance(tags, list) or not all(isinstance(_, str) for _ in tags):
+                raise web.HTTPBadRequest(reason="tags must be strings")
+            config = data.get("config", None)
+            if config is not None and not isinstance(config, dict):
+                raise web.HTTPBadRequest(reason="config must be a JSON object")
+            try:
+                entry = snapshot(
+                    run_id=run_id,
+                    tags=tags,
+                    config=config,
+                    reset=bool(data.get("reset", False)),
+                )
+            except ValueError as e:
+                raise web.HTTPBadRequest(reason=str(e))
+            return web.json_response(entry, status=201)
+
+    return Wrapper
+
+
+def RunView(*, runs) -> web.View:
+    """Summary of a saved run.
+
+    :param runs: a `RunIndex`
+    """
+
+    class Wrapper(web.View):
+        async def get(self, **_):
+            run_id = self.request.match_info["run"]
+            try:
+                summary = runs.load(run_id)
+            except KeyError:
+                raise web.HTTPNotFound(reason="unknown run {}".format(run_id))
+            result = summary.to_dict()
+            result["id"] = run_id
+            return web.json_response(result)
+
+    return Wrapper
+
+
+def RunCompareView(*, runs) -> web.View:
+    """Compare a `run` to a `base` run node by node.
+
+    The optional `alpha` query parameter is the significance level of
+    the t-tests, see `runs.compare`.
+
+    :param runs: a `RunIndex`
+    """
+
+    class Wrapper(web.View):
+        @validate_required_params(names=["base", "run"])
+        async def get(self, *, required_params, **_):
+            alpha = _float_param(self.request.rel_url.query, "alpha")
+            if alpha is None:
+                alpha = 0.05
+            if not 0 < alpha < 1:
+                raise web.HTTPBadRequest(reason="alpha must be between 0 and 1")
+            try:
+                result = runs.compare(
+                    required_params["base"], required_params["run"], alpha=alpha
+                )
+            except KeyError as e:
+                raise web.HTTPNotFound(reason="unknown run {}".format(e.args[0]))
+            return web.json_response(result)
+
+    return Wrapper
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def MetricsView(*, monitor) -> web.View:
+    class Wrapper(web.View):
+        async def get(self):
+            return web.Response(
+                body=monitor.render().encode("utf-8"),
+                headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+            )
 
     return Wrapper
 
 
 def Application(
-    *args, jinja2_templates_dir: str, static_dir:str, base_url: str = None, **kwargs
+    *args,
+    jinja2_templates_dir: str,
+    static_dir: str,
+    base_url: str = None,
+    clients=None,
+    events=None,
+    heartbeat: float = None,
+    store=None,
+    timeline=None,
+    monitor=None,
+    relay=None,
+    relay_token: str = None,
+    runs=None,
+    snapshot_run=None,
+    **kwargs
 ):
     app = web.Application(*args, **kwargs)
 
@@ -77,8 +556,53 @@ def Application(
         )
     })
     
-    cors.add(app.router.add_static(base_url + "static", static_dir))
+    assets = AssetStore(static_dir)
+    cors.add(
+        app.router.add_view(base_url + "static/{path:.+}", StaticView(assets=assets))
+    )
+
+    app.router.add_view(base_url, IndexView(base_url=base_url, assets=assets))
+    if clients is not None:
+        app.router.add_view(
+            base_url + "ws", WebSocketView(clients=clients, heartbeat=heartbeat)
+        )
+
+        async def on_shutdown(app):
+            await clients.close()
+
+        app.on_shutdown.append(on_shutdown)
+    if events is not None:
+        app.router.add_view(base_url + "events", EventStreamView(stream=events))
 
-    app.router.add_view(base_url, IndexView())
+        async def on_shutdown_events(app):
+            events.close()
+
+        app.on_shutdown.append(on_shutdown_events)
+    if store is not None:
+        app.router.add_view(base_url + "api/series", SeriesListView(store=store))
+        app.router.add_view(
+            base_url + "api/series/{metric}", SeriesView(store=store)
+        )
+    if timeline is not None:
+        app.router.add_view(
+            base_url + "api/timeline", TimelineView(timeline=timeline)
+        )
+    if runs is not None:
+        app.router.add_view(
+            base_url + "api/runs",
+            RunListView(runs=runs, snapshot=snapshot_run)
+        )
+        # Before api/runs/{run}, that would match it
+        app.router.add_view(
+            base_url + "api/runs/compare", RunCompareView(runs=runs)
+        )
+        app.router.add_view(base_url + "api/runs/{run}", RunView(runs=runs))
+    if relay is not None:
+        app.router.add_view(
+            base_url + "relay",
+            RelayView(handle_partial=relay, heartbeat=heartbeat, token=relay_token)
+        )
+    if monitor is not None:
+        app.router.add_view(base_url + "metrics", MetricsView(monitor=monitor))
 
     return app
@@ -0,0 +1,153 @@
+"""Static assets precompressed and fingerprinted at startup.
+
+All files of the static directory are read once. Compressible ones get a
+gzip variant, and a brotli one when the `brotli` package is installed,
+so serving them costs no CPU. Each asset has a digest of its content,
+used both as a strong ETag and to build fingerprinted urls that can be
+cached forever by browsers.
+"""
+
+__all__ = ["ENCODINGS", "Asset", "AssetStore", "accepted_encodings"]
+import gzip
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger("remoteviewer.assets")
+
+# Supported content encodings, by order of preference
+ENCODINGS = ("br", "gzip")
+# Smaller files are not worth compressing
+_MIN_COMPRESS_SIZE = 256
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg")
+
+
+def _gzip(data: bytes) -> bytes:
+    # Fixed mtime so the output only depends on the content
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+def accepted_encodings(header: str) -> set:
+    """Content encodings accepted by a client.
+
+    :param header: value of the `Accept-Encoding` header
+    :return: set of encodings with a non-zero quality
+    """
+    result = set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if not name or quality <= 0:
+            continue
+        if name == "*":
+            result.update(ENCODINGS)
+        else:
+            result.add(name)
+    return result
+
+
+class Asset:
+    """Content of a file with its compressed variants.
+
+    :param data: content
+    :param content_type: mime type of the content
+    """
+
+    __slots__ = ("content_type", "digest", "variants")
+
+    def __init__(self, data: bytes, *, content_type: str):
+        self.content_type = content_type
+        self.digest = hashlib.sha256(data).hexdigest()[:20]
+        # Encoding to content and its strong ETag, that must differ
+        # between representations
+        self.variants = {None: (data, '"{}"'.format(self.digest))}
+        if len(data) < _MIN_COMPRESS_SIZE or not content_type.startswith(_COMPRESSIBLE):
+            return
+        compressors = {"gzip": _gzip}
+        if brotli is not None:
+            compressors["br"] = brotli.compress
+        for encoding, compress in compressors.items():
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                self.variants[encoding] = (
+                    compressed,
+                    '"{}-{}"'.format(self.digest, encoding),
+                )
+
+    def select(self, accept_encoding: str) -> tuple:
+        """Best representation for a client.
+
+        :param accept_encoding: value of the `Accept-Encoding` header
+        :return: encoding or `None`, content and ETag
+        """
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                return (encoding,) + self.variants[encoding]
+        return (None,) + self.variants[None]
+
+
+class AssetStore:
+    """All files of a directory, loaded in memory.
+
+    :param directory: static directory
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._assets = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    self._assets[key] = Asset(
+                        f.read(),
+                        content_type=mimetypes.guess_type(name)[0]
+                        or "application/octet-stream",
+                    )
+        logger.info(
+            "Loaded {} static assets from {}".format(len(self._assets), directory)
+        )
+
+    def __contains__(self, path):
+        return path in self._assets
+
+    def __getitem__(self, path) -> Asset:
+        return self._assets[path]
+
+    def get(self, path: str) -> Asset:
+        """Asset at a path relative to the directory, or `None`."""
+        return self._assets.get(path, None)
+
+    def url(self, base_url: str, path: str) -> str:
+        """Fingerprinted url of an asset.
+
+        The url changes when the content changes, so it can be cached
+        forever.
+
+        :param base_url: url of the static route, ending with `/`
+        :param path: path relative to the directory
+        :return: url
+        """
+        asset = self._assets.get(path, None)
+        if asset is None:
+            return base_url + path
+        return "{}{}?v={}".format(base_url, path, asset.digest)
@@ -0,0 +1,192 @@
+__all__ = ["DROP_OLDEST", "COALESCE", "POLICIES", "ClientQueue", "Broadcaster"]
+import asyncio
+import collections
+import logging
+import time
+from aiotesttoolkit_remoteviewer import codec as _codec
+from aiotesttoolkit_remoteviewer import protocol
+from aiotesttoolkit_remoteviewer import stats
+from aiotesttoolkit_remoteviewer.subscriptions import SubscriptionIndex
+
+logger = logging.getLogger("remoteviewer.broadcast")
+
+DROP_OLDEST = "drop-oldest"
+COALESCE = "coalesce"
+POLICIES = (DROP_OLDEST, COALESCE)
+
+
+class ClientQueue:
+    """Bounded queue of messages waiting to be sent to one client.
+
+    Putting a message never blocks. When the queue is full, the policy
+    decides which message is lost:
+
+    - `DROP_OLDEST`: the oldest pending message is dropped.
+    - `COALESCE`: a pending message with the same key is replaced by the
+      new one, keeping its position. If there is none, the oldest pending
+      message is dropped.
+
+    The time messages spend waiting is accumulated in `delay`, with the
+    number of messages taken in `delivered`.
+
+    :param maxsize: max number of pending messages
+    :param policy: `DROP_OLDEST` or `COALESCE`
+    """
+
+    def __init__(self, *, maxsize: int = 1000, policy: str = DROP_OLDEST):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        if policy not in POLICIES:
+            raise ValueError("unknown policy {}".format(policy))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.delivered = 0
+        self.delay = 0.0
+        # Pending messages, keyed by coalescing key or a unique sequence
+        self._pending = collections.OrderedDict()
+        # Time each slot was filled, in the same order
+        self._enqueued = collections.OrderedDict()
+        self._seq = 0
+        self._waiter = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, data, *, key=None):
+        """Enqueue a message without blocking.
+
+        :param data: encoded message
+        :param key: coalescing key or `None`
+        """
+        if key is not None and self.policy == COALESCE:
+            slot = ("k", key)
+            if slot in self._pending:
+                # Replace in place so the message keeps its turn
+                self._pending[slot] = data
+                self.dropped += 1
+                return
+        else:
+            self._seq += 1
+            slot = ("s", self._seq)
+        if len(self._pending) >= self.maxsize:
+            self._pending.popitem(last=False)
+            self._enqueued.popitem(last=False)
+            self.dropped += 1
+        self._pending[slot] = data
+        self._enqueued[slot] = time.monotonic()
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self):
+        """Wait for and return the next pending message.
+
+        :return: encoded message
+        """
+        while not self._pending:
+            self._waiter = asyncio.get_event_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        slot, data = self._pending.popitem(last=False)
+        self.delay += time.monotonic() - self._enqueued.pop(slot)
+        self.delivered += 1
+        return data
+
+
+class Broadcaster:
+    """Fan out messages to all connected clients.
+
+    Each message is serialized once per protocol and the same data is
+    handed to every client's `ClientQueue`. Publishing never waits for
+    clients, so a slow consumer only loses its own messages and doesn't
+    delay other consumers or the ingest path.
+
+    Messages are only sent to clients subscribed to them. New clients
+    are subscribed to everything until they send a subscription. They
+    are also passed to each stream of `streams`, such as a
+    `sse.EventStream`, that batches them for passive dashboards.
+
+    :param clients: a `ConnectionRegistry`
+    :param codec: name of the JSON codec, see `codec`
+    """
+
+    def __init__(self, clients, *, codec: str = _codec.AUTO):
+        self.clients = clients
+        self.codec = _codec.get(codec)
+        self.subscriptions = SubscriptionIndex()
+        self.encoder = protocol.Encoder()
+        self.published = 0
+        # Time spent serializing messages in `publish`
+        self.encode_time = 0.0
+        self.encoded = 0
+        self.streams = []
+        clients.on_connect.append(self.subscribe)
+        clients.on_disconnect.append(self.subscriptions.unsubscribe)
+
+    def subscribe(self, client, **patterns):
+        """Replace the subscription of a client.
+
+        See `SubscriptionIndex.subscribe` for patterns.
+
+        :param client: subscribed `Client`
+        """
+        self.subscriptions.subscribe(client, **patterns)
+
+    def encode(self, message) -> str:
+        """Serialize a message once for all clients.
+
+        :param message: JSON serializable message or `stats.StatRecord`
+        :return: encoded message
+        """
+        if isinstance(message, stats.StatRecord):
+            message = message.to_dict()
+        # Text frames are sent as `str`
+        return self.codec.dumps(message).decode("utf-8")
+
+    def encode_for(self, client, message):
+        """Serialize a message for a single client.
+
+        :param client: destination `Client`
+        :param message: JSON serializable message
+        :return: encoded message
+        """
+        if client.binary:
+            frame = self.encoder.encode(message)
+            if frame is not None:
+                return frame
+        return self.encode(message)
+
+    def publish(self, message, *, key=None, slave=None, node=None, metric=None):
+        """Broadcast a message to subscribed clients.
+
+        :param message: JSON serializable message
+        :param key: coalescing key or `None`
+        :param slave: slave that produced the message, if any
+        :param node: scenario node of the message, if any
+        :param metric: metric kind of the message, if any
+        """
+        text = None
+        frame = None
+        framed = False
+        for client in self.subscriptions.match(slave=slave, node=node, metric=metric):
+            if client.binary:
+                if not framed:
+                    start = time.perf_counter()
+                    frame = self.encoder.encode(message)
+                    self.encode_time += time.perf_counter() - start
+                    self.encoded += 1
+                    framed = True
+                if frame is not None:
+                    client.queue.put(frame, key=key)
+                    continue
+            if text is None:
+                start = time.perf_counter()
+                text = self.encode(message)
+                self.encode_time += time.perf_counter() - start
+                self.encoded += 1
+            client.queue.put(text, key=key)
+        for stream in self.streams:
+            stream.publish(message, key=key, metric=metric)
+        self.published += 1
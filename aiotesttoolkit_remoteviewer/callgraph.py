@@ -0,0 +1,195 @@
+"""Live call graph of scenario nodes.
+
+Scenarios nest: a node such as `host` calls `create_game`, `match` and
+`disconnect`. The graph has one vertex per scenario node and one edge
+per caller and callee, each with the count and latency of calls since
+the viewer started.
+
+The caller of a call is found in one of two ways:
+
+- Profiled stats can name it in their `parent` key.
+- Bots can report `enter` and `exit` stats, with their `bot` id, when
+  they enter and exit a node. A stack of entered nodes is kept per bot,
+  the caller of a node being the one below it. The duration of the call
+  is the one of the `exit` stat, or the time elapsed since `enter`.
+  Stacks of bots that stopped reporting, that disconnected or whose
+  `exit` stats were lost, are forgotten after `timeout` seconds.
+
+Calls without a known caller are attached to the root of the graph.
+Ingest workers aggregate those in partial windows, that are merged as
+calls of the root, and pass the other stats through to the main process.
+
+Vertices and edges updated since the last diff are marked dirty, and
+only those are pushed to dashboards.
+"""
+
+__all__ = ["CallGraph"]
+import logging
+import time
+from aiotesttoolkit_remoteviewer import stats
+from aiotesttoolkit_remoteviewer.aggregation import WindowStats
+
+logger = logging.getLogger("remoteviewer.callgraph")
+
+# Deeper stacks come from bots that never exit nodes
+_MAX_DEPTH = 64
+
+
+class CallGraph:
+    """Aggregate calls per scenario node and per caller and callee.
+
+    :param timeout: seconds after which the stack of a bot that didn't
+                    enter or exit a node is forgotten
+    """
+
+    def __init__(self, *, timeout: float = 600.0):
+        if timeout <= 0:
+            raise ValueError("timeout must be positive")
+        self.timeout = timeout
+        # Symbol of node to `WindowStats`
+        self._nodes = {}
+        # Symbols of caller and callee to `WindowStats`
+        self._edges = {}
+        # Slave symbol and bot to list of entered nodes and times
+        self._stacks = {}
+        # Slave symbol and bot to last time the stack changed
+        self._seen = {}
+        self._dirty_nodes = set()
+        self._dirty_edges = set()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add(self, record: stats.StatRecord) -> bool:
+        """Update the graph with a received stat.
+
+        :param record: `stats.StatRecord` of the stat
+        :return: if the stat was a call of a node
+        """
+        kind = stats.SYMBOLS.names[record.kind]
+        if kind == stats.ENTER:
+            self._enter(record)
+            return False
+        parent = record.parent
+        value = record.duration
+        if kind == stats.EXIT:
+            frame = self._exit(record)
+            if frame is None:
+                return False
+            if not parent:
+                parent = frame[0]
+            if value is None:
+                value = max(record.time - frame[1], 0.0)
+        if value is None:
+            return False
+        self._observe(parent, record.node, value, record.error)
+        return True
+
+    def _enter(self, record):
+        key = (record.slave, record.bot)
+        stack = self._stacks.get(key, None)
+        if stack is None:
+            stack = self._stacks[key] = []
+        self._seen[key] = time.time()
+        if len(stack) >= _MAX_DEPTH:
+            logger.debug("Call stack of bot {} is too deep".format(record.bot))
+            del stack[0]
+        stack.append((record.node, record.time))
+
+    def _exit(self, record):
+        """Pop the frame of the exited node.
+
+        :return: caller node and time the node was entered, or `None`
+                 if it was not entered
+        """
+        key = (record.slave, record.bot)
+        stack = self._stacks.get(key, None)
+        if not stack:
+            return None
+        # Frames above the exited node never exited, forget them
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i][0] == record.node:
+                entered = stack[i][1]
+                del stack[i:]
+                break
+        else:
+            return None
+        if not stack:
+            del self._stacks[key]
+            del self._seen[key]
+            return 0, entered
+        self._seen[key] = time.time()
+        return stack[-1][0], entered
+
+    def prune(self, now: float):
+        """Forget stacks of bots that didn't change them for `timeout`.
+
+        :param now: current time
+        """
+        horizon = now - self.timeout
+        stale = [key for key, seen in self._seen.items() if seen < horizon]
+        for key in stale:
+            del self._stacks[key]
+            del self._seen[key]
+        if stale:
+            logger.debug("Forgot call stacks of {} bots".format(len(stale)))
+
+    def merge(self, window: WindowStats):
+        """Merge calls without a caller aggregated by another process.
+
+        :param window: partial window of the calls
+        """
+        node = stats.SYMBOLS.intern(window.node)
+        current = self._nodes.get(node, None)
+        if current is None:
+            current = self._nodes[node] = WindowStats(window.node or None)
+        current.merge(window)
+        self._dirty_nodes.add(node)
+        edge = (0, node)
+        current = self._edges.get(edge, None)
+        if current is None:
+            current = self._edges[edge] = WindowStats(window.node or None)
+        current.merge(window)
+        self._dirty_edges.add(edge)
+
+    def _observe(self, parent: int, node: int, value: float, error: bool):
+        name = stats.SYMBOLS.names[node] or None
+        window = self._nodes.get(node, None)
+        if window is None:
+            window = self._nodes[node] = WindowStats(name)
+        window.add(value, error=error)
+        self._dirty_nodes.add(node)
+        edge = (parent, node)
+        window = self._edges.get(edge, None)
+        if window is None:
+            window = self._edges[edge] = WindowStats(name)
+        window.add(value, error=error)
+        self._dirty_edges.add(edge)
+
+    def _message(self, nodes, edges) -> dict:
+        result_edges = []
+        for edge in edges:
+            summary = self._edges[edge].summary()
+            summary["parent"] = stats.SYMBOLS.names[edge[0]] or None
+            result_edges.append(summary)
+        return {
+            "type": "callgraph",
+            "nodes": [self._nodes[_].summary() for _ in nodes],
+            "edges": result_edges,
+        }
+
+    def diff(self) -> dict:
+        """Vertices and edges updated since the last diff.
+
+        :return: message for dashboards, or `None` if nothing changed
+        """
+        if not self._dirty_nodes and not self._dirty_edges:
+            return None
+        result = self._message(self._dirty_nodes, self._dirty_edges)
+        self._dirty_nodes = set()
+        self._dirty_edges = set()
+        return result
+
+    def snapshot(self) -> dict:
+        """Whole graph, for new dashboards."""
+        return self._message(self._nodes, self._edges)
@@ -0,0 +1,175 @@
+"""Estimate clocks of slaves from arrival times of their stats.
+
+Stats are timestamped with the clock of the host of each slave. The
+reporting protocol has no request/response exchange to measure round
+trips, so offsets are estimated from arrival times: for a stat produced
+at `time` on the slave and received at `arrival` on the viewer,
+
+    arrival - time = offset + delay
+
+where `delay` is the time taken to send it, never negative. The
+smallest difference over a few seconds is the least delayed, so the
+minimum of each bucket of arrival time is kept. A line fitted through
+the minima of the last buckets gives the offset and its drift, and the
+dispersion of minima around the line gives the uncertainty.
+
+The minimum delay itself can't be measured this way and is included in
+the offset. It is the same for all stats of a slave, so corrected
+timestamps of a slave stay consistent with each other and with other
+slaves on the same network.
+
+Corrected timestamps place stats on the timeline and in time series.
+Window summaries don't use them: stats are folded into the window they
+arrive in.
+"""
+
+__all__ = ["SlaveClock", "ClockEstimator"]
+import collections
+import logging
+import math
+
+logger = logging.getLogger("remoteviewer.clock")
+
+
+class SlaveClock:
+    """Offset and drift of the clock of one slave.
+
+    :param bucket: seconds of arrival time per minimum
+    :param buckets: number of minima the line is fitted on
+    """
+
+    __slots__ = (
+        "bucket",
+        "samples",
+        "offset",
+        "drift",
+        "uncertainty",
+        "_minima",
+        "_current",
+        "_reference",
+    )
+
+    def __init__(self, *, bucket: float = 5.0, buckets: int = 24):
+        if bucket <= 0:
+            raise ValueError("bucket must be positive")
+        if buckets < 2:
+            raise ValueError("buckets must be at least 2")
+        self.bucket = bucket
+        self.samples = 0
+        # Offset at the reference time, in seconds
+        self.offset = None
+        # Seconds of offset gained per second
+        self.drift = 0.0
+        self.uncertainty = None
+        # Arrival time and minimum difference of closed buckets
+        self._minima = collections.deque(maxlen=buckets)
+        # Index, arrival time and minimum difference of the open bucket
+        self._current = None
+        self._reference = 0.0
+
+    def observe(self, time: float, arrival: float):
+        """Record a stat.
+
+        :param time: time when the stat was produced, on the slave clock
+        :param arrival: time when it was received, on the viewer clock
+        """
+        self.samples += 1
+        delta = arrival - time
+        index = int(arrival // self.bucket)
+        current = self._current
+        if current is None or index != current[0]:
+            if current is not None:
+                self._minima.append(current[1:])
+            self._current = [index, arrival, delta]
+            self._fit()
+        elif delta < current[2]:
+            current[1] = arrival
+            current[2] = delta
+            if len(self._minima) < 2:
+                # Follow the open bucket until there is a line to fit
+                self._fit()
+
+    def _fit(self):
+        points = list(self._minima)
+        if len(points) < 2 and self._current is not None:
+            points.append(tuple(self._current[1:]))
+        n = len(points)
+        self._reference = points[-1][0]
+        if n < 2:
+            self.offset = points[0][1]
+            self.drift = 0.0
+            self.uncertainty = None
+            return
+        mean_t = sum(_[0] for _ in points) / n - self._reference
+        mean_d = sum(_[1] for _ in points) / n
+        var_t = sum((_[0] - self._reference - mean_t) ** 2 for _ in points)
+        cov = sum((_[0] - self._reference - mean_t) * (_[1] - mean_d) for _ in points)
+        self.drift = cov / var_t if var_t else 0.0
+        self.offset = mean_d - self.drift * mean_t
+        if n > 2:
+            residuals = sum(
+                (_[1] - self.offset - self.drift * (_[0] - self._reference)) ** 2
+                for _ in points
+            )
+            self.uncertainty = math.sqrt(residuals / (n - 2))
+
+    def correct(self, time: float, arrival: float) -> float:
+        """Convert a time of the slave clock to the viewer clock.
+
+        :param time: time on the slave clock
+        :param arrival: time when it was received, on the viewer clock
+        :return: corrected time
+        """
+        if self.offset is None:
+            return time
+        return time + self.offset + self.drift * (arrival - self._reference)
+
+    def summary(self) -> dict:
+        return {
+            "offset": self.offset,
+            "drift": self.drift,
+            "uncertainty": self.uncertainty,
+            "samples": self.samples,
+        }
+
+
+class ClockEstimator:
+    """Estimate clocks of all slaves and correct their timestamps.
+
+    :param bucket: seconds of arrival time per minimum
+    :param buckets: number of minima the line is fitted on
+    """
+
+    def __init__(self, *, bucket: float = 5.0, buckets: int = 24):
+        self.bucket = bucket
+        self.buckets = buckets
+        # Slave name to `SlaveClock`
+        self.slaves = {}
+
+    def __len__(self):
+        return len(self.slaves)
+
+    def correct(self, slave: str, time: float, arrival: float) -> float:
+        """Record a stat of a slave and correct its time.
+
+        :param slave: name of the slave
+        :param time: time when the stat was produced, on the slave clock
+        :param arrival: time when it was received, on the viewer clock
+        :return: corrected time
+        """
+        clock = self.slaves.get(slave, None)
+        if clock is None:
+            clock = self.slaves[slave] = SlaveClock(
+                bucket=self.bucket, buckets=self.buckets
+            )
+        clock.observe(time, arrival)
+        return clock.correct(time, arrival)
+
+    def message(self) -> dict:
+        """Estimated clocks, as a message for dashboards."""
+        slaves = []
+        for name, clock in self.slaves.items():
+            summary = clock.summary()
+            summary["slave"] = name
+            slaves.append(summary)
+        return {"type": "clock", "slaves": slaves}
@@ -0,0 +1,124 @@
+"""Encoding of messages with the fastest installed backend.
+
+- `json`: the standard library, always available.
+- `orjson`: several times faster than `json` and encodes straight to
+  `bytes`, used instead of it when the `orjson` package is installed.
+- `msgpack`: binary and more compact, when the `msgpack` package is
+  installed. It is only used for partial windows sent between viewer
+  processes, by ingest workers and relays, when `orjson` isn't
+  installed or when chosen, to save bandwidth between relays.
+
+Frames sent to dashboards and recordings are always JSON, whichever
+backend encodes them. Partials are recognized by their first byte, so a
+viewer decodes partials of any installed backend.
+"""
+
+__all__ = ["AUTO", "Codec", "CODECS", "get", "detect"]
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+AUTO = "auto"
+# Backends picked by `AUTO`, fastest first
+_TEXT_PREFERENCE = ("orjson", "json")
+# orjson decodes partials faster, msgpack makes them smaller
+_BINARY_PREFERENCE = ("orjson", "msgpack", "json")
+
+
+class Codec:
+    """Encode messages to `bytes` and back.
+
+    :param name: name of the backend
+    :param dumps: function encoding a message to `bytes`
+    :param loads: function decoding `bytes` or `str`
+    :param text: if encoded messages are JSON
+    """
+
+    __slots__ = ("name", "dumps", "loads", "text")
+
+    def __init__(self, name: str, dumps, loads, *, text: bool):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.text = text
+
+    def __repr__(self):
+        return "Codec({!r})".format(self.name)
+
+
+def _json_dumps(message) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_dumps(message) -> bytes:
+    try:
+        return orjson.dumps(message)
+    except TypeError:
+        # Integers over 64 bits, keys that are not strings...
+        return _json_dumps(message)
+
+
+def _msgpack_dumps(message) -> bytes:
+    return msgpack.packb(message, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+# Installed backends by name
+CODECS = {"json": Codec("json", _json_dumps, json.loads, text=True)}
+if orjson is not None:
+    CODECS["orjson"] = Codec("orjson", _orjson_dumps, orjson.loads, text=True)
+if msgpack is not None:
+    CODECS["msgpack"] = Codec("msgpack", _msgpack_dumps, _msgpack_loads, text=False)
+
+
+def get(name: str = AUTO, *, binary: bool = False) -> Codec:
+    """Get a backend.
+
+    :param name: name of the backend, or `AUTO` for the fastest installed
+    :param binary: if messages can be encoded to something else than JSON
+    :return: `Codec`
+    :raises ValueError: if the backend is unknown, not installed, or is
+                        not JSON while `binary` is false
+    """
+    if name == AUTO:
+        for _ in _BINARY_PREFERENCE if binary else _TEXT_PREFERENCE:
+            if _ in CODECS:
+                return CODECS[_]
+    codec = CODECS.get(name, None)
+    if codec is None:
+        raise ValueError(
+            "Codec {} is not installed, choose one of {}".format(
+                name, ", ".join([AUTO] + sorted(CODECS))
+            )
+        )
+    if not binary and not codec.text:
+        raise ValueError("Codec {} doesn't encode to JSON".format(name))
+    return codec
+
+
+def detect(data) -> Codec:
+    """Get the backend able to decode a message.
+
+    JSON is decoded by the fastest JSON backend, whichever encoded it.
+
+    :param data: encoded message
+    :return: `Codec`
+    :raises ValueError: if the message was encoded by a backend that is
+                        not installed
+    """
+    if isinstance(data, str) or data[:1] in (b"{", b"["):
+        return get()
+    if msgpack is None:
+        raise ValueError("Received a message encoded by msgpack, install msgpack")
+    return CODECS["msgpack"]
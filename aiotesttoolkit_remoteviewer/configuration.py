@@ -1,8 +1,80 @@
 DEFAULT_LOGGING_MAXBYTES = 1000000
 DEFAULT_LOGGING_BACKUPCOUNT = 5
+DEFAULT_WEBSOCKET_PING_INTERVAL = 20
+DEFAULT_WEBSOCKET_QUEUE_SIZE = 1000
+DEFAULT_WEBSOCKET_QUEUE_POLICY = "drop-oldest"
+DEFAULT_AGGREGATION_WINDOW = 1.0
+DEFAULT_TIMESERIES_CAPACITY = 100000
+DEFAULT_TIMESERIES_BACKFILL = 300
+DEFAULT_TIMESERIES_BACKFILL_POINTS = 300
+DEFAULT_TIMESERIES_MAX_METRICS = 1000
+DEFAULT_RECORDING_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_RECORDING_FSYNC_INTERVAL = 1.0
+DEFAULT_RELAY_INTERVAL = 0.25
+DEFAULT_RELAY_ACCEPT = False
+DEFAULT_TIMELINE_CAPACITY = 1000000
+DEFAULT_TIMELINE_RETENTION = 3600
+DEFAULT_TIMELINE_BUCKETS = 1024
+DEFAULT_EVENTS_INTERVAL = 1.0
+DEFAULT_EVENTS_MAX_BUFFER = 1024 * 1024
+DEFAULT_EVENTS_METRICS = "window, alert, sampling, clock, callgraph"
+DEFAULT_CLOCK_CORRECT = True
+DEFAULT_CLOCK_BUCKET = 5.0
+DEFAULT_CLOCK_BUCKETS = 24
+DEFAULT_OVERLOAD_QUEUE_SIZE = 10000
+DEFAULT_OVERLOAD_MAX_LAG = 0.1
+DEFAULT_OVERLOAD_MAX_RATIO = 64
+DEFAULT_CODEC_JSON = "auto"
+DEFAULT_CODEC_PARTIAL = "auto"
 DEFAULT_CONFIG = {
     "service": {"port": 8080, "base-url": "/"},
-    "master": {"host": "0.0.0.0", "port": 8081},
+    "master": {"host": "0.0.0.0", "port": 8081, "ingest-workers": 0},
+    "websocket": {
+        "ping-interval": DEFAULT_WEBSOCKET_PING_INTERVAL,
+        "queue-size": DEFAULT_WEBSOCKET_QUEUE_SIZE,
+        "queue-policy": DEFAULT_WEBSOCKET_QUEUE_POLICY,
+    },
+    "aggregation": {"window": DEFAULT_AGGREGATION_WINDOW},
+    "events": {
+        "interval": DEFAULT_EVENTS_INTERVAL,
+        "max-buffer": DEFAULT_EVENTS_MAX_BUFFER,
+        "metrics": DEFAULT_EVENTS_METRICS,
+    },
+    "timeseries": {
+        "capacity": DEFAULT_TIMESERIES_CAPACITY,
+        "backfill": DEFAULT_TIMESERIES_BACKFILL,
+        "backfill-points": DEFAULT_TIMESERIES_BACKFILL_POINTS,
+        "max-metrics": DEFAULT_TIMESERIES_MAX_METRICS,
+    },
+    "recording": {
+        "directory": "",
+        "segment-size": DEFAULT_RECORDING_SEGMENT_SIZE,
+        "fsync-interval": DEFAULT_RECORDING_FSYNC_INTERVAL,
+    },
+    "relay": {
+        "upstream": "",
+        "interval": DEFAULT_RELAY_INTERVAL,
+        "accept": DEFAULT_RELAY_ACCEPT,
+        "token": "",
+    },
+    "timeline": {
+        "capacity": DEFAULT_TIMELINE_CAPACITY,
+        "retention": DEFAULT_TIMELINE_RETENTION,
+        "buckets": DEFAULT_TIMELINE_BUCKETS,
+    },
+    "clock": {
+        "correct": DEFAULT_CLOCK_CORRECT,
+        "bucket": DEFAULT_CLOCK_BUCKET,
+        "buckets": DEFAULT_CLOCK_BUCKETS,
+    },
+    "runs": {"directory": "", "tags": ""},
+    "overload": {
+        "queue-size": DEFAULT_OVERLOAD_QUEUE_SIZE,
+        "max-lag": DEFAULT_OVERLOAD_MAX_LAG,
+        "max-ratio": DEFAULT_OVERLOAD_MAX_RATIO,
+    },
+    "codec": {"json": DEFAULT_CODEC_JSON, "partial": DEFAULT_CODEC_PARTIAL},
+    "alerts": {},
     "logging": {
         "access-logfile": "",
         "access-maxbytes": DEFAULT_LOGGING_MAXBYTES,
@@ -24,7 +96,8 @@ def load(path):
     import configparser
 
     result = dict(DEFAULT_CONFIG)
-    config = configparser.ConfigParser()
+    # No interpolation, so % can be used in values such as alert rules
+    config = configparser.ConfigParser(interpolation=None)
     config.read(path)
     for s in config.sections():
         result.setdefault(s, {}).update(config.items(s))
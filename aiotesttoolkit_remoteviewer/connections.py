@@ -0,0 +1,156 @@
+__all__ = ["Client", "ConnectionRegistry"]
+import asyncio
+import itertools
+import logging
+from aiohttp import WSCloseCode, WSMsgType
+from aiotesttoolkit_remoteviewer.broadcast import ClientQueue
+from aiotesttoolkit_remoteviewer import protocol
+
+logger = logging.getLogger("remoteviewer.connections")
+
+
+class Client:
+    """A connected dashboard and its queue of pending messages.
+
+    :param websocket: connected websocket
+    :param queue: queue of messages to send
+    :param binary: if the client negotiated the binary protocol
+    :param number: number identifying the client in logs and metrics
+    """
+
+    def __init__(self, websocket, queue, *, binary: bool = False, number: int = 0):
+        self.websocket = websocket
+        self.number = number
+        self.queue = queue
+        self.binary = binary
+        # Ids of symbols already defined for this client
+        self.symbols = set()
+
+
+class ConnectionRegistry:
+    """Keep track of connected dashboards.
+
+    Clients are added when their websocket is opened and removed as soon
+    as it is closed, either by the peer, by an error while sending, or by
+    the keepalive detecting a dead peer. Waiting for a connection to close
+    or for messages to send doesn't consume any CPU.
+
+    Callbacks in `on_connect` are called with each new `Client` before
+    it receives any broadcast message, callbacks in `on_disconnect` when
+    it is removed and callbacks in `on_message` with the client and the
+    data of each message it sends.
+
+    :param queue_factory: callable creating the queue of a new client
+    """
+
+    def __init__(self, *, queue_factory=None):
+        self.queue_factory = queue_factory or ClientQueue
+        self.on_connect = []
+        self.on_disconnect = []
+        self.on_message = []
+        self._clients = {}
+        self._numbers = itertools.count(1)
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __iter__(self):
+        # Iterate over a copy so clients can be removed while iterating
+        return iter(list(self._clients.values()))
+
+    def add(self, websocket) -> Client:
+        """Register a new client.
+
+        :param websocket: connected websocket
+        :return: registered client
+        """
+        client = Client(
+            websocket,
+            self.queue_factory(),
+            binary=websocket.ws_protocol == protocol.BINARY,
+            number=next(self._numbers),
+        )
+        for callback in self.on_connect:
+            callback(client)
+        self._clients[websocket] = client
+        logger.info("Client connected ({} total)".format(len(self._clients)))
+        return client
+
+    def remove(self, websocket):
+        """Unregister a client.
+
+        Removing a client that is not registered does nothing.
+
+        :param websocket: websocket to remove
+        """
+        client = self._clients.pop(websocket, None)
+        if client is not None:
+            for callback in self.on_disconnect:
+                callback(client)
+            logger.info("Client disconnected ({} total)".format(len(self._clients)))
+
+    async def handle(self, websocket):
+        """Serve a prepared `web.WebSocketResponse` until it is closed.
+
+        Register the client then send it queued messages until its
+        connection is closed. Keepalive is handled by aiohttp heartbeat
+        with ping/pong frames, a peer that doesn't answer is closed and
+        unregistered.
+
+        :param websocket: prepared websocket
+        """
+        client = self.add(websocket)
+        pump = asyncio.ensure_future(self._pump(client))
+        try:
+            async for message in websocket:
+                if message.type not in (WSMsgType.TEXT, WSMsgType.BINARY):
+                    continue
+                for callback in self.on_message:
+                    try:
+                        callback(client, message.data)
+                    except Exception:
+                        logger.exception("Failed to handle client message")
+        finally:
+            pump.cancel()
+            self.remove(websocket)
+
+    async def close(self):
+        """Close all connections, used when shutting down."""
+        for client in self:
+            await client.websocket.close(code=WSCloseCode.GOING_AWAY)
+
+    async def _pump(self, client):
+        while True:
+            data = await client.queue.get()
+            if isinstance(data, protocol.Frame):
+                # Define symbols this client doesn't know yet
+                missing = [_ for _ in data.symbols if _[0] not in client.symbols]
+                if missing:
+                    if not await self.send(client.websocket, protocol.define(missing)):
+                        break
+                    client.symbols.update(_[0] for _ in missing)
+                data = data.data
+            if not await self.send(client.websocket, data):
+                break
+        # Stop reading from a broken connection
+        await client.websocket.close()
+
+    async def send(self, websocket, data):
+        """Send data to a client.
+
+        The client is unregistered if the connection is closed or broken.
+
+        :param websocket: destination websocket
+        :param data: data to send
+        :return: if data was sent
+        """
+        try:
+            if isinstance(data, bytes):
+                await websocket.send_bytes(data)
+            else:
+                await websocket.send_str(data)
+            return True
+        except Exception:
+            logger.debug("Failed to send to client", exc_info=True)
+            self.remove(websocket)
+            return False
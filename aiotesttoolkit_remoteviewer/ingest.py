@@ -0,0 +1,200 @@
+"""Multi-process ingest of slave reports.
+
+Each worker process runs its own `reporting.MasterReporter` listening on
+the same port with `SO_REUSEPORT`, so the kernel spreads slave
+connections between workers. Workers decode and aggregate stats locally
+and periodically send their partial windows through a pipe to the
+process serving dashboards, where they are merged exactly. Partials are
+received and decoded in a thread so the event loop isn't blocked.
+
+Profiled calls without a caller are only sent as partial windows, so they
+reach window summaries, alerts, run snapshots and the call graph, as
+calls of its root. They don't reach stages that need stats one by one:
+they are not recorded, not shown on the timeline nor in time series, and
+clocks of slaves are estimated from the other stats only. Calls naming
+their caller and `enter` and `exit` stats, that build the call graph, and
+stats that are not profiled calls are sent as-is.
+"""
+
+__all__ = ["IngestWorkers"]
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+import socket
+from aiotesttoolkit_remoteviewer import codec as _codec
+from aiotesttoolkit_remoteviewer import stats
+from aiotesttoolkit_remoteviewer.aggregation import (
+    Aggregator,
+    encode_partial,
+    decode_partial,
+)
+
+logger = logging.getLogger("remoteviewer.ingest")
+
+
+def _run_worker(host: str, port: int, interval: float, codec: str, conn):
+    """Entry point of a worker process."""
+    from aiotesttoolkit import reporting
+
+    codec = _codec.get(codec, binary=True)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # The master reporter creates its own server, make it share the port
+    # with other workers
+    loop.create_server = functools.partial(loop.create_server, reuse_port=True)
+
+    aggregator = Aggregator(window=interval)
+    passthrough = []
+
+    async def handle_stat(stat):
+        record = stats.record(stat)
+        # The call graph needs calls with a caller, and enter and exit
+        # stats of bots, one by one
+        if (
+            record.parent
+            or stats.SYMBOLS.names[record.kind] in (stats.ENTER, stats.EXIT)
+            or not aggregator.add(record)
+        ):
+            passthrough.append(stat)
+
+    def ship(start, windows):
+        if not windows and not passthrough:
+            return
+        conn.send_bytes(encode_partial(start, windows, passthrough, codec=codec))
+        del passthrough[:]
+
+    reporter = reporting.MasterReporter(host, port, handle_stat=handle_stat)
+    loop.run_until_complete(reporter.start())
+    try:
+        loop.run_until_complete(aggregator.run(ship))
+    except KeyboardInterrupt:
+        pass
+
+
+class _DecodeError(ValueError):
+    """A partial was received but couldn't be decoded."""
+
+
+def _receive(conn) -> tuple:
+    """Wait for a partial and decode it, out of the event loop.
+
+    :raises EOFError: if the worker closed the pipe
+    :raises OSError: if the pipe is broken
+    :raises _DecodeError: if the partial is invalid
+    """
+    data = conn.recv_bytes()
+    try:
+        return decode_partial(data)
+    except Exception as e:
+        raise _DecodeError("Invalid partial of {} bytes".format(len(data))) from e
+
+
+class IngestWorkers:
+    """Pool of processes receiving slave reports on the same port.
+
+    :param count: number of worker processes
+    :param host: host to listen on
+    :param port: port to listen on
+    :param handle_partial: coroutine function receiving the list of
+                           partial `WindowStats` and the list of stats
+                           sent as-is, with `root=True` as windows are
+                           calls without a caller
+    :param interval: seconds between two partials sent by a worker
+    :param codec: name of the codec encoding partials, see `codec`
+    :raises ValueError: if the platform can't share a port between
+                        processes, such as Windows
+    """
+
+    def __init__(
+        self,
+        count: int,
+        *,
+        host: str,
+        port: int,
+        handle_partial,
+        interval: float = 0.25,
+        codec: str = _codec.AUTO
+    ):
+        # Fail now rather than in workers
+        _codec.get(codec, binary=True)
+        if count <= 0:
+            raise ValueError("count must be positive")
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise ValueError(
+                "Ingest workers need SO_REUSEPORT, that this platform lacks"
+            )
+        self.count = count
+        self.host = host
+        self.port = port
+        self.handle_partial = handle_partial
+        self.interval = interval
+        self.codec = codec
+        self._processes = []
+        self._readers = []
+        self._executor = None
+
+    async def start(self):
+        context = multiprocessing.get_context("spawn")
+        loop = asyncio.get_event_loop()
+        # Each reader blocks a thread on its pipe for good, keep them out of
+        # the default executor used by other tasks
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.count, thread_name_prefix="ingest"
+        )
+        for _ in range(0, self.count):
+            parent, child = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_run_worker,
+                args=(self.host, self.port, self.interval, self.codec, child),
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            self._processes.append(process)
+            self._readers.append(loop.create_task(self._read(parent)))
+        logger.info(
+            "Started {} ingest workers on {}:{}".format(
+                self.count, self.host, self.port
+            )
+        )
+
+    async def _read(self, conn):
+        loop = asyncio.get_event_loop()
+        while True:
+            # Wait for data in a thread so the loop never blocks on a pipe,
+            # and decode it there too
+            try:
+                windows, others = await loop.run_in_executor(
+                    self._executor, _receive, conn
+                )
+            except EOFError:
+                logger.error("Ingest worker exited")
+                return
+            except OSError:
+                logger.exception("Lost pipe of ingest worker")
+                return
+            except _DecodeError:
+                logger.exception("Failed to decode partial")
+                continue
+            try:
+                await self.handle_partial(windows, others, root=True)
+            except Exception:
+                logger.exception("Failed to handle partial")
+
+    async def stop(self):
+        for _ in self._processes:
+            _.terminate()
+        for _ in self._readers:
+            _.cancel()
+        await asyncio.gather(*self._readers, return_exceptions=True)
+        for _ in self._processes:
+            _.join()
+        if self._executor is not None:
+            # Readers got EOFError once workers exited
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._processes = []
+        self._readers = []
@@ -0,0 +1,314 @@
+"""Health metrics of the viewer itself, in Prometheus text format.
+
+They tell whether a slow run comes from the server under test or from
+the viewer dropping or delaying data.
+"""
+
+__all__ = ["Summary", "Monitor", "rss"]
+import asyncio
+import logging
+import os
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger("remoteviewer.monitoring")
+
+
+def rss():
+    """Resident set size of the process.
+
+    :return: size in bytes or `None` if unknown on this platform
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _escape(value) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Summary:
+    """Sum, count and max of observed values."""
+
+    __slots__ = ("sum", "count", "max")
+
+    def __init__(self):
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+
+class Monitor:
+    """Collect health metrics of the viewer.
+
+    The ingest rate and the event loop lag are measured by a periodic
+    timer started with `run`: the lag is how late the timer wakes up, so
+    it includes any callback blocking the loop.
+
+    :param clients: a `ConnectionRegistry`
+    :param broadcaster: the `Broadcaster` of clients
+    :param interval: seconds between two measures
+    :param overload: `OverloadController` of raw events, if any
+    :param clocks: `ClockEstimator` of slaves, if any
+    :param events: `EventStream` of passive dashboards, if any
+    """
+
+    def __init__(
+        self,
+        clients,
+        broadcaster,
+        *,
+        interval: float = 1.0,
+        overload=None,
+        clocks=None,
+        events=None
+    ):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.clients = clients
+        self.broadcaster = broadcaster
+        self.overload = overload
+        self.clocks = clocks
+        self.events = events
+        self.interval = interval
+        self.ingested = 0
+        self.ingest_rate = 0.0
+        # Time spent in `Pipeline.handle_stat` per stat
+        self.handling = Summary()
+        self.lag = 0.0
+        self.lags = Summary()
+
+    def observe_stat(self, duration: float):
+        """Record a stat handled by the pipeline.
+
+        :param duration: seconds spent handling it
+        """
+        self.ingested += 1
+        self.handling.observe(duration)
+
+    def observe_ingested(self, count: int):
+        """Record stats ingested by other processes.
+
+        :param count: number of stats
+        """
+        self.ingested += count
+
+    async def run(self):
+        """Measure the ingest rate and the event loop lag forever."""
+        loop = asyncio.get_event_loop()
+        last = loop.time()
+        ingested = self.ingested
+        while True:
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            self.lag = max(now - last - self.interval, 0.0)
+            self.lags.observe(self.lag)
+            self.ingest_rate = (self.ingested - ingested) / (now - last)
+            last = now
+            ingested = self.ingested
+
+    def render(self) -> str:
+        """Current metrics in Prometheus text format."""
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for suffix, labels, value in samples:
+                if labels:
+                    labels = "{{{}}}".format(
+                        ",".join(
+                            '{}="{}"'.format(_[0], _escape(_[1]))
+                            for _ in labels.items()
+                        )
+                    )
+                lines.append("{}{}{} {}".format(name, suffix, labels or "", value))
+
+        def summary(summary):
+            return [("_sum", None, summary.sum), ("_count", None, summary.count)]
+
+        metric(
+            "remoteviewer_stats_ingested_total",
+            "counter",
+            "Stats received from the master reporter.",
+            [("", None, self.ingested)],
+        )
+        metric(
+            "remoteviewer_stats_ingested_per_second",
+            "gauge",
+            "Stats received per second over the last interval.",
+            [("", None, self.ingest_rate)],
+        )
+        metric(
+            "remoteviewer_handle_stat_seconds",
+            "summary",
+            "Time spent handling a stat on the ingest path.",
+            summary(self.handling),
+        )
+        metric(
+            "remoteviewer_handle_stat_seconds_max",
+            "gauge",
+            "Longest time spent handling a stat.",
+            [("", None, self.handling.max)],
+        )
+        if self.overload is not None:
+            metric(
+                "remoteviewer_raw_queue_depth",
+                "gauge",
+                "Raw events waiting to be kept or broadcast.",
+                [("", None, len(self.overload))],
+            )
+            metric(
+                "remoteviewer_sampling_ratio",
+                "gauge",
+                "Only 1 in this number of raw events is kept.",
+                [("", None, self.overload.ratio)],
+            )
+            metric(
+                "remoteviewer_raw_sampled_out_total",
+                "counter",
+                "Raw events not kept because of sampling.",
+                [("", None, self.overload.sampled_out)],
+            )
+            metric(
+                "remoteviewer_raw_shed_total",
+                "counter",
+                "Raw events dropped because the queue was full.",
+                [("", None, self.overload.shed)],
+            )
+        if self.clocks is not None:
+            slaves = [
+                ({"slave": name or ""}, clock)
+                for name, clock in self.clocks.slaves.items()
+            ]
+            metric(
+                "remoteviewer_slave_clock_offset_seconds",
+                "gauge",
+                "Estimated offset of the clock of a slave, including min delay.",
+                [("", labels, clock.offset) for labels, clock in slaves],
+            )
+            metric(
+                "remoteviewer_slave_clock_drift",
+                "gauge",
+                "Estimated seconds of offset gained per second by a slave.",
+                [("", labels, clock.drift) for labels, clock in slaves],
+            )
+            metric(
+                "remoteviewer_slave_clock_uncertainty_seconds",
+                "gauge",
+                "Dispersion of delays around the estimated offset of a slave.",
+                [
+                    ("", labels, clock.uncertainty)
+                    for labels, clock in slaves
+                    if clock.uncertainty is not None
+                ],
+            )
+        metric(
+            "remoteviewer_encode_seconds_total",
+            "counter",
+            "Time spent serializing broadcast messages.",
+            [("", None, self.broadcaster.encode_time)],
+        )
+        metric(
+            "remoteviewer_encoded_total",
+            "counter",
+            "Broadcast messages serialized.",
+            [("", None, self.broadcaster.encoded)],
+        )
+        metric(
+            "remoteviewer_published_total",
+            "counter",
+            "Messages published to clients.",
+            [("", None, self.broadcaster.published)],
+        )
+        metric(
+            "remoteviewer_clients",
+            "gauge",
+            "Connected dashboards.",
+            [("", None, len(self.clients))],
+        )
+        if self.events is not None:
+            metric(
+                "remoteviewer_passive_clients",
+                "gauge",
+                "Passive dashboards reading the event stream.",
+                [("", None, len(self.events))],
+            )
+            metric(
+                "remoteviewer_passive_events_total",
+                "counter",
+                "Events sent to all passive dashboards.",
+                [("", None, self.events.events)],
+            )
+            metric(
+                "remoteviewer_passive_dropped_total",
+                "counter",
+                "Passive dashboards disconnected for lagging behind.",
+                [("", None, self.events.dropped)],
+            )
+        clients = [({"client": _.number}, _.queue) for _ in self.clients]
+        metric(
+            "remoteviewer_client_queue_depth",
+            "gauge",
+            "Messages waiting to be sent to a client.",
+            [("", labels, len(queue)) for labels, queue in clients],
+        )
+        metric(
+            "remoteviewer_client_dropped_total",
+            "counter",
+            "Messages dropped or coalesced for a slow client.",
+            [("", labels, queue.dropped) for labels, queue in clients],
+        )
+        samples = []
+        for labels, queue in clients:
+            samples.append(("_sum", labels, queue.delay))
+            samples.append(("_count", labels, queue.delivered))
+        metric(
+            "remoteviewer_client_fanout_delay_seconds",
+            "summary",
+            "Time messages wait in the queue of a client.",
+            samples,
+        )
+        metric(
+            "remoteviewer_event_loop_lag_seconds",
+            "gauge",
+            "How late the periodic timer woke up last time.",
+            [("", None, self.lag)],
+        )
+        metric(
+            "remoteviewer_event_loop_lag_seconds_max",
+            "gauge",
+            "Highest event loop lag measured.",
+            [("", None, self.lags.max)],
+        )
+        metric(
+            "process_cpu_seconds_total",
+            "counter",
+            "CPU time spent by the process in seconds.",
+            [("", None, time.process_time())],
+        )
+        memory = rss()
+        if memory is not None:
+            metric(
+                "process_resident_memory_bytes",
+                "gauge",
+                "Resident memory size in bytes.",
+                [("", None, memory)],
+            )
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,157 @@
+"""Shed raw events when the viewer falls behind.
+
+Aggregates are always updated exactly, as soon as a stat is received.
+What comes after, raw samples kept in time series and stats broadcast
+as-is to dashboards, goes through a bounded queue drained by a
+background task, so receiving a stat never waits for it.
+
+The controller watches the depth of this queue and the event loop lag.
+Under pressure it switches to counted sampling: only 1 in `ratio` raw
+events is queued, the ratio doubling each time pressure is measured and
+halving once it is gone for a while. If the queue is still full, the
+oldest events are shed. Dashboards are told the current ratio.
+"""
+
+__all__ = ["OverloadController"]
+import asyncio
+import collections
+import logging
+import time
+
+logger = logging.getLogger("remoteviewer.overload")
+
+# Intervals without pressure before the ratio is halved
+_COOLDOWN = 4
+
+
+class OverloadController:
+    """Bounded queue of raw events with adaptive sampling.
+
+    :param maxsize: max raw events waiting to be handled
+    :param max_lag: event loop lag in seconds above which the viewer is
+                    under pressure
+    :param max_ratio: highest sampling ratio
+    :param interval: seconds between two measures
+    """
+
+    def __init__(
+        self,
+        *,
+        maxsize: int = 10000,
+        max_lag: float = 0.1,
+        max_ratio: int = 64,
+        interval: float = 0.25
+    ):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        if max_ratio < 1:
+            raise ValueError("max_ratio must be at least 1")
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.maxsize = maxsize
+        self.max_lag = max_lag
+        self.max_ratio = max_ratio
+        self.interval = interval
+        self.ratio = 1
+        self.lag = 0.0
+        # Raw events not queued because of sampling, or dropped when full
+        self.sampled_out = 0
+        self.shed = 0
+        self._pending = collections.deque()
+        self._counter = 0
+        self._calm = 0
+        self._waiter = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def offer(self, item) -> bool:
+        """Queue a raw event if it is sampled, without blocking.
+
+        :param item: raw event
+        :return: if the event was queued
+        """
+        self._counter += 1
+        if self._counter < self.ratio:
+            self.sampled_out += 1
+            return False
+        self._counter = 0
+        if len(self._pending) >= self.maxsize:
+            self._pending.popleft()
+            self.shed += 1
+        self._pending.append(item)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        return True
+
+    async def get(self, size: int) -> list:
+        """Wait for raw events.
+
+        :param size: max number of events returned
+        :return: list of at least one event
+        """
+        while not self._pending:
+            self._waiter = asyncio.get_event_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        pending = self._pending
+        return [pending.popleft() for _ in range(0, min(size, len(pending)))]
+
+    def update(self, lag: float) -> bool:
+        """Adapt the sampling ratio to the current pressure.
+
+        :param lag: event loop lag in seconds
+        :return: if the ratio changed
+        """
+        self.lag = lag
+        depth = len(self._pending)
+        ratio = self.ratio
+        if depth > self.maxsize // 2 or lag > self.max_lag:
+            self._calm = 0
+            ratio = min(ratio * 2, self.max_ratio)
+        elif depth < self.maxsize // 8 and lag < self.max_lag / 2:
+            self._calm += 1
+            if self._calm >= _COOLDOWN:
+                self._calm = 0
+                ratio = max(ratio // 2, 1)
+        else:
+            self._calm = 0
+        if ratio == self.ratio:
+            return False
+        logger.warning(
+            "Sampling 1 in {} raw events (queue {}, lag {:.3f}s)".format(
+                ratio, depth, lag
+            )
+        )
+        self.ratio = ratio
+        self._counter = 0
+        return True
+
+    def message(self) -> dict:
+        """Current sampling ratio, as a message for dashboards."""
+        return {
+            "type": "sampling",
+            "ratio": self.ratio,
+            "time": time.time(),
+            "queue": len(self._pending),
+            "lag": self.lag,
+            "sampled_out": self.sampled_out,
+            "shed": self.shed,
+        }
+
+    async def run(self, on_change):
+        """Measure the pressure forever.
+
+        :param on_change: function called without arguments when the
+                          ratio changes
+        """
+        loop = asyncio.get_event_loop()
+        last = loop.time()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            if self.update(max(now - last - self.interval, 0.0)):
+                on_change()
+            last = now
@@ -0,0 +1,423 @@
+__all__ = ["Pipeline"]
+import asyncio
+import functools
+import logging
+import time
+from aiotesttoolkit_remoteviewer import codec as _codec
+from aiotesttoolkit_remoteviewer import configuration
+from aiotesttoolkit_remoteviewer import stats
+from aiotesttoolkit_remoteviewer import subscriptions
+from aiotesttoolkit_remoteviewer import recording as _recording
+from aiotesttoolkit_remoteviewer.connections import ConnectionRegistry
+from aiotesttoolkit_remoteviewer.broadcast import ClientQueue, Broadcaster
+from aiotesttoolkit_remoteviewer.aggregation import Aggregator
+from aiotesttoolkit_remoteviewer.timeseries import TimeSeriesStore
+from aiotesttoolkit_remoteviewer.timeline import SpanIndex
+from aiotesttoolkit_remoteviewer.monitoring import Monitor
+from aiotesttoolkit_remoteviewer.alerts import AlertEvaluator
+from aiotesttoolkit_remoteviewer.callgraph import CallGraph
+from aiotesttoolkit_remoteviewer.clock import ClockEstimator
+from aiotesttoolkit_remoteviewer.overload import OverloadController
+from aiotesttoolkit_remoteviewer.runs import RunSummary, RunIndex
+from aiotesttoolkit_remoteviewer.sse import DEFAULT_METRICS, EventStream
+
+logger = logging.getLogger("remoteviewer.pipeline")
+
+# Max raw events handled before yielding to other tasks
+_DRAIN_BATCH = 256
+
+
+class Pipeline:
+    """Stages stats go through, from the master reporter to dashboards.
+
+    Stats are passed to `handle_stat`. Background tasks are started and
+    stopped with `start` and `stop`, that can be used as `on_startup` and
+    `on_cleanup` hooks of the application.
+
+    :param websocket: websocket options
+    :param aggregation: aggregation options
+    :param events: options of the event stream of passive dashboards
+    :param timeseries: time series options
+    :param timeline: timeline options
+    :param recording: recording options, nothing is recorded without
+                      a `directory`
+    :param alerts: dict of alert rule name to declaration
+    :param clock: clock estimation options
+    :param runs: run snapshot options, runs are not saved without a
+                 `directory`
+    :param overload: overload options
+    :param codec: codec options, see `codec`
+    """
+
+    def __init__(
+        self,
+        *,
+        websocket: dict = None,
+        aggregation: dict = None,
+        events: dict = None,
+        timeseries: dict = None,
+        timeline: dict = None,
+        recording: dict = None,
+        alerts: dict = None,
+        clock: dict = None,
+        runs: dict = None,
+        overload: dict = None,
+        codec: dict = None
+    ):
+        websocket = websocket or {}
+        aggregation = aggregation or {}
+        events = events or {}
+        timeseries = timeseries or {}
+        timeline = timeline or {}
+        recording = recording or {}
+        overload = overload or {}
+        clock = clock or {}
+        runs = runs or {}
+        codec = codec or {}
+        json_codec = codec.get("json", configuration.DEFAULT_CODEC_JSON)
+        # Decodes messages of dashboards
+        self.codec = _codec.get(json_codec)
+        self.clients = ConnectionRegistry(
+            queue_factory=functools.partial(
+                ClientQueue,
+                maxsize=websocket.get(
+                    "queue_size", configuration.DEFAULT_WEBSOCKET_QUEUE_SIZE
+                ),
+                policy=websocket.get(
+                    "queue_policy", configuration.DEFAULT_WEBSOCKET_QUEUE_POLICY
+                ),
+            )
+        )
+        # Callbacks called with the `stats.StatRecord` of each stat
+        self.on_record = []
+        self.clients.on_connect.append(self.send_backfill)
+        self.clients.on_connect.append(self.send_alerts)
+        self.clients.on_connect.append(self.send_sampling)
+        self.clients.on_connect.append(self.send_callgraph)
+        self.clients.on_connect.append(self.send_clocks)
+        self.clients.on_message.append(self.handle_client_message)
+        self.broadcaster = Broadcaster(self.clients, codec=json_codec)
+        self.events = EventStream(
+            interval=events.get("interval", configuration.DEFAULT_EVENTS_INTERVAL),
+            metrics=events.get("metrics", DEFAULT_METRICS),
+            max_buffer=events.get(
+                "max_buffer", configuration.DEFAULT_EVENTS_MAX_BUFFER
+            ),
+            codec=json_codec,
+        )
+        self.broadcaster.streams.append(self.events)
+        self.clocks = ClockEstimator(
+            bucket=clock.get("bucket", configuration.DEFAULT_CLOCK_BUCKET),
+            buckets=clock.get("buckets", configuration.DEFAULT_CLOCK_BUCKETS),
+        )
+        self.correct_clocks = clock.get("correct", configuration.DEFAULT_CLOCK_CORRECT)
+        self.overload = OverloadController(
+            maxsize=overload.get(
+                "queue_size", configuration.DEFAULT_OVERLOAD_QUEUE_SIZE
+            ),
+            max_lag=overload.get("max_lag", configuration.DEFAULT_OVERLOAD_MAX_LAG),
+            max_ratio=overload.get(
+                "max_ratio", configuration.DEFAULT_OVERLOAD_MAX_RATIO
+            ),
+        )
+        self.monitor = Monitor(
+            self.clients,
+            self.broadcaster,
+            overload=self.overload,
+            clocks=self.clocks,
+            events=self.events,
+        )
+        self.aggregator = Aggregator(
+            window=aggregation.get("window", configuration.DEFAULT_AGGREGATION_WINDOW)
+        )
+        self.store = TimeSeriesStore(
+            capacity=timeseries.get(
+                "capacity", configuration.DEFAULT_TIMESERIES_CAPACITY
+            ),
+            max_metrics=timeseries.get(
+                "max_metrics", configuration.DEFAULT_TIMESERIES_MAX_METRICS
+            ),
+        )
+        self.timeline = SpanIndex(
+            capacity=timeline.get("capacity", configuration.DEFAULT_TIMELINE_CAPACITY),
+            retention=timeline.get(
+                "retention", configuration.DEFAULT_TIMELINE_RETENTION
+            ),
+            buckets=timeline.get("buckets", configuration.DEFAULT_TIMELINE_BUCKETS),
+        )
+        self.backfill = timeseries.get(
+            "backfill", configuration.DEFAULT_TIMESERIES_BACKFILL
+        )
+        self.backfill_points = timeseries.get(
+            "backfill_points", configuration.DEFAULT_TIMESERIES_BACKFILL_POINTS
+        )
+        self.alerts = AlertEvaluator.from_config(alerts or {})
+        self.callgraph = CallGraph()
+        self.on_record.append(self.callgraph.add)
+        self.run = RunSummary()
+        self.on_record.append(self.run.add_record)
+        self.runs = None
+        if runs.get("directory", None):
+            self.runs = RunIndex(runs["directory"])
+        self.run_tags = runs.get("tags", None) or []
+        # End of the current run when it was last saved
+        self._run_saved = None
+        self.recorder = None
+        if recording.get("directory", None):
+            self.recorder = _recording.Recorder(
+                recording["directory"],
+                segment_size=recording.get(
+                    "segment_size", configuration.DEFAULT_RECORDING_SEGMENT_SIZE
+                ),
+                fsync_interval=recording.get(
+                    "fsync_interval", configuration.DEFAULT_RECORDING_FSYNC_INTERVAL
+                ),
+                codec=json_codec,
+            )
+        self._tasks = []
+        # Raw events are handled inline until the drain task is started
+        self._draining = False
+
+    def send_backfill(self, client):
+        """Queue the recent history for a new client."""
+        now = time.time()
+        client.queue.put(
+            self.broadcaster.encode_for(
+                client,
+                {
+                    "type": "backfill",
+                    "since": now - self.backfill,
+                    "until": now,
+                    "series": self.store.backfill(
+                        now - self.backfill, now, points=self.backfill_points
+                    ),
+                },
+            )
+        )
+
+    def send_alerts(self, client):
+        """Queue the alerts currently firing for a new client."""
+        for _ in self.alerts.active():
+            client.queue.put(self.broadcaster.encode_for(client, _))
+
+    def send_sampling(self, client):
+        """Queue the current sampling ratio for a new client."""
+        client.queue.put(
+            self.broadcaster.encode_for(client, self.overload.message()),
+            key="sampling",
+        )
+
+    def publish_sampling(self):
+        """Broadcast the current sampling ratio."""
+        self.broadcaster.publish(
+            self.overload.message(), key="sampling", metric="sampling"
+        )
+
+    def send_callgraph(self, client):
+        """Queue the whole call graph for a new client."""
+        if self.callgraph:
+            client.queue.put(
+                self.broadcaster.encode_for(client, self.callgraph.snapshot())
+            )
+
+    def send_clocks(self, client):
+        """Queue the estimated clocks of slaves for a new client."""
+        if self.clocks:
+            client.queue.put(
+                self.broadcaster.encode_for(client, self.clocks.message()),
+                key="clock",
+            )
+
+    def publish_window(self, start, windows):
+        """Broadcast the summaries of a closed window and alerts."""
+        for _ in windows:
+            message = _.summary()
+            message.update(
+                {"type": "window", "start": start, "window": self.aggregator.window}
+            )
+            self.broadcaster.publish(
+                message, key=("window", _.node), node=_.node, metric="window"
+            )
+        for _ in self.alerts.evaluate(start, windows, self.aggregator.window):
+            self.broadcaster.publish(_, node=_["node"], metric="alert")
+        self.timeline.prune(start)
+        self.callgraph.prune(start)
+        self.run.add_window(start, self.aggregator.window, windows)
+        if self.clocks:
+            self.broadcaster.publish(self.clocks.message(), key="clock", metric="clock")
+        # Diffs are not coalesced, each one has different nodes
+        diff = self.callgraph.diff()
+        if diff:
+            self.broadcaster.publish(diff, metric="callgraph")
+
+    def snapshot_run(
+        self, *, run_id: str = None, tags=None, config: dict = None, reset=False
+    ) -> dict:
+        """Save a summary of the current run.
+
+        :param run_id: id of the run, defaults to its start time
+        :param tags: tags of the run, in addition to configured ones
+        :param config: configuration of the run, in addition to the
+                       options reported by slaves
+        :param reset: start a new run once saved
+        :return: entry of the run in the index
+        :raises ValueError: if runs are not saved or nothing was received
+        """
+        if self.runs is None:
+            raise ValueError("runs are not saved, set a directory")
+        if not self.run:
+            raise ValueError("nothing was received since the run started")
+        # The configuration given is only the one of this snapshot
+        saved = self.run.config
+        if config:
+            self.run.config = dict(saved, **config)
+        try:
+            entry = self.runs.save(
+                self.run, run_id=run_id, tags=list(self.run_tags) + list(tags or [])
+            )
+        finally:
+            self.run.config = saved
+        self._run_saved = self.run.ended
+        if reset:
+            self.run.reset()
+            self._run_saved = None
+        return entry
+
+    async def handle_stat(self, stat):
+        """Handler to pass to `reporting.MasterReporter`.
+
+        :param stat: received stat
+        """
+        start = time.perf_counter()
+        arrival = time.time()
+        if self.recorder:
+            self.recorder.write(stat, arrival=arrival)
+        record = stats.record(stat)
+        if stats.has_timestamp(stat):
+            corrected = self.clocks.correct(record.slave_name, record.time, arrival)
+            if self.correct_clocks:
+                record.time = corrected
+        self.handle_record(record)
+        self.monitor.observe_stat(time.perf_counter() - start)
+
+    def handle_record(self, record):
+        """Pass a received stat through all stages.
+
+        Aggregates are updated right away. The raw event is handled later
+        by the drain task, if it is sampled by the overload controller.
+
+        :param record: `stats.StatRecord` of the stat
+        """
+        for callback in self.on_record:
+            callback(record)
+        profiled = self.aggregator.add(record)
+        if not self._draining:
+            self.handle_raw(profiled, record)
+        else:
+            # Sampled at the current ratio, that may change before it is
+            # drained
+            self.overload.offer((profiled, record, self.overload.ratio))
+
+    def handle_raw(self, profiled, record, weight: int = 1):
+        """Keep or broadcast a raw event.
+
+        :param profiled: if the record is a profiled call
+        :param record: `stats.StatRecord` of the stat
+        :param weight: sampling ratio of the event when it was queued
+        """
+        # Profiled calls are only sent as window summaries
+        if profiled:
+            self.store.append(record.node_name, record.time, record.duration)
+            # Sampled spans stand for the ones sampled out
+            self.timeline.add(record, weight=weight)
+        else:
+            self.broadcaster.publish(
+                record,
+                key=record.node,
+                slave=record.slave_name,
+                node=record.node_name,
+                metric=record.kind_name,
+            )
+
+    def handle_client_message(self, client, data):
+        """Handle a message sent by a dashboard.
+
+        Only subscriptions are supported: `{"type": "subscribe", "slaves":
+        [...], "nodes": [...], "metrics": [...]}`.
+
+        :param client: `Client` that sent the message
+        :param data: received data
+        """
+        message = self.codec.loads(data)
+        if message.get("type", None) == "subscribe":
+            self.broadcaster.subscribe(
+                client, **{_: message.get(_, None) for _ in subscriptions.DIMENSIONS}
+            )
+
+    async def handle_partial(self, windows, others, *, root: bool = False):
+        """Handler to pass to `ingest.IngestWorkers`.
+
+        Profiled calls aggregated by workers are merged in the current
+        window, they are not recorded nor kept in time series or on the
+        timeline.
+
+        :param windows: partial `WindowStats`
+        :param others: received stats that are not profiled calls
+        :param root: if windows are calls without a caller, that are
+                     merged in the call graph as calls of its root
+        """
+        for _ in windows:
+            self.aggregator.merge(_)
+            if root:
+                self.callgraph.merge(_)
+            self.monitor.observe_ingested(_.count)
+        for _ in others:
+            await self.handle_stat(_)
+
+    def create_task(self, coro):
+        """Run a background task until `stop` is called.
+
+        :param coro: coroutine to run
+        """
+        task = asyncio.get_event_loop().create_task(coro)
+        self._tasks.append(task)
+        return task
+
+    async def drain(self):
+        """Handle raw events queued by `handle_record` forever."""
+        while True:
+            for _ in await self.overload.get(_DRAIN_BATCH):
+                self.handle_raw(*_)
+            # Let other tasks, such as receiving stats, run between batches
+            await asyncio.sleep(0)
+
+    async def start(self, app=None):
+        self.create_task(self.aggregator.run(self.publish_window))
+        self.create_task(self.monitor.run())
+        self.create_task(self.overload.run(self.publish_sampling))
+        self.create_task(self.drain())
+        self.create_task(self.events.run())
+        self._draining = True
+        if self.recorder:
+            self.create_task(self.recorder.run())
+
+    async def stop(self, app=None):
+        for _ in self._tasks:
+            _.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._draining = False
+        self.events.close()
+        if self.recorder:
+            await self.recorder.stop()
+        if self.runs is not None:
+            # The run ends with the viewer, save it with its last window
+            # unless it was saved already
+            start, windows = self.aggregator.flush()
+            self.run.add_window(start, self.aggregator.window, windows)
+            if not self.run or self.run.ended == self._run_saved:
+                return
+            try:
+                self.snapshot_run()
+            except (OSError, ValueError):
+                logger.exception("Failed to save run")
@@ -0,0 +1,284 @@
+"""Compact binary protocol for dashboards.
+
+Clients choose between the `JSON` and `BINARY` websocket subprotocols
+when connecting. With `BINARY`, names are interned into small integer
+ids and numeric messages are sent as packed binary frames. Messages that
+have no binary encoding are still sent as JSON text frames.
+
+All frames start with a one byte type:
+
+- `DEFINE`: varint count, then for each symbol its varint id, varint
+  length and UTF-8 name. Sent before the first frame using a symbol.
+- `WINDOW`: float64 start, float32 window, varint node id, varint count,
+  varint errors, then zigzag varints in microseconds of min, p50 - min,
+  p95 - p50, p99 - p95, max - p99 and mean - min.
+- `BACKFILL`: float64 since, float64 until, varint number of series, then
+  for each series its varint metric id, varint number of points, the
+  zigzag varint delta of timestamps in milliseconds (the first one from
+  `since`) and the zigzag varint delta of values in microseconds.
+"""
+
+__all__ = [
+    "JSON",
+    "BINARY",
+    "SUBPROTOCOLS",
+    "SymbolTable",
+    "Frame",
+    "Encoder",
+    "Decoder",
+    "define",
+]
+import json
+import struct
+
+JSON = "remoteviewer.json"
+BINARY = "remoteviewer.binary"
+SUBPROTOCOLS = [BINARY, JSON]
+
+DEFINE = 1
+WINDOW = 2
+BACKFILL = 3
+
+_WINDOW_HEADER = struct.Struct("<Bdf")
+_BACKFILL_HEADER = struct.Struct("<Bdd")
+
+
+def _varint(buf: bytearray, value: int):
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _zigzag(buf: bytearray, value: int):
+    _varint(buf, (value << 1) if value >= 0 else ((-value << 1) - 1))
+
+
+def _us(value: float) -> int:
+    return int(round(value * 1e6))
+
+
+class SymbolTable:
+    """Intern names into small integer ids.
+
+    Ids are never reused, so a client that has received the definition
+    of an id can keep it for the whole connection.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self.names = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name: str) -> int:
+        """Id of a name, a new id is created on first use.
+
+        :param name: name to intern
+        :return: id of the name
+        """
+        name = name or ""
+        symbol = self._ids.get(name, None)
+        if symbol is None:
+            symbol = self._ids[name] = len(self.names)
+            self.names.append(name)
+        return symbol
+
+
+def define(symbols) -> bytes:
+    """Encode the definition of symbols.
+
+    :param symbols: list of id and name of symbols
+    :return: encoded frame
+    """
+    buf = bytearray((DEFINE,))
+    symbols = list(symbols)
+    _varint(buf, len(symbols))
+    for symbol, name in symbols:
+        name = name.encode("utf-8")
+        _varint(buf, symbol)
+        _varint(buf, len(name))
+        buf += name
+    return bytes(buf)
+
+
+class Frame:
+    """Binary frame and the symbols it uses.
+
+    :param data: encoded frame
+    :param symbols: id and name of symbols the client must know to
+                    decode the frame
+    """
+
+    __slots__ = ("data", "symbols")
+
+    def __init__(self, data: bytes, symbols: tuple):
+        self.data = data
+        self.symbols = symbols
+
+
+class Encoder:
+    """Encode messages into binary frames.
+
+    The symbol table is shared by all clients, so each message is encoded
+    once no matter how many binary clients receive it.
+    """
+
+    def __init__(self):
+        self.symbols = SymbolTable()
+
+    def encode(self, message: dict) -> Frame:
+        """Encode a message.
+
+        :param message: message to encode
+        :return: a `Frame`, or `None` if the message has no binary encoding
+        """
+        if not isinstance(message, dict):
+            return None
+        kind = message.get("type", None)
+        if kind == "window":
+            return self._encode_window(message)
+        if kind == "backfill":
+            return self._encode_backfill(message)
+        return None
+
+    def _encode_window(self, message: dict) -> Frame:
+        node = self.symbols.intern(message["node"])
+        buf = bytearray(
+            _WINDOW_HEADER.pack(WINDOW, message["start"], message["window"])
+        )
+        _varint(buf, node)
+        _varint(buf, message["count"])
+        _varint(buf, message["errors"])
+        low = _us(message["min"])
+        previous = low
+        _zigzag(buf, low)
+        for name in ("p50", "p95", "p99", "max"):
+            value = _us(message[name])
+            _zigzag(buf, value - previous)
+            previous = value
+        _zigzag(buf, _us(message["mean"]) - low)
+        return Frame(bytes(buf), ((node, message["node"] or ""),))
+
+    def _encode_backfill(self, message: dict) -> Frame:
+        since = message["since"]
+        buf = bytearray(_BACKFILL_HEADER.pack(BACKFILL, since, message["until"]))
+        series = message["series"]
+        _varint(buf, len(series))
+        symbols = []
+        for metric, columns in series.items():
+            symbol = self.symbols.intern(metric)
+            symbols.append((symbol, metric or ""))
+            _varint(buf, symbol)
+            times, values = columns["t"], columns["v"]
+            _varint(buf, len(times))
+            previous = int(round(since * 1e3))
+            for t in times:
+                t = int(round(t * 1e3))
+                _zigzag(buf, t - previous)
+                previous = t
+            previous = 0
+            for value in values:
+                value = _us(value)
+                _zigzag(buf, value - previous)
+                previous = value
+        return Frame(bytes(buf), tuple(symbols))
+
+
+class _Reader:
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        result = fmt.unpack_from(self.data, self.pos)
+        self.pos += fmt.size
+        return result
+
+    def varint(self) -> int:
+        value = 0
+        shift = 0
+        while True:
+            b = self.data[self.pos]
+            self.pos += 1
+            value |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                return value
+
+    def zigzag(self) -> int:
+        value = self.varint()
+        return -((value + 1) >> 1) if value & 1 else value >> 1
+
+    def string(self) -> str:
+        length = self.varint()
+        self.pos += length
+        return self.data[self.pos - length : self.pos].decode("utf-8")
+
+
+class Decoder:
+    """Decode frames received by a client.
+
+    This is the counterpart of `Encoder` used by `static/js/protocol.js`,
+    it is mostly useful for headless clients and tests.
+    """
+
+    def __init__(self):
+        self.symbols = {}
+
+    def decode(self, data):
+        """Decode a frame into the same message as the JSON protocol.
+
+        :param data: text or binary frame
+        :return: decoded message, or `None` for `DEFINE` frames
+        """
+        if isinstance(data, str):
+            return json.loads(data)
+        reader = _Reader(data)
+        kind = data[0]
+        if kind == DEFINE:
+            reader.pos = 1
+            for _ in range(0, reader.varint()):
+                symbol = reader.varint()
+                self.symbols[symbol] = reader.string()
+            return None
+        if kind == WINDOW:
+            _, start, window = reader.unpack(_WINDOW_HEADER)
+            message = {"type": "window", "start": start, "window": window}
+            message["node"] = self.symbols[reader.varint()]
+            message["count"] = reader.varint()
+            message["errors"] = reader.varint()
+            low = value = reader.zigzag()
+            message["min"] = low / 1e6
+            for name in ("p50", "p95", "p99", "max"):
+                value += reader.zigzag()
+                message[name] = value / 1e6
+            message["mean"] = (low + reader.zigzag()) / 1e6
+            return message
+        if kind == BACKFILL:
+            _, since, until = reader.unpack(_BACKFILL_HEADER)
+            series = {}
+            for _ in range(0, reader.varint()):
+                metric = self.symbols[reader.varint()]
+                count = reader.varint()
+                times = []
+                previous = int(round(since * 1e3))
+                for _ in range(0, count):
+                    previous += reader.zigzag()
+                    times.append(previous / 1e3)
+                values = []
+                previous = 0
+                for _ in range(0, count):
+                    previous += reader.zigzag()
+                    values.append(previous / 1e6)
+                series[metric] = {"t": times, "v": values}
+            return {
+                "type": "backfill",
+                "since": since,
+                "until": until,
+                "series": series,
+            }
+        raise ValueError("unknown frame type {}".format(kind))
@@ -0,0 +1,222 @@
+"""Record the stat stream to disk and replay it.
+
+A recording is a directory of segment files. Each segment starts with
+`MAGIC` followed by records made of a `HEADER` (length of the payload
+and arrival time of the stat) and the stat encoded as JSON.
+"""
+
+__all__ = ["Recorder", "iter_records", "replay"]
+import asyncio
+import itertools
+import logging
+import mmap
+import os
+import struct
+import time
+from aiotesttoolkit_remoteviewer import codec as _codec
+
+logger = logging.getLogger("remoteviewer.recording")
+
+MAGIC = b"RVREC01\n"
+HEADER = struct.Struct("<Id")
+SEGMENT_SUFFIX = ".seg"
+# Records decoded at once in a thread by `replay`
+REPLAY_BATCH = 1000
+
+
+class Recorder:
+    """Append stats to segment files.
+
+    Writes are buffered and periodically flushed and synced to disk by
+    `run`. A new segment is started once the current one is bigger than
+    `segment_size`, the previous one being synced and closed in a thread.
+
+    :param directory: directory of the recording
+    :param segment_size: max size of a segment in bytes
+    :param fsync_interval: seconds between two syncs to disk
+    :param codec: name of the JSON codec, see `codec`
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        segment_size: int = 64 * 1024 * 1024,
+        fsync_interval: float = 1.0,
+        codec: str = _codec.AUTO
+    ):
+        self.directory = directory
+        self.codec = _codec.get(codec)
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        self.records = 0
+        self._segment = 0
+        self._file = None
+        self._size = 0
+        # Futures of segments being closed in a thread
+        self._closing = set()
+        os.makedirs(directory, exist_ok=True)
+        # Never overwrite an existing recording
+        existing = _segments(directory)
+        if existing:
+            self._segment = (
+                int(os.path.basename(existing[-1])[: -len(SEGMENT_SUFFIX)]) + 1
+            )
+
+    def _open(self):
+        path = os.path.join(
+            self.directory, "{:08d}{}".format(self._segment, SEGMENT_SUFFIX)
+        )
+        self._segment += 1
+        self._file = open(path, "ab")
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+        logger.info("Recording to {}".format(path))
+
+    def write(self, stat: dict, arrival: float = None):
+        """Append a stat to the recording.
+
+        :param stat: stat received from the master reporter
+        :param arrival: time when the stat was received, defaults to now
+        """
+        payload = self.codec.dumps(stat)
+        if self._file is not None and self._size >= self.segment_size:
+            self._roll()
+        if self._file is None:
+            self._open()
+        if arrival is None:
+            arrival = time.time()
+        self._file.write(HEADER.pack(len(payload), arrival))
+        self._file.write(payload)
+        self._size += HEADER.size + len(payload)
+        self.records += 1
+
+    def _roll(self):
+        """Close the current segment without blocking the event loop."""
+        segment, self._file = self._file, None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _close(segment)
+            return
+        future = loop.run_in_executor(None, _close, segment)
+        self._closing.add(future)
+        future.add_done_callback(self._closing.discard)
+
+    async def sync(self):
+        """Flush buffered records and sync them to disk."""
+        if self._file is None:
+            return
+        self._file.flush()
+        # The segment may be closed by `write` meanwhile, sync a duplicate
+        # of its descriptor that stays open
+        fd = os.dup(self._file.fileno())
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, os.fsync, fd)
+        finally:
+            os.close(fd)
+
+    async def run(self):
+        """Periodically sync the recording to disk."""
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Failed to sync recording")
+
+    async def stop(self):
+        """Wait for segments being closed, then close the current one."""
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            _close(self._file)
+            self._file = None
+
+
+def _close(f):
+    """Sync a segment to disk and close it."""
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+def _segments(path: str) -> list:
+    """Sorted segment files of a recording, or the file itself."""
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(
+        os.path.join(path, _) for _ in os.listdir(path) if _.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def iter_records(path: str, *, codec: str = _codec.AUTO):
+    """Read all stats of a recording.
+
+    Segments are mapped in memory instead of being read, so recordings
+    don't have to fit in memory.
+
+    :param path: directory of the recording or a segment file
+    :param codec: name of the JSON codec, see `codec`
+    :return: generator of arrival time and stat
+    """
+    loads = _codec.get(codec).loads
+    for segment in _segments(path):
+        with open(segment, "rb") as f:
+            if os.fstat(f.fileno()).st_size <= len(MAGIC):
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[: len(MAGIC)] != MAGIC:
+                    raise ValueError("{} is not a recording".format(segment))
+                pos = len(MAGIC)
+                end = len(data)
+                while pos + HEADER.size <= end:
+                    length, arrival = HEADER.unpack_from(data, pos)
+                    pos += HEADER.size
+                    if pos + length > end:
+                        # Truncated by a crash while writing
+                        logger.warning("Truncated record in {}".format(segment))
+                        break
+                    yield arrival, loads(data[pos : pos + length])
+                    pos += length
+
+
+async def replay(
+    path: str, handle_stat, *, speed: float = 1.0, codec: str = _codec.AUTO
+):
+    """Send all stats of a recording to `handle_stat`.
+
+    Stats are sent at their original pace multiplied by `speed`. A speed
+    of `0` sends them as fast as possible. They are read and decoded by
+    batches in a thread, so the event loop keeps serving dashboards.
+
+    :param path: directory of the recording or a segment file
+    :param handle_stat: coroutine function receiving stats
+    :param speed: replay speed
+    :param codec: name of the JSON codec, see `codec`
+    """
+    loop = asyncio.get_event_loop()
+    records = iter_records(path, codec=codec)
+    first = None
+    start = loop.time()
+    count = 0
+    while True:
+        batch = await loop.run_in_executor(
+            None, list, itertools.islice(records, REPLAY_BATCH)
+        )
+        if not batch:
+            break
+        for arrival, stat in batch:
+            if first is None:
+                first = arrival
+            if speed > 0:
+                delay = (arrival - first) / speed - (loop.time() - start)
+                # Don't sleep for less than a millisecond
+                if delay > 1e-3:
+                    await asyncio.sleep(delay)
+            await handle_stat(stat)
+            count += 1
+    logger.info("Replayed {} stats from {}".format(count, path))
@@ -0,0 +1,128 @@
+"""Forward window summaries to a parent viewer.
+
+A viewer in relay mode receives slave reports and serves its own
+dashboards as usual, but also aggregates profiled calls in short
+partial windows that are sent to a parent viewer over a websocket. The
+parent merges them like partials of its own ingest workers: histograms
+are merged exactly, so totals and percentiles shown by the root are the
+same as if all slaves were connected to it.
+"""
+
+__all__ = ["Relay"]
+import asyncio
+import logging
+import aiohttp
+from aiotesttoolkit_remoteviewer import codec as _codec
+from aiotesttoolkit_remoteviewer.aggregation import Aggregator, encode_partial
+
+logger = logging.getLogger("remoteviewer.relay")
+
+# Seconds between two connection attempts, doubled up to the max
+_RETRY_DELAY = 1.0
+_RETRY_MAX_DELAY = 30.0
+
+
+class Relay:
+    """Aggregate stats and send partial windows to a parent viewer.
+
+    Stats handled by the pipeline are aggregated by the relay too. Pass
+    `handle_partial` to ingest workers instead of the one of the
+    pipeline. While the parent is unreachable, partials are kept merged
+    in the current window so memory doesn't grow.
+
+    :param upstream: base url of the parent viewer
+    :param pipeline: local `Pipeline`
+    :param interval: seconds between two partials
+    :param heartbeat: seconds between keepalive pings
+    :param codec: name of the codec encoding partials, see `codec`
+    :param token: token expected by the parent viewer
+    """
+
+    def __init__(
+        self,
+        upstream: str,
+        *,
+        pipeline,
+        interval: float = 0.25,
+        heartbeat: float = None,
+        codec: str = _codec.AUTO,
+        token: str = None
+    ):
+        if not upstream.endswith("/"):
+            upstream += "/"
+        self.url = upstream + "relay"
+        self.pipeline = pipeline
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.codec = _codec.get(codec, binary=True)
+        self.headers = {"Authorization": "Bearer {}".format(token)} if token else {}
+        self.aggregator = Aggregator(window=interval)
+        self.sent = 0
+        pipeline.on_record.append(self.aggregator.add)
+
+    async def handle_stat(self, stat):
+        """Handler to pass to `reporting.MasterReporter`.
+
+        :param stat: received stat
+        """
+        await self.pipeline.handle_stat(stat)
+
+    async def handle_partial(self, windows, others, *, root: bool = False):
+        """Handler to pass to `ingest.IngestWorkers`.
+
+        :param windows: partial `WindowStats`
+        :param others: received stats that are not profiled calls
+        :param root: see `Pipeline.handle_partial`
+        """
+        for _ in windows:
+            self.aggregator.merge(_)
+        await self.pipeline.handle_partial(windows, others, root=root)
+
+    async def run(self):
+        """Stay connected to the parent viewer and send partials."""
+        delay = _RETRY_DELAY
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    async with session.ws_connect(
+                        self.url, heartbeat=self.heartbeat, headers=self.headers
+                    ) as ws:
+                        logger.info("Connected to {}".format(self.url))
+                        delay = _RETRY_DELAY
+                        sender = asyncio.ensure_future(self._send(ws))
+                        try:
+                            # Nothing is expected, but reading handles
+                            # pongs and close frames
+                            async for _ in ws:
+                                pass
+                        finally:
+                            sender.cancel()
+                            await asyncio.gather(sender, return_exceptions=True)
+                    logger.warning("Disconnected from {}".format(self.url))
+                except (aiohttp.ClientError, OSError) as e:
+                    logger.warning("Failed to connect to {}: {}".format(self.url, e))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _RETRY_MAX_DELAY)
+
+    async def _send(self, ws):
+        while True:
+            await asyncio.sleep(self.interval)
+            start, windows = self.aggregator.flush()
+            if not windows:
+                continue
+            try:
+                await ws.send_bytes(encode_partial(start, windows, codec=self.codec))
+            except asyncio.CancelledError:
+                self._keep(windows)
+                raise
+            except Exception:
+                logger.debug("Failed to send partial", exc_info=True)
+                self._keep(windows)
+                await ws.close()
+                return
+            self.sent += 1
+
+    def _keep(self, windows):
+        # Merge unsent windows back to send them on the next connection
+        for _ in windows:
+            self.aggregator.merge(_)
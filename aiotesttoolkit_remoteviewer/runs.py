@@ -0,0 +1,427 @@
+"""Snapshots of benchmark runs and comparison of two runs.
+
+A `RunSummary` is built from the windows closed during a run: merged
+`WindowStats` of each scenario node, with their histograms, and the
+throughput curve. The configuration of the run, such as the number of
+bots and the server, comes from `options` stats sent by slaves with the
+options of their tests, and from the viewer configuration.
+
+Summaries are saved as JSON files in a `RunIndex` directory, with an
+`index.json` listing their id, tags and configuration so runs can be
+listed without reading them.
+
+Two runs are compared node by node. Their mean latencies are compared
+with a Welch t-test, computed from the count, sum and sum of squares of
+each node, so a delta is only reported as significant when it is
+unlikely to come from the variance of latencies.
+"""
+
+__all__ = ["RunSummary", "RunIndex", "welch_t_test", "compare"]
+import json
+import logging
+import math
+import os
+import re
+import time
+from aiotesttoolkit_remoteviewer import stats
+from aiotesttoolkit_remoteviewer.aggregation import WindowStats
+
+logger = logging.getLogger("remoteviewer.runs")
+
+INDEX_FILENAME = "index.json"
+# Run ids are used as file names
+_RUN_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,127}$")
+# Ids routed to other views of the api
+_RESERVED_IDS = frozenset(("compare",))
+# Keys of `options` stats that are not options
+_NOT_OPTIONS = frozenset((stats.SLAVE, stats.KIND, stats.TIMESTAMP))
+
+
+class RunSummary:
+    """Compact summary of a run, built from closed windows.
+
+    :param config: configuration of the run
+    :param max_points: max points of the throughput curve, consecutive
+                       points are merged when there are more
+    """
+
+    def __init__(self, *, config: dict = None, max_points: int = 720):
+        if max_points < 2:
+            raise ValueError("max_points must be at least 2")
+        self.config = dict(config or {})
+        self.max_points = max_points
+        self.started = None
+        self.ended = None
+        # Node name to `WindowStats` since the run started
+        self.nodes = {}
+        # Seconds per point and list of start, count and errors
+        self.step = None
+        self.throughput = []
+
+    def __bool__(self):
+        return self.started is not None
+
+    def reset(self):
+        """Start a new run, with the same configuration."""
+        self.started = None
+        self.ended = None
+        self.nodes = {}
+        self.step = None
+        self.throughput = []
+
+    def add_record(self, record: stats.StatRecord):
+        """Keep the test options reported by slaves.
+
+        :param record: `stats.StatRecord` of a received stat
+        """
+        if record.kind_name != stats.OPTIONS or not record.extra:
+            return
+        self.config.update(
+            (k, v) for k, v in record.extra.items() if k not in _NOT_OPTIONS
+        )
+
+    def add_window(self, start: float, length: float, windows: list):
+        """Merge a closed window.
+
+        :param start: start time of the window
+        :param length: length of the window in seconds
+        :param windows: `WindowStats` of the window
+        """
+        if not windows:
+            return
+        if self.started is None:
+            self.started = start
+            self.step = length
+        self.ended = start + length
+        count = 0
+        errors = 0
+        for _ in windows:
+            current = self.nodes.get(_.node, None)
+            if current is None:
+                current = self.nodes[_.node] = WindowStats(_.node)
+            current.merge(_)
+            count += _.count
+            errors += _.errors
+        index = int((start - self.started) // self.step)
+        last = self.throughput[-1] if self.throughput else None
+        if last is not None and int((last[0] - self.started) // self.step) == index:
+            last[1] += count
+            last[2] += errors
+            return
+        self.throughput.append([self.started + index * self.step, count, errors])
+        if len(self.throughput) > self.max_points:
+            self._halve()
+
+    def _halve(self):
+        # Merge pairs of points so the curve stays bounded
+        self.step *= 2
+        points = []
+        for point in self.throughput:
+            index = int((point[0] - self.started) // self.step)
+            if points and int((points[-1][0] - self.started) // self.step) == index:
+                points[-1][1] += point[1]
+                points[-1][2] += point[2]
+            else:
+                points.append([self.started + index * self.step, point[1], point[2]])
+        self.throughput = points
+
+    @property
+    def duration(self) -> float:
+        return self.ended - self.started if self else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "config": self.config,
+            "started": self.started,
+            "ended": self.ended,
+            "step": self.step,
+            "nodes": [_.to_dict() for _ in self.nodes.values()],
+            "throughput": self.throughput,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RunSummary":
+        result = cls(config=data.get("config", None))
+        result.started = data["started"]
+        result.ended = data["ended"]
+        result.step = data["step"]
+        for _ in data["nodes"]:
+            window = WindowStats.from_dict(_)
+            result.nodes[window.node] = window
+        result.throughput = [list(_) for _ in data["throughput"]]
+        return result
+
+
+class RunIndex:
+    """Directory of saved `RunSummary`, indexed by run id and tags.
+
+    :param directory: directory of the index
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._entries = {}
+        path = os.path.join(directory, INDEX_FILENAME)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._entries = {_["id"]: _ for _ in json.load(f)["runs"]}
+
+    def __contains__(self, run_id):
+        return run_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _write(self, filename: str, data: dict):
+        # Readers never see a partially written file
+        path = os.path.join(self.directory, filename)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    def _new_id(self, started: float) -> str:
+        base = time.strftime("%Y%m%d-%H%M%S", time.localtime(started or time.time()))
+        run_id = base
+        i = 1
+        while run_id in self._entries:
+            i += 1
+            run_id = "{}-{}".format(base, i)
+        return run_id
+
+    def save(self, summary: RunSummary, *, run_id: str = None, tags=None) -> dict:
+        """Save a run.
+
+        :param summary: `RunSummary` of the run
+        :param run_id: id of the run, defaults to its start time
+        :param tags: list of tags, such as a server version
+        :return: entry of the run in the index
+        """
+        if run_id is None:
+            run_id = self._new_id(summary.started)
+        elif (
+            not _RUN_ID.match(run_id)
+            or run_id + ".json" == INDEX_FILENAME
+            or run_id in _RESERVED_IDS
+        ):
+            raise ValueError("invalid run id {}".format(run_id))
+        elif run_id in self._entries:
+            raise ValueError("run {} already exists".format(run_id))
+        entry = {
+            "id": run_id,
+            "tags": sorted(set(tags or ())),
+            "started": summary.started,
+            "ended": summary.ended,
+            "count": sum(_.count for _ in summary.nodes.values()),
+            "config": summary.config,
+        }
+        self._write(run_id + ".json", summary.to_dict())
+        self._entries[run_id] = entry
+        self._write(INDEX_FILENAME, {"runs": list(self._entries.values())})
+        logger.info("Saved run {}".format(run_id))
+        return entry
+
+    def list(self, *, tags=None) -> list:
+        """Saved runs, most recent first.
+
+        :param tags: only list runs with all these tags
+        :return: list of entries
+        """
+        tags = set(tags or ())
+        return sorted(
+            (_ for _ in self._entries.values() if tags.issubset(_["tags"])),
+            key=lambda _: _["started"] or 0.0,
+            reverse=True,
+        )
+
+    def load(self, run_id: str) -> RunSummary:
+        """Read a saved run.
+
+        :param run_id: id of the run
+        :return: `RunSummary` of the run
+        :raises KeyError: if there is no such run
+        """
+        if run_id not in self._entries:
+            raise KeyError(run_id)
+        path = os.path.join(self.directory, run_id + ".json")
+        with open(path, "r", encoding="utf-8") as f:
+            return RunSummary.from_dict(json.load(f))
+
+    def compare(self, base_id: str, run_id: str, *, alpha: float = 0.05) -> dict:
+        """Compare two saved runs, see `compare`."""
+        result = compare(self.load(base_id), self.load(run_id), alpha=alpha)
+        result["base"]["id"] = base_id
+        result["run"]["id"] = run_id
+        return result
+
+
+def _betacf(a: float, b: float, x: float) -> float:
+    # Continued fraction of the incomplete beta function (modified Lentz)
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    result = d
+    for m in range(1, 300):
+        m2 = 2 * m
+        for numerator in (
+            m * (b - m) * x / ((a + m2 - 1.0) * (a + m2)),
+            -(a + m) * (a + b + m) * x / ((a + m2) * (a + m2 + 1.0)),
+        ):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            delta = c * d
+            result *= delta
+        if abs(delta - 1.0) < 1e-12:
+            break
+    return result
+
+
+def _betainc(a: float, b: float, x: float) -> float:
+    """Regularized incomplete beta function."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(
+        math.lgamma(a + b)
+        - math.lgamma(a)
+        - math.lgamma(b)
+        + a * math.log(x)
+        + b * math.log(1.0 - x)
+    )
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def welch_t_test(
+    n1: int, mean1: float, var1: float, n2: int, mean2: float, var2: float
+) -> tuple:
+    """Welch's t-test of the difference of two means.
+
+    :param n1: size of the first sample
+    :param mean1: mean of the first sample
+    :param var1: unbiased variance of the first sample
+    :param n2: size of the second sample
+    :param mean2: mean of the second sample
+    :param var2: unbiased variance of the second sample
+    :return: t statistic, degrees of freedom and two-sided p-value, or
+             `None` values if samples are too small
+    """
+    if n1 < 2 or n2 < 2:
+        return None, None, None
+    se1 = var1 / n1
+    se2 = var2 / n2
+    se = se1 + se2
+    if se <= 0.0:
+        # No variance at all, any difference is significant
+        return None, None, 1.0 if mean1 == mean2 else 0.0
+    t = (mean2 - mean1) / math.sqrt(se)
+    df = se * se / (se1 * se1 / (n1 - 1) + se2 * se2 / (n2 - 1))
+    p = _betainc(df / 2.0, 0.5, df / (df + t * t))
+    return t, df, min(max(p, 0.0), 1.0)
+
+
+def _variance(window: WindowStats) -> float:
+    if window.count < 2:
+        return 0.0
+    return max(
+        (window.sumsq - window.total * window.total / window.count)
+        / (window.count - 1),
+        0.0,
+    )
+
+
+def _delta(base, run):
+    if base is None or run is None:
+        return None, None
+    return run - base, (run - base) / base if base else None
+
+
+def _node_summary(window: WindowStats, duration: float) -> dict:
+    result = window.summary()
+    result["rate"] = window.count / duration if duration else None
+    result["error_rate"] = window.errors / window.count if window.count else None
+    return result
+
+
+def _throughput(summary: RunSummary) -> tuple:
+    rates = [_[1] / summary.step for _ in summary.throughput]
+    n = len(rates)
+    if not n:
+        return 0, None, 0.0
+    mean = sum(rates) / n
+    var = sum((_ - mean) ** 2 for _ in rates) / (n - 1) if n > 1 else 0.0
+    return n, mean, var
+
+
+def compare(base: RunSummary, run: RunSummary, *, alpha: float = 0.05) -> dict:
+    """Compare a run to a base run, node by node.
+
+    Mean latencies are compared with `welch_t_test`, and the throughput
+    with a Welch t-test on the points of the throughput curves. Deltas
+    of percentiles are reported as-is.
+
+    :param base: `RunSummary` of the base run
+    :param run: `RunSummary` of the compared run
+    :param alpha: significance level
+    :return: dict with the `base` and `run` config and duration, the
+             `throughput` and a list of `nodes`, each with the summaries
+             of the node in both runs, deltas, the t-test and if the
+             delta of the mean is `significant`
+    """
+    base_duration = base.duration
+    run_duration = run.duration
+    nodes = []
+    for name in sorted(set(base.nodes) | set(run.nodes), key=lambda _: _ or ""):
+        a = base.nodes.get(name, None)
+        b = run.nodes.get(name, None)
+        node = {
+            "node": name,
+            "base": _node_summary(a, base_duration) if a else None,
+            "run": _node_summary(b, run_duration) if b else None,
+            "t": None,
+            "df": None,
+            "p_value": None,
+            "significant": False,
+        }
+        for field in ("mean", "p50", "p95", "p99", "rate", "error_rate"):
+            node[field + "_delta"], node[field + "_change"] = _delta(
+                node["base"][field] if a else None, node["run"][field] if b else None
+            )
+        if a and b:
+            t, df, p = welch_t_test(
+                a.count, a.mean, _variance(a), b.count, b.mean, _variance(b)
+            )
+            node.update(
+                {
+                    "t": t,
+                    "df": df,
+                    "p_value": p,
+                    "significant": p is not None and p < alpha,
+                }
+            )
+        nodes.append(node)
+    base_n, base_rate, base_var = _throughput(base)
+    run_n, run_rate, run_var = _throughput(run)
+    t, df, p = welch_t_test(base_n, base_rate, base_var, run_n, run_rate, run_var)
+    delta, change = _delta(base_rate, run_rate)
+    return {
+        "alpha": alpha,
+        "base": {"config": base.config, "duration": base_duration},
+        "run": {"config": run.config, "duration": run_duration},
+        "throughput": {
+            "base": base_rate,
+            "run": run_rate,
+            "delta": delta,
+            "change": change,
+            "t": t,
+            "df": df,
+            "p_value": p,
+            "significant": p is not None and p < alpha,
+        },
+        "nodes": nodes,
+    }
@@ -0,0 +1,209 @@
+"""Server-Sent Events for passive dashboards.
+
+Dashboards on a wall screen only read. Instead of a websocket, a queue
+and an encoding per dashboard, they can read an event stream:
+
+- Messages published during a tick are batched, keeping only the last
+  one of each coalescing key.
+- At the end of the tick the batch is encoded once as a single event,
+  framed once for chunked HTTP/1.1 and once for HTTP/1.0, and the same
+  immutable `bytes` are written to the transport of every subscriber.
+  Nothing is encoded, copied or awaited per subscriber.
+- A subscriber whose transport buffers more than `max_buffer` bytes
+  can't keep up and is disconnected, so it doesn't use memory.
+
+New subscribers first receive the last message of each coalescing key,
+such as the last window of each node, so they don't start empty.
+"""
+
+__all__ = ["DEFAULT_METRICS", "EventStream"]
+import asyncio
+import logging
+import time
+from aiotesttoolkit_remoteviewer import codec as _codec
+from aiotesttoolkit_remoteviewer import stats
+
+logger = logging.getLogger("remoteviewer.sse")
+
+# Metrics sent to passive dashboards, raw stats are not
+DEFAULT_METRICS = ("window", "alert", "sampling", "clock", "callgraph")
+# Sent first, with the delay before reconnecting in milliseconds
+_PREAMBLE = b"retry: 1000\n\n"
+# Comment sent when there is nothing else, so proxies keep the stream
+_KEEPALIVE = b":\n\n"
+
+
+def _frames(event: bytes) -> tuple:
+    """Event as written to HTTP/1.0 and chunked HTTP/1.1 transports."""
+    return event, b"%x\r\n%s\r\n" % (len(event), event)
+
+
+class _Subscriber:
+    __slots__ = ("transport", "chunked", "done")
+
+    def __init__(self, transport, chunked, done):
+        self.transport = transport
+        self.chunked = chunked
+        self.done = done
+
+
+class EventStream:
+    """Broadcast batches of messages to passive dashboards.
+
+    Pass it to `Broadcaster.streams` so it receives published messages,
+    and run `run` in the background.
+
+    :param interval: seconds between two events
+    :param metrics: metrics of messages sent, others are ignored
+    :param max_buffer: bytes a subscriber can have pending before it is
+                       disconnected
+    :param keepalive: seconds without events before a keepalive comment
+    :param codec: name of the JSON codec, see `codec`
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float = 1.0,
+        metrics=DEFAULT_METRICS,
+        max_buffer: int = 1024 * 1024,
+        keepalive: float = 15.0,
+        codec: str = _codec.AUTO
+    ):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.interval = interval
+        self.metrics = frozenset(metrics)
+        self.max_buffer = max_buffer
+        self.keepalive = keepalive
+        self.codec = _codec.get(codec)
+        self.events = 0
+        self.dropped = 0
+        self._subscribers = []
+        # Messages of the current tick, keyed by coalescing key or sequence
+        self._pending = {}
+        self._seq = 0
+        # Last message of each coalescing key, for new subscribers
+        self._state = {}
+        self._snapshot = None
+        self._last = time.monotonic()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def publish(self, message, *, key=None, metric=None):
+        """Add a message to the current batch.
+
+        :param message: JSON serializable message or `stats.StatRecord`
+        :param key: coalescing key or `None`
+        :param metric: metric kind of the message
+        """
+        if metric not in self.metrics:
+            return
+        if isinstance(message, stats.StatRecord):
+            message = message.to_dict()
+        if key is None:
+            self._seq += 1
+            key = ("seq", self._seq)
+        else:
+            self._state[key] = message
+            self._snapshot = None
+        # Moved last so batches keep the order of messages
+        self._pending.pop(key, None)
+        self._pending[key] = message
+
+    def encode(self, messages: list) -> bytes:
+        """Encode messages as one event, a JSON array on a single line."""
+        return b"data: " + self.codec.dumps(messages) + b"\n\n"
+
+    def _write(self, frames: tuple):
+        # Same bytes for every subscriber, transports only keep references
+        alive = []
+        for subscriber in self._subscribers:
+            transport = subscriber.transport
+            if transport is None or transport.is_closing():
+                self._remove(subscriber)
+                continue
+            if transport.get_write_buffer_size() > self.max_buffer:
+                logger.warning("Dropping a passive dashboard that can't keep up")
+                self.dropped += 1
+                transport.close()
+                self._remove(subscriber)
+                continue
+            transport.write(frames[subscriber.chunked])
+            alive.append(subscriber)
+        self._subscribers = alive
+
+    def _prune(self):
+        # Find closed transports without writing
+        alive = []
+        for subscriber in self._subscribers:
+            if subscriber.transport is None or subscriber.transport.is_closing():
+                self._remove(subscriber)
+            else:
+                alive.append(subscriber)
+        self._subscribers = alive
+
+    def _remove(self, subscriber):
+        if not subscriber.done.done():
+            subscriber.done.set_result(None)
+
+    def flush(self) -> bool:
+        """Send the current batch to all subscribers.
+
+        :return: if an event was sent
+        """
+        now = time.monotonic()
+        if not self._pending:
+            if now - self._last >= self.keepalive:
+                self._last = now
+                self._write(_frames(_KEEPALIVE))
+            else:
+                self._prune()
+            return False
+        messages = list(self._pending.values())
+        self._pending = {}
+        self._last = now
+        self.events += 1
+        if self._subscribers:
+            self._write(_frames(self.encode(messages)))
+        return True
+
+    def snapshot(self) -> bytes:
+        """First event of new subscribers, last message of each key."""
+        if self._snapshot is None:
+            self._snapshot = _PREAMBLE + self.encode(list(self._state.values()))
+        return self._snapshot
+
+    async def handle(self, transport, *, chunked: bool):
+        """Send events to a subscriber until it disconnects.
+
+        The response must have been started, with its `snapshot`.
+
+        :param transport: transport of the HTTP connection
+        :param chunked: if the response uses chunked transfer encoding
+        """
+        subscriber = _Subscriber(
+            transport, chunked, asyncio.get_event_loop().create_future()
+        )
+        self._subscribers.append(subscriber)
+        try:
+            await subscriber.done
+        finally:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def close(self):
+        """Stop all subscribers."""
+        for _ in self._subscribers:
+            self._remove(_)
+        self._subscribers = []
+
+    async def run(self):
+        """Send a batch every `interval` seconds forever."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to send events")
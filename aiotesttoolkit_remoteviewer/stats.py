@@ -0,0 +1,206 @@
+"""Accessors for stats received from `reporting.MasterReporter`.
+
+Stats are dicts forwarded as-is by the master reporter. All knowledge of
+their keys is kept here so other modules don't depend on it.
+
+Internally, stats are converted once to a `StatRecord`: a fixed set of
+slots where names of slaves, scenario nodes and kinds are interned into
+integer ids of `SYMBOLS`. Bot ids are kept as strings: a long test
+keeps starting new bots and `SYMBOLS` never forgets a name. Records are
+converted back to dicts only when sent to clients.
+"""
+
+__all__ = [
+    "SYMBOLS",
+    "StatRecord",
+    "record",
+    "slave",
+    "kind",
+    "node",
+    "parent",
+    "bot",
+    "timestamp",
+    "has_timestamp",
+    "duration",
+    "is_error",
+]
+import time
+from aiotesttoolkit_remoteviewer.protocol import SymbolTable
+
+SLAVE = "slave"
+KIND = "type"
+NODE = "name"
+TIMESTAMP = "time"
+DURATION = "duration"
+ERROR = "error"
+PARENT = "parent"
+BOT = "bot"
+# Kinds of stats sent when a bot enters and exits a scenario node
+ENTER = "enter"
+EXIT = "exit"
+# Kind of stats sent by slaves with the options of their tests
+OPTIONS = "options"
+
+
+def slave(stat: dict) -> str:
+    """Identifier of the slave that reported a stat, or `None`."""
+    return stat.get(SLAVE, None)
+
+
+def kind(stat: dict) -> str:
+    """Kind of stat, for example `profile` or `info`, or `None`."""
+    return stat.get(KIND, None)
+
+
+def node(stat: dict) -> str:
+    """Name of the scenario node that produced a stat, or `None`."""
+    return stat.get(NODE, None)
+
+
+def parent(stat: dict) -> str:
+    """Name of the scenario node that called the one of a stat, or `None`."""
+    return stat.get(PARENT, None)
+
+
+def bot(stat: dict) -> str:
+    """Identifier of the bot, unique for a slave, or `None`."""
+    value = stat.get(BOT, None)
+    return str(value) if value is not None else None
+
+
+def timestamp(stat: dict) -> float:
+    """Time when a stat was produced, defaults to now."""
+    return float(stat.get(TIMESTAMP, None) or time.time())
+
+
+def has_timestamp(stat: dict) -> bool:
+    """If a stat has the time when it was produced."""
+    return bool(stat.get(TIMESTAMP, None))
+
+
+def duration(stat: dict) -> float:
+    """Duration in seconds of a profiled call, or `None` if not profiled."""
+    value = stat.get(DURATION, None)
+    return float(value) if value is not None else None
+
+
+def is_error(stat: dict) -> bool:
+    """If a stat reports a failed call."""
+    return bool(stat.get(ERROR, False))
+
+
+# Names of slaves, scenario nodes and kinds, shared by all records
+SYMBOLS = SymbolTable()
+# Empty name, for a missing key
+SYMBOLS.intern(None)
+_KEYS = frozenset((SLAVE, KIND, NODE, PARENT, BOT, TIMESTAMP, DURATION, ERROR))
+
+
+class StatRecord:
+    """Compact internal representation of a stat.
+
+    :param slave: id of the slave in `SYMBOLS`
+    :param kind: id of the kind in `SYMBOLS`
+    :param node: id of the scenario node in `SYMBOLS`
+    :param parent: id of the calling scenario node in `SYMBOLS`
+    :param bot: identifier of the bot, or `None`
+    :param time: time when the stat was produced
+    :param duration: duration in seconds of a profiled call, or `None`
+    :param error: if the stat reports a failed call
+    :param extra: dict of other keys, only kept for stats that are not
+                  profiled calls
+    """
+
+    __slots__ = (
+        "slave",
+        "kind",
+        "node",
+        "parent",
+        "bot",
+        "time",
+        "duration",
+        "error",
+        "extra",
+    )
+
+    def __init__(
+        self,
+        *,
+        slave: int = 0,
+        kind: int = 0,
+        node: int = 0,
+        parent: int = 0,
+        bot: str = None,
+        time: float = 0.0,
+        duration: float = None,
+        error: bool = False,
+        extra: dict = None
+    ):
+        self.slave = slave
+        self.kind = kind
+        self.node = node
+        self.parent = parent
+        self.bot = bot
+        self.time = time
+        self.duration = duration
+        self.error = error
+        self.extra = extra
+
+    @property
+    def slave_name(self) -> str:
+        return SYMBOLS.names[self.slave] or None
+
+    @property
+    def kind_name(self) -> str:
+        return SYMBOLS.names[self.kind] or None
+
+    @property
+    def node_name(self) -> str:
+        return SYMBOLS.names[self.node] or None
+
+    @property
+    def parent_name(self) -> str:
+        return SYMBOLS.names[self.parent] or None
+
+    def to_dict(self) -> dict:
+        """Convert back to a stat as received, to send it to clients."""
+        result = dict(self.extra) if self.extra else {}
+        for key, symbol in (
+            (SLAVE, self.slave),
+            (KIND, self.kind),
+            (NODE, self.node),
+            (PARENT, self.parent),
+        ):
+            if symbol:
+                result[key] = SYMBOLS.names[symbol]
+        if self.bot is not None:
+            result[BOT] = self.bot
+        result[TIMESTAMP] = self.time
+        if self.duration is not None:
+            result[DURATION] = self.duration
+        if self.error:
+            result[ERROR] = True
+        return result
+
+
+def record(stat: dict) -> StatRecord:
+    """Convert a received stat to a `StatRecord`.
+
+    :param stat: stat received from the master reporter
+    :return: record
+    """
+    value = duration(stat)
+    extra = None
+    if value is None:
+        extra = {k: v for k, v in stat.items() if k not in _KEYS} or None
+    return StatRecord(
+        slave=SYMBOLS.intern(slave(stat)),
+        kind=SYMBOLS.intern(kind(stat)),
+        node=SYMBOLS.intern(node(stat)),
+        parent=SYMBOLS.intern(parent(stat)),
+        bot=bot(stat),
+        time=timestamp(stat),
+        duration=value,
+        error=is_error(stat),
+        extra=extra,
+    )
@@ -0,0 +1,162 @@
+"""Route messages only to the clients subscribed to them.
+
+A subscription selects slaves, scenario nodes and metric kinds. Each
+dimension is a list of patterns, either an exact value or a prefix
+ending with `*`. An empty list selects everything.
+"""
+
+__all__ = ["DIMENSIONS", "SubscriptionIndex"]
+
+DIMENSIONS = ("slaves", "nodes", "metrics")
+
+
+class _KeyIndex:
+    """Index of subscribers for one dimension."""
+
+    __slots__ = ("exact", "prefixes", "lengths", "wildcard")
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = {}
+        # Lengths of registered prefixes, so a lookup only checks those
+        self.lengths = {}
+        self.wildcard = set()
+
+    def add(self, client, patterns):
+        if not patterns:
+            self.wildcard.add(client)
+            return
+        for pattern in patterns:
+            if pattern.endswith("*"):
+                prefix = pattern[:-1]
+                self.prefixes.setdefault(prefix, set()).add(client)
+                self.lengths[len(prefix)] = self.lengths.get(len(prefix), 0) + 1
+            else:
+                self.exact.setdefault(pattern, set()).add(client)
+
+    def remove(self, client, patterns):
+        if not patterns:
+            self.wildcard.discard(client)
+            return
+        for pattern in patterns:
+            if pattern.endswith("*"):
+                prefix = pattern[:-1]
+                _discard(self.prefixes, prefix, client)
+                self.lengths[len(prefix)] -= 1
+                if not self.lengths[len(prefix)]:
+                    del self.lengths[len(prefix)]
+            else:
+                _discard(self.exact, pattern, client)
+
+    def match(self, value: str) -> set:
+        """Clients whose patterns match a value, without wildcards."""
+        result = self.exact.get(value, None) or ()
+        for length in self.lengths:
+            if length <= len(value):
+                clients = self.prefixes.get(value[:length], None)
+                if clients:
+                    result = set(result) | clients
+        return result
+
+
+def _discard(index: dict, key, client):
+    clients = index.get(key, None)
+    if clients is not None:
+        clients.discard(client)
+        if not clients:
+            del index[key]
+
+
+class SubscriptionIndex:
+    """Index from slaves, nodes and metrics to subscribed clients.
+
+    Clients are grouped by the dimensions they don't filter. Finding the
+    subscribers of a message costs time proportional to the number of
+    matching subscribers, plus the clients whose patterns match one
+    dimension of the message, not to the number of clients.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._indexes = {_: _KeyIndex() for _ in DIMENSIONS}
+        # Mask of dimensions without patterns to clients
+        self._wildcards = {}
+
+    def __len__(self):
+        return len(self._clients)
+
+    def subscribe(self, client, **patterns):
+        """Replace the subscription of a client.
+
+        :param client: subscribed client
+        :param slaves: patterns of slaves, all if empty
+        :param nodes: patterns of scenario nodes, all if empty
+        :param metrics: patterns of metric kinds, all if empty
+        """
+        subscription = {}
+        for dimension in DIMENSIONS:
+            values = patterns.get(dimension, None) or ()
+            if not isinstance(values, (list, tuple)):
+                raise ValueError("{} must be a list of patterns".format(dimension))
+            subscription[dimension] = tuple(str(_) for _ in values)
+        self.unsubscribe(client)
+        mask = 0
+        for i, dimension in enumerate(DIMENSIONS):
+            values = subscription[dimension]
+            self._indexes[dimension].add(client, values)
+            if not values:
+                mask |= 1 << i
+        self._wildcards.setdefault(mask, set()).add(client)
+        self._clients[client] = subscription
+
+    def unsubscribe(self, client):
+        """Remove a client from the index.
+
+        :param client: subscribed client
+        """
+        subscription = self._clients.pop(client, None)
+        if subscription is None:
+            return
+        mask = 0
+        for i, dimension in enumerate(DIMENSIONS):
+            values = subscription[dimension]
+            self._indexes[dimension].remove(client, values)
+            if not values:
+                mask |= 1 << i
+        _discard(self._wildcards, mask, client)
+
+    def match(self, *, slave: str = None, node: str = None, metric: str = None):
+        """Clients subscribed to a message.
+
+        A dimension set to `None` doesn't apply to the message and is
+        matched by every client.
+
+        :param slave: slave that produced the message
+        :param node: scenario node of the message
+        :param metric: metric kind of the message
+        :return: list of clients
+        """
+        applied = 0
+        matches = []
+        for i, (dimension, value) in enumerate(zip(DIMENSIONS, (slave, node, metric))):
+            if value is not None:
+                applied |= 1 << i
+                index = self._indexes[dimension]
+                matches.append((index.match(value), index.wildcard))
+        # Clients without patterns for the dimensions of the message
+        result = []
+        for mask, clients in self._wildcards.items():
+            if mask & applied == applied:
+                result.extend(clients)
+        # Others match at least one dimension with a pattern, check the
+        # remaining ones
+        candidates = set()
+        for clients, _ in matches:
+            candidates.update(clients)
+        for client in candidates:
+            for clients, wildcard in matches:
+                if client not in clients and client not in wildcard:
+                    break
+            else:
+                result.append(client)
+        return result
@@ -0,0 +1,429 @@
+"""Timeline of profiled spans with levels of detail.
+
+Each profiled call is a span `[time - duration, time)` on the lane of the
+bot that made it, or of its scenario node when stats have no bot id.
+Spans can't all be sent to browsers, so they are indexed at several
+zoom levels when received:
+
+- Each level cuts time into buckets `factor` times wider than the
+  previous level. Per lane and bucket it keeps the number of spans
+  overlapping the bucket, their min and max duration and their errors.
+  A level only keeps its last `buckets` buckets, so fine levels cover
+  the last seconds and coarse ones the whole retention.
+- A span overlapping more than a few buckets of a level is kept as-is
+  by that level instead. There can't be many of them per lane, as they
+  are each longer than a few buckets.
+- The shortest spans are also kept as-is in a bounded ring, for the
+  finest zoom.
+
+Lanes without spans left, of bots that are gone, are freed when pruning
+and their numbers reused, so bots coming and going don't add lanes.
+
+A viewport query picks the finest level whose buckets are at least as
+wide as a pixel and that still covers the viewport, so it reads a
+bounded number of buckets whatever the number of spans of the run.
+
+Buckets use about 170 bytes per lane and bucket with spans, so at most
+`levels * buckets` of them per lane: 1.7 MB per lane with the defaults,
+much less for lanes whose spans don't fill every bucket. Short spans
+kept as-is use 41 bytes each.
+"""
+
+__all__ = ["SpanIndex"]
+import bisect
+import collections
+import logging
+import math
+from array import array
+from aiotesttoolkit_remoteviewer import stats
+
+logger = logging.getLogger("remoteviewer.timeline")
+
+# Max buckets a span is counted in, longer spans are kept as-is
+_MAX_BUCKETS = 8
+# Spans may arrive a bit out of order from different slaves
+_SLACK = 1.0
+# Lanes are only looked for spans left once there are this many
+_MIN_LANES = 1024
+
+
+class _Keys:
+    """Read-only sequence of the search keys of a `_SpanRing`."""
+
+    __slots__ = ("ring",)
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def __len__(self):
+        return self.ring.size
+
+    def __getitem__(self, i):
+        ring = self.ring
+        return ring.keys[(ring.start + i) % ring.capacity]
+
+
+class _SpanRing:
+    """Fixed-capacity ring of spans stored in `array` columns.
+
+    Spans are appended in arrival order. Their search key is their end
+    time, raised to the one of the previous span so keys stay sorted.
+    """
+
+    __slots__ = (
+        "capacity",
+        "keys",
+        "starts",
+        "ends",
+        "lanes",
+        "nodes",
+        "errors",
+        "start",
+        "size",
+    )
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.keys = array("d", bytes(8 * capacity))
+        self.starts = array("d", bytes(8 * capacity))
+        self.ends = array("d", bytes(8 * capacity))
+        self.lanes = array("l", bytes(array("l").itemsize * capacity))
+        self.nodes = array("l", bytes(array("l").itemsize * capacity))
+        self.errors = array("b", bytes(capacity))
+        self.start = 0
+        self.size = 0
+
+    def append(self, start: float, end: float, lane: int, node: int, error: bool):
+        key = end
+        if self.size:
+            last = self.keys[(self.start + self.size - 1) % self.capacity]
+            if key < last:
+                key = last
+        if self.size < self.capacity:
+            pos = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            pos = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.keys[pos] = key
+        self.starts[pos] = start
+        self.ends[pos] = end
+        self.lanes[pos] = lane
+        self.nodes[pos] = node
+        self.errors[pos] = error
+
+    def scan(self, since: float, until: float, lanes: range):
+        """Spans of some lanes overlapping `[since, until)`.
+
+        :return: generator of start, end, lane, node and error
+        """
+        i = bisect.bisect_left(_Keys(self), since)
+        while i < self.size:
+            pos = (self.start + i) % self.capacity
+            if self.keys[pos] >= until + _SLACK:
+                return
+            i += 1
+            start = self.starts[pos]
+            end = self.ends[pos]
+            lane = self.lanes[pos]
+            if lane in lanes and end >= since and start < until:
+                yield start, end, lane, self.nodes[pos], bool(self.errors[pos])
+
+
+class _Level:
+    """Buckets and long spans of one zoom level.
+
+    :param width: width of buckets in seconds
+    :param retention: seconds of buckets kept
+    """
+
+    __slots__ = ("width", "retention", "buckets", "oldest", "long")
+
+    def __init__(self, width: float, retention: float):
+        self.width = width
+        self.retention = retention
+        # Bucket index to lane to count, min, max and errors
+        self.buckets = {}
+        # Index of the oldest bucket kept, `None` until pruned
+        self.oldest = None
+        # Lane to deque of spans too long for buckets
+        self.long = {}
+
+    def covers(self, since: float) -> bool:
+        """If buckets are kept from a time."""
+        return self.oldest is None or since >= self.oldest * self.width
+
+    def add(self, start, end, lane, node, error, weight):
+        width = self.width
+        if end - start > _MAX_BUCKETS * width:
+            spans = self.long.get(lane, None)
+            if spans is None:
+                spans = self.long[lane] = collections.deque()
+            spans.append((start, end, node, error))
+            return
+        value = end - start
+        buckets = self.buckets
+        first = int(start // width)
+        if self.oldest is not None and first < self.oldest:
+            # Already pruned
+            first = self.oldest
+        for index in range(first, int(end // width) + 1):
+            lanes = buckets.get(index, None)
+            if lanes is None:
+                lanes = buckets[index] = {}
+            bucket = lanes.get(lane, None)
+            if bucket is None:
+                lanes[lane] = [weight, value, value, weight if error else 0]
+                continue
+            bucket[0] += weight
+            if value < bucket[1]:
+                bucket[1] = value
+            if value > bucket[2]:
+                bucket[2] = value
+            if error:
+                bucket[3] += weight
+
+    def prune(self, now: float, horizon: float):
+        """Forget buckets older than the retention of the level.
+
+        :param now: current time
+        :param horizon: time before which long spans are forgotten
+        """
+        buckets = self.buckets
+        # Buckets before this one ended before the retention
+        stop = int((now - self.retention) // self.width)
+        if self.oldest is None:
+            self.oldest = min(buckets, default=stop)
+        if stop - self.oldest > len(buckets):
+            for index in [_ for _ in buckets if _ < stop]:
+                del buckets[index]
+        else:
+            for index in range(self.oldest, stop):
+                buckets.pop(index, None)
+        self.oldest = max(self.oldest, stop)
+        for lane in list(self.long):
+            spans = self.long[lane]
+            while spans and spans[0][1] < horizon:
+                spans.popleft()
+            if not spans:
+                del self.long[lane]
+
+    def long_spans(self, since: float, until: float, lanes: range):
+        for lane in lanes:
+            for start, end, node, error in self.long.get(lane, ()):
+                if end >= since and start < until:
+                    yield start, end, lane, node, error
+
+
+class SpanIndex:
+    """Index of profiled spans answering viewport queries.
+
+    :param base: width in seconds of buckets of the finest level
+    :param factor: ratio between widths of two consecutive levels
+    :param levels: number of levels
+    :param capacity: max number of short spans kept as-is
+    :param retention: seconds of history kept
+    :param buckets: max buckets of history kept per lane by each level
+    """
+
+    def __init__(
+        self,
+        *,
+        base: float = 0.01,
+        factor: int = 4,
+        levels: int = 10,
+        capacity: int = 1000000,
+        retention: float = 3600.0,
+        buckets: int = 1024
+    ):
+        if base <= 0:
+            raise ValueError("base must be positive")
+        if factor < 2:
+            raise ValueError("factor must be at least 2")
+        if levels <= 0:
+            raise ValueError("levels must be positive")
+        if buckets <= 0:
+            raise ValueError("buckets must be positive")
+        self.retention = retention
+        self.levels = []
+        for i in range(0, levels):
+            width = base * factor**i
+            self.levels.append(_Level(width, min(retention, buckets * width)))
+        self.spans = _SpanRing(capacity)
+        self.added = 0
+        # Bounds of indexed spans
+        self.first = None
+        self.last = None
+        # Slave symbol and bot, or node symbol, to lane number
+        self._lanes = {}
+        self.lane_names = []
+        # Numbers of lanes freed, to reuse
+        self._free = set()
+        # Number of lanes from which `prune` frees lanes
+        self._collect = _MIN_LANES
+
+    def _lane(self, record) -> int:
+        key = (record.slave, record.bot or record.node)
+        lane = self._lanes.get(key, None)
+        if lane is None:
+            names = (
+                stats.SYMBOLS.names[record.slave],
+                record.bot or stats.SYMBOLS.names[record.node],
+            )
+            name = "/".join(_ for _ in names if _) or None
+            if self._free:
+                lane = self._free.pop()
+                self.lane_names[lane] = name
+            else:
+                lane = len(self.lane_names)
+                self.lane_names.append(name)
+            self._lanes[key] = lane
+        return lane
+
+    def _free_lanes(self):
+        """Free lanes without buckets, long spans or spans in the ring."""
+        # The ring is full or starts at 0
+        used = set(self.spans.lanes[: self.spans.size])
+        for level in self.levels:
+            used.update(level.long)
+            for row in level.buckets.values():
+                used.update(row)
+        for key, lane in list(self._lanes.items()):
+            if lane not in used:
+                del self._lanes[key]
+                self.lane_names[lane] = None
+                self._free.add(lane)
+        # Looking for them again is only worth it once lanes doubled
+        self._collect = max(2 * len(self._lanes), _MIN_LANES)
+
+    def add(self, record: stats.StatRecord, *, weight: int = 1) -> bool:
+        """Index the span of a profiled call.
+
+        :param record: `stats.StatRecord` of the stat
+        :param weight: number of spans it stands for, when sampled
+        :return: if the stat was a profiled call
+        """
+        value = record.duration
+        if value is None:
+            return False
+        end = record.time
+        start = end - value
+        lane = self._lane(record)
+        for level in self.levels:
+            level.add(start, end, lane, record.node, record.error, weight)
+        if value <= _MAX_BUCKETS * self.levels[0].width:
+            self.spans.append(start, end, lane, record.node, record.error)
+        self.added += 1
+        if self.first is None or start < self.first:
+            self.first = start
+        if self.last is None or end > self.last:
+            self.last = end
+        return True
+
+    def prune(self, now: float):
+        """Forget what ended more than `retention` seconds ago."""
+        horizon = now - self.retention
+        for level in self.levels:
+            level.prune(now, horizon)
+        if self.first is not None and self.first < horizon:
+            self.first = horizon
+        if len(self._lanes) >= self._collect:
+            self._free_lanes()
+
+    def query(
+        self,
+        since: float,
+        until: float,
+        *,
+        width: int = 1000,
+        first: int = 0,
+        rows: int = 50,
+        limit: int = 20000
+    ) -> dict:
+        """Spans or buckets of a viewport.
+
+        :param since: start time
+        :param until: end time
+        :param width: width of the viewport in pixels
+        :param first: first lane
+        :param rows: number of lanes
+        :param limit: max number of spans and buckets returned
+        :return: dict with the `level` used, `null` for spans as-is, its
+                 bucket `step`, the `lanes`, `buckets` as lists of lane,
+                 start, count, min, max and errors, `spans` as lists of
+                 lane, start, end, node and error, and if it was
+                 `truncated` to the limit
+        """
+        if until <= since:
+            raise ValueError("until must be after since")
+        if width <= 0 or rows <= 0 or limit <= 0:
+            raise ValueError("width, rows and limit must be positive")
+        lanes = range(max(first, 0), min(first + rows, len(self.lane_names)))
+        pixel = (until - since) / width
+        result = {
+            "since": since,
+            "until": until,
+            "level": None,
+            "step": None,
+            "lanes": [[_, self.lane_names[_]] for _ in lanes if _ not in self._free],
+            "buckets": [],
+            "spans": [],
+            "truncated": False,
+        }
+        if self.last is None:
+            return result
+        names = stats.SYMBOLS.names
+
+        def add_spans(spans):
+            for start, end, lane, node, error in spans:
+                if len(result["spans"]) + len(result["buckets"]) >= limit:
+                    result["truncated"] = True
+                    return False
+                result["spans"].append([lane, start, end, names[node] or None, error])
+            return True
+
+        finest = self.levels[0]
+        if pixel < finest.width:
+            # Spans as-is, unless there are too many of them
+            if add_spans(self.spans.scan(since, until, lanes)) and add_spans(
+                finest.long_spans(since, until, lanes)
+            ):
+                return result
+            result["spans"] = []
+            result["truncated"] = False
+        # Nothing is kept before the retention of the coarsest levels
+        kept = since if self.first is None else max(since, self.first)
+        level = next(
+            (_ for _ in self.levels if _.width >= pixel and _.covers(kept)),
+            self.levels[-1],
+        )
+        result["level"] = self.levels.index(level)
+        result["step"] = level.width
+        # Only read buckets that can have spans
+        since = max(since, self.first - level.width)
+        until = min(until, self.last + level.width)
+        first_index = int(since // level.width)
+        if level.oldest is not None:
+            first_index = max(first_index, level.oldest)
+        last_index = int(math.ceil(until / level.width))
+        if last_index - first_index > len(level.buckets):
+            # Fewer buckets kept than in the viewport
+            indexes = sorted(_ for _ in level.buckets if first_index <= _ < last_index)
+        else:
+            indexes = range(first_index, last_index)
+        buckets = result["buckets"]
+        rows = [(_, level.buckets.get(_, None)) for _ in indexes]
+        rows = [_ for _ in rows if _[1]]
+        for lane in lanes:
+            for index, row in rows:
+                bucket = row.get(lane, None)
+                if bucket is None:
+                    continue
+                if len(buckets) >= limit:
+                    result["truncated"] = True
+                    return result
+                buckets.append([lane, index * level.width] + bucket)
+        add_spans(level.long_spans(since, until, lanes))
+        return result
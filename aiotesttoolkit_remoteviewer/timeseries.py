@@ -0,0 +1,257 @@
+__all__ = ["RingBuffer", "TimeSeriesStore"]
+import bisect
+import logging
+from array import array
+
+logger = logging.getLogger("remoteviewer.timeseries")
+
+# Samples allocated for a new series, doubled until the capacity
+_INITIAL_SIZE = 64
+
+
+class _Times:
+    """Read-only sequence of the timestamps of a `RingBuffer`, oldest first."""
+
+    __slots__ = ("ring",)
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def __len__(self):
+        return self.ring._size
+
+    def __getitem__(self, i):
+        ring = self.ring
+        return ring.times[(ring._start + i) % ring.capacity]
+
+
+class RingBuffer:
+    """Fixed-capacity time series stored in two `array` columns.
+
+    Columns start small and double until they hold `capacity` samples, so
+    a series only uses memory for samples it received. Once full, each new
+    sample overwrites the oldest one. Timestamps are kept in ascending
+    order so a time range is found by binary search: a sample older than
+    the last one is recorded with the timestamp of the last one.
+
+    Samples are also identified by their sequence number, the number of
+    samples appended before them. A range of sequence numbers stays valid
+    while new samples are appended, samples overwritten in the meantime
+    are simply skipped when reading.
+
+    :param capacity: max number of samples
+    """
+
+    __slots__ = ("capacity", "times", "values", "appended", "_start", "_size")
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        size = min(capacity, _INITIAL_SIZE)
+        self.times = array("d", bytes(8 * size))
+        self.values = array("d", bytes(8 * size))
+        self.appended = 0
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, t: float, value: float):
+        """Record a sample.
+
+        :param t: timestamp in seconds
+        :param value: value of the sample
+        """
+        if self._size:
+            last = self.times[(self._start + self._size - 1) % self.capacity]
+            if t < last:
+                t = last
+        if self._size < self.capacity:
+            # Nothing was overwritten yet, samples start at 0
+            pos = self._size
+            if pos == len(self.times):
+                grow = min(2 * pos, self.capacity) - pos
+                self.times.extend(array("d", bytes(8 * grow)))
+                self.values.extend(array("d", bytes(8 * grow)))
+            self._size += 1
+        else:
+            pos = self._start
+            self._start = (self._start + 1) % self.capacity
+        self.times[pos] = t
+        self.values[pos] = value
+        self.appended += 1
+
+    def index(self, t: float) -> int:
+        """Position of the first sample recorded at or after a time.
+
+        :param t: timestamp in seconds
+        :return: position between 0 and `len(self)`
+        """
+        return bisect.bisect_left(_Times(self), t)
+
+    def positions(self, since: float = None, until: float = None) -> tuple:
+        """Sequence numbers of samples recorded in `[since, until)`.
+
+        :param since: start time or `None` for the oldest sample
+        :param until: end time or `None` for the newest sample
+        :return: first and last (excluded) sequence numbers
+        """
+        lo = self.index(since) if since is not None else 0
+        hi = self.index(until) if until is not None else self._size
+        first = self.appended - self._size
+        return first + lo, first + max(lo, hi)
+
+    def read(self, start: int, stop: int) -> tuple:
+        """Copy samples by sequence numbers.
+
+        :param start: first sequence number
+        :param stop: last sequence number, excluded
+        :return: timestamps and values, as two `array`
+        """
+        times = array("d")
+        values = array("d")
+        start = max(start, self.appended - self._size)
+        stop = min(stop, self.appended)
+        if start >= stop:
+            return times, values
+        # Range maps to at most two contiguous physical ranges
+        first = (self._start + start - (self.appended - self._size)) % self.capacity
+        last = first + stop - start
+        if last <= self.capacity:
+            times.extend(self.times[first:last])
+            values.extend(self.values[first:last])
+        else:
+            last -= self.capacity
+            times.extend(self.times[first:])
+            times.extend(self.times[:last])
+            values.extend(self.values[first:])
+            values.extend(self.values[:last])
+        return times, values
+
+    def range(self, since: float = None, until: float = None) -> tuple:
+        """Copy samples recorded in `[since, until)`.
+
+        :param since: start time or `None` for the oldest sample
+        :param until: end time or `None` for the newest sample
+        :return: timestamps and values, as two `array`
+        """
+        return self.read(*self.positions(since, until))
+
+    def chunks(self, since: float = None, until: float = None, size: int = 8192):
+        """Copy samples recorded in `[since, until)` by chunks.
+
+        Each chunk is copied when it is requested, so this can be consumed
+        across awaits without copying the whole range upfront.
+
+        :param since: start time or `None` for the oldest sample
+        :param until: end time or `None` for the newest sample
+        :param size: max number of samples per chunk
+        :return: generator of timestamps and values, as two `array`
+        """
+        start, stop = self.positions(since, until)
+        while start < stop:
+            times, values = self.read(start, min(start + size, stop))
+            start += size
+            if times:
+                yield times, values
+
+    def downsample(self, since: float, until: float, step: float) -> tuple:
+        """Average samples recorded in `[since, until)` per step.
+
+        Steps without samples are omitted.
+
+        :param since: start time
+        :param until: end time
+        :param step: length of steps in seconds
+        :return: start time and mean value of steps, as two `array`
+        """
+        if step <= 0:
+            raise ValueError("step must be positive")
+        result_times = array("d")
+        result_values = array("d")
+        current = None
+        total = 0.0
+        count = 0
+        for times, values in self.chunks(since, until):
+            for t, value in zip(times, values):
+                bucket = since + ((t - since) // step) * step
+                if bucket != current:
+                    if count:
+                        result_times.append(current)
+                        result_values.append(total / count)
+                    current = bucket
+                    total = 0.0
+                    count = 0
+                total += value
+                count += 1
+        if count:
+            result_times.append(current)
+            result_values.append(total / count)
+        return result_times, result_values
+
+
+class TimeSeriesStore:
+    """Bounded in-memory store of one `RingBuffer` per metric.
+
+    Samples of new metrics are dropped once there are `max_metrics`
+    metrics, so nodes named from user data can't use all the memory.
+
+    :param capacity: max number of samples per metric
+    :param max_metrics: max number of metrics
+    """
+
+    def __init__(self, *, capacity: int = 100000, max_metrics: int = 1000):
+        if max_metrics <= 0:
+            raise ValueError("max_metrics must be positive")
+        self.capacity = capacity
+        self.max_metrics = max_metrics
+        # Samples dropped because there were too many metrics
+        self.rejected = 0
+        self._series = {}
+
+    def __contains__(self, metric):
+        return metric in self._series
+
+    def __getitem__(self, metric) -> RingBuffer:
+        return self._series[metric]
+
+    def metrics(self) -> list:
+        return list(self._series)
+
+    def append(self, metric: str, t: float, value: float):
+        """Record a sample.
+
+        :param metric: name of the metric
+        :param t: timestamp in seconds
+        :param value: value of the sample
+        """
+        series = self._series.get(metric, None)
+        if series is None:
+            if len(self._series) >= self.max_metrics:
+                if not self.rejected:
+                    logger.warning(
+                        "More than {} metrics, samples of new ones are "
+                        "dropped".format(self.max_metrics)
+                    )
+                self.rejected += 1
+                return
+            series = self._series[metric] = RingBuffer(self.capacity)
+        series.append(t, value)
+
+    def backfill(self, since: float, until: float, *, points: int) -> dict:
+        """Downsampled copy of all metrics for late-joining clients.
+
+        :param since: start time
+        :param until: end time
+        :param points: max number of points per metric
+        :return: dict of metric to `{"t": [...], "v": [...]}`
+        """
+        step = max((until - since) / max(points, 1), 1e-3)
+        result = {}
+        for metric, series in self._series.items():
+            times, values = series.downsample(since, until, step)
+            if times:
+                result[metric] = {"t": times.tolist(), "v": values.tolist()}
+        return result
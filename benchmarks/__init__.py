@@ -0,0 +1,380 @@
+"""Benchmark the viewer under synthetic load.
+
+The viewer is started as a separate process with `python -m
+aiotesttoolkit_remoteviewer`, so the real `run` pipeline is measured.
+Synthetic slaves report to it while headless consumers, some of them
+slow, are connected to its websocket, and passive ones to its event
+stream. Its `/metrics` endpoint is scraped for ingest throughput, CPU
+and memory. Results are written as JSON so they can be compared between
+commits.
+
+Codecs are compared with `--codec`, and without the viewer by
+`benchmarks.codec`.
+
+Run from the repository root as: python -m benchmarks --help
+"""
+
+__all__ = ["scrape", "run", "main"]
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+from aiotesttoolkit_remoteviewer.aggregation import Histogram
+from benchmarks.consumers import Consumer, PassiveConsumer
+from benchmarks.slaves import Slaves
+
+logger = logging.getLogger("remoteviewer.benchmarks")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """[service]
+port = {service_port}
+base-url = /
+jinja2-templates-dir = {templates}
+static_dir = {static}
+
+[master]
+host = 127.0.0.1
+port = {master_port}
+ingest-workers = {ingest_workers}
+
+[websocket]
+queue-size = {queue_size}
+queue-policy = {queue_policy}
+
+[aggregation]
+window = {window}
+
+[codec]
+json = {codec}
+partial = {partial_codec}
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+            )
+            .decode("ascii")
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summary(histogram: Histogram) -> dict:
+    p50, p95, p99, p100 = histogram.percentiles(50, 95, 99, 100)
+    return {"count": histogram.count, "p50": p50, "p95": p95, "p99": p99, "max": p100}
+
+
+async def scrape(session, url: str) -> dict:
+    """Read metrics of the viewer.
+
+    :param session: `aiohttp.ClientSession`
+    :param url: url of the `/metrics` endpoint
+    :return: dict of sample name, with labels, to value
+    """
+    async with session.get(url) as response:
+        text = await response.text()
+    result = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            result[name] = float(value)
+    return result
+
+
+async def _wait_for(session, url: str, timeout: float):
+    until = time.monotonic() + timeout
+    while True:
+        try:
+            return await scrape(session, url)
+        except aiohttp.ClientError:
+            if time.monotonic() > until:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run(
+    *,
+    slaves: int = 1,
+    bots: int = 10,
+    rate: float = 100.0,
+    nodes: int = 10,
+    consumers: int = 4,
+    slow_consumers: int = 1,
+    slow_delay: float = 0.05,
+    passive_consumers: int = 0,
+    binary: bool = False,
+    ingest_workers: int = 0,
+    queue_size: int = 1000,
+    queue_policy: str = "drop-oldest",
+    window: float = 1.0,
+    codec: str = "auto",
+    partial_codec: str = "auto",
+    probe_interval: float = 0.1,
+    warmup: float = 2.0,
+    duration: float = 10.0
+) -> dict:
+    """Run one benchmark.
+
+    :param slaves: number of slave processes
+    :param bots: number of bots per slave
+    :param rate: profiled calls per second per bot
+    :param nodes: number of distinct scenario nodes
+    :param consumers: number of consumers reading as fast as possible
+    :param slow_consumers: number of consumers waiting after each message
+    :param slow_delay: seconds slow consumers wait after each message
+    :param passive_consumers: number of consumers of the event stream
+    :param binary: if consumers negotiate the binary protocol
+    :param ingest_workers: number of ingest worker processes of the viewer
+    :param queue_size: max messages pending per client
+    :param queue_policy: policy of client queues
+    :param window: aggregation window in seconds
+    :param codec: JSON codec of the viewer
+    :param partial_codec: codec of partials sent by ingest workers
+    :param probe_interval: seconds between two probes sent by a bot
+    :param warmup: seconds of load before measuring
+    :param duration: seconds of load measured
+    :return: results
+    """
+    params = dict(locals())
+    service_port = _free_port()
+    master_port = _free_port()
+    base = "http://127.0.0.1:{}/".format(service_port)
+    with tempfile.TemporaryDirectory() as config_dir:
+        with open(os.path.join(config_dir, "config.cnf"), "w") as f:
+            f.write(
+                CONFIG.format(
+                    service_port=service_port,
+                    master_port=master_port,
+                    templates=os.path.join(ROOT, "etc", "templates"),
+                    static=os.path.join(ROOT, "static"),
+                    ingest_workers=ingest_workers,
+                    queue_size=queue_size,
+                    queue_policy=queue_policy,
+                    window=window,
+                    codec=codec,
+                    partial_codec=partial_codec,
+                )
+            )
+        viewer = subprocess.Popen(
+            [sys.executable, "-m", "aiotesttoolkit_remoteviewer", config_dir],
+            cwd=ROOT,
+        )
+        load = Slaves(
+            slaves,
+            host="127.0.0.1",
+            port=master_port,
+            bots=bots,
+            rate=rate,
+            nodes=nodes,
+            probe_interval=probe_interval,
+            duration=warmup + duration + 1.0,
+        )
+        clients = [Consumer(base + "ws", binary=binary) for _ in range(0, consumers)]
+        slow = [
+            Consumer(base + "ws", delay=slow_delay, binary=binary)
+            for _ in range(0, slow_consumers)
+        ]
+        passive = [
+            PassiveConsumer(base + "events") for _ in range(0, passive_consumers)
+        ]
+        try:
+            # Passive consumers can be thousands
+            connector = aiohttp.TCPConnector(limit=0)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                await _wait_for(session, base + "metrics", timeout=30.0)
+                tasks = [
+                    asyncio.ensure_future(_.run(session))
+                    for _ in clients + slow + passive
+                ]
+                load.start()
+                await asyncio.sleep(warmup)
+
+                for _ in clients + slow + passive:
+                    _.reset()
+                before = await scrape(session, base + "metrics")
+                start = time.monotonic()
+                peak_rss = before.get("process_resident_memory_bytes", 0.0)
+                peak_lag = 0.0
+                while time.monotonic() - start < duration:
+                    await asyncio.sleep(min(1.0, duration))
+                    sample = await scrape(session, base + "metrics")
+                    peak_rss = max(
+                        peak_rss, sample.get("process_resident_memory_bytes", 0.0)
+                    )
+                    peak_lag = max(
+                        peak_lag, sample["remoteviewer_event_loop_lag_seconds"]
+                    )
+                after = sample
+                elapsed = time.monotonic() - start
+
+                for _ in tasks:
+                    _.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            load.stop()
+            viewer.terminate()
+            viewer.wait()
+
+    def delta(name):
+        return after.get(name, 0.0) - before.get(name, 0.0)
+
+    def consumers_results(group):
+        latency = Histogram()
+        window_lag = Histogram()
+        for _ in group:
+            latency.merge(_.latency)
+            window_lag.merge(_.window_lag)
+        return {
+            "count": len(group),
+            "messages_per_second": sum(_.messages for _ in group)
+            / elapsed
+            / max(len(group), 1),
+            "latency": _summary(latency),
+            "window_lag": _summary(window_lag),
+        }
+
+    def dropped(sample):
+        return sum(
+            value
+            for name, value in sample.items()
+            if name.startswith("remoteviewer_client_dropped_total")
+        )
+
+    ingested = delta("remoteviewer_stats_ingested_total")
+    return {
+        "commit": _commit(),
+        "time": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "ingest": {
+            "target_per_second": load.target_rate,
+            "stats": ingested,
+            "per_second": ingested / elapsed,
+            "handle_stat_seconds_mean": delta("remoteviewer_handle_stat_seconds_sum")
+            / max(delta("remoteviewer_handle_stat_seconds_count"), 1),
+            "encode_seconds_mean": delta("remoteviewer_encode_seconds_total")
+            / max(delta("remoteviewer_encoded_total"), 1),
+        },
+        "consumers": consumers_results(clients),
+        "slow_consumers": consumers_results(slow),
+        "passive_consumers": consumers_results(passive),
+        "dropped": dropped(after) - dropped(before),
+        "cpu": {
+            "seconds": delta("process_cpu_seconds_total"),
+            "percent": 100.0 * delta("process_cpu_seconds_total") / elapsed,
+        },
+        "memory": {"rss_max": peak_rss},
+        "event_loop_lag_max": peak_lag,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="benchmarks", description="Benchmark the viewer under synthetic load"
+    )
+    parser.add_argument("--slaves", type=int, default=1, help="slave processes")
+    parser.add_argument("--bots", type=int, default=10, help="bots per slave")
+    parser.add_argument(
+        "--rate", type=float, default=100.0, help="profiled calls per second per bot"
+    )
+    parser.add_argument("--nodes", type=int, default=10, help="scenario nodes")
+    parser.add_argument("--consumers", type=int, default=4, help="fast consumers")
+    parser.add_argument("--slow-consumers", type=int, default=1, help="slow consumers")
+    parser.add_argument(
+        "--slow-delay",
+        type=float,
+        default=0.05,
+        help="seconds slow consumers wait after each message",
+    )
+    parser.add_argument(
+        "--passive-consumers",
+        type=int,
+        default=0,
+        help="consumers of the event stream",
+    )
+    parser.add_argument("--binary", action="store_true", help="use the binary protocol")
+    parser.add_argument(
+        "--ingest-workers", type=int, default=0, help="ingest worker processes"
+    )
+    parser.add_argument(
+        "--queue-size", type=int, default=1000, help="max messages pending per client"
+    )
+    parser.add_argument(
+        "--queue-policy", type=str, default="drop-oldest", help="client queue policy"
+    )
+    parser.add_argument(
+        "--window", type=float, default=1.0, help="aggregation window in seconds"
+    )
+    parser.add_argument(
+        "--codec", type=str, default="auto", help="JSON codec of the viewer"
+    )
+    parser.add_argument(
+        "--partial-codec",
+        type=str,
+        default="auto",
+        help="codec of partials sent by ingest workers",
+    )
+    parser.add_argument(
+        "--probe-interval",
+        type=float,
+        default=0.1,
+        help="seconds between two latency probes per bot",
+    )
+    parser.add_argument(
+        "--warmup", type=float, default=2.0, help="seconds before measuring"
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured")
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, help="file to write results to"
+    )
+    args = parser.parse_args(args=argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    results = asyncio.get_event_loop().run_until_complete(
+        run(
+            slaves=args.slaves,
+            bots=args.bots,
+            rate=args.rate,
+            nodes=args.nodes,
+            consumers=args.consumers,
+            slow_consumers=args.slow_consumers,
+            slow_delay=args.slow_delay,
+            passive_consumers=args.passive_consumers,
+            binary=args.binary,
+            ingest_workers=args.ingest_workers,
+            queue_size=args.queue_size,
+            queue_policy=args.queue_policy,
+            window=args.window,
+            codec=args.codec,
+            partial_codec=args.partial_codec,
+            probe_interval=args.probe_interval,
+            warmup=args.warmup,
+            duration=args.duration,
+        )
+    )
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,6 @@
+# Run parent directory as: python -m benchmarks
+from benchmarks import main
+
+# Guarded so slave processes can import this module
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Benchmark the codecs installed for the viewer.
+
+Typical messages are encoded and decoded by each installed backend of
+`aiotesttoolkit_remoteviewer.codec`: window summaries and raw stats sent
+to dashboards, and big partial windows sent by ingest workers and
+relays. The event loop lag caused by decoding partials on the loop or in
+a thread is measured too. Results are written as JSON.
+
+Run from the repository root as: python -m benchmarks.codec --help
+"""
+
+__all__ = ["messages", "measure", "offload", "run", "main"]
+import argparse
+import asyncio
+import json
+import platform
+import random
+import time
+from aiotesttoolkit_remoteviewer import codec
+from aiotesttoolkit_remoteviewer.aggregation import (
+    WindowStats,
+    decode_partial,
+    decode_partial_async,
+    encode_partial,
+)
+
+
+def messages(*, nodes: int = 10, calls: int = 1000, seed: int = 1) -> dict:
+    """Typical messages by kind.
+
+    :param nodes: number of scenario nodes
+    :param calls: profiled calls per node in partial windows
+    :param seed: seed of random durations
+    :return: dict of kind to message
+    """
+    rng = random.Random(seed)
+    windows = []
+    for i in range(0, nodes):
+        window = WindowStats("node-{}".format(i))
+        for _ in range(0, calls):
+            window.add(rng.lognormvariate(-3.0, 1.0))
+        windows.append(window)
+    return {
+        "window": dict(windows[0].summary(), type="window", start=1e9, window=1.0),
+        "stat": {
+            "type": "profile",
+            "slave": "slave-1",
+            "node": "node-1",
+            "bot": "bot-42",
+            "timestamp": 1e9,
+            "duration": 0.0123,
+        },
+        "partial": {
+            "start": 1e9,
+            "windows": [_.to_dict() for _ in windows],
+            "stats": [],
+        },
+    }
+
+
+def measure(backend, message, *, duration: float = 1.0) -> dict:
+    """Encode and decode a message for some time.
+
+    :param backend: `codec.Codec`
+    :param message: message to encode
+    :param duration: seconds spent encoding, then decoding
+    :return: size and operations per second
+    """
+    dumps = backend.dumps
+    loads = backend.loads
+
+    def rate(func, arg):
+        count = 0
+        start = time.perf_counter()
+        while True:
+            for _ in range(0, 100):
+                func(arg)
+            count += 100
+            elapsed = time.perf_counter() - start
+            if elapsed >= duration:
+                return count / elapsed
+
+    data = dumps(message)
+    return {
+        "bytes": len(data),
+        "encode_per_second": rate(dumps, message),
+        "decode_per_second": rate(loads, data),
+    }
+
+
+async def offload(data: bytes, *, count: int = 20, threaded: bool) -> dict:
+    """Event loop lag while decoding partials.
+
+    :param data: encoded partial
+    :param count: number of partials decoded
+    :param threaded: decode in a thread with `decode_partial_async`
+    :return: max and mean lag of a 1ms ticker in seconds
+    """
+    loop = asyncio.get_event_loop()
+    lags = []
+
+    async def ticker():
+        while True:
+            before = loop.time()
+            await asyncio.sleep(0.001)
+            lags.append(loop.time() - before - 0.001)
+
+    task = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    for _ in range(0, count):
+        if threaded:
+            await decode_partial_async(data, offload_size=0)
+        else:
+            decode_partial(data)
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return {
+        "seconds": elapsed,
+        "lag_max": max(lags),
+        "lag_mean": sum(lags) / len(lags),
+    }
+
+
+def run(
+    *,
+    nodes: int = 10,
+    calls: int = 1000,
+    duration: float = 1.0,
+    count: int = 20,
+    offload_nodes: int = 200
+) -> dict:
+    """Run the benchmark for all installed backends.
+
+    :param nodes: number of scenario nodes
+    :param calls: profiled calls per node in partial windows
+    :param duration: seconds spent on each measure
+    :param count: partials decoded to measure the event loop lag
+    :param offload_nodes: number of scenario nodes in these partials
+    :return: results
+    """
+    params = dict(locals())
+    samples = messages(nodes=nodes, calls=calls)
+    results = {}
+    for name, backend in sorted(codec.CODECS.items()):
+        results[name] = {
+            kind: measure(backend, message, duration=duration)
+            for kind, message in samples.items()
+            # Dashboards only receive JSON
+            if backend.text or kind == "partial"
+        }
+    # Gain over the standard library
+    for name, result in results.items():
+        for kind, values in result.items():
+            base = results["json"][kind]
+            values["encode_speedup"] = (
+                values["encode_per_second"] / base["encode_per_second"]
+            )
+            values["decode_speedup"] = (
+                values["decode_per_second"] / base["decode_per_second"]
+            )
+
+    loop = asyncio.get_event_loop()
+    big = messages(nodes=offload_nodes, calls=calls)["partial"]
+    data = encode_partial(
+        1e9,
+        [WindowStats.from_dict(_) for _ in big["windows"]],
+        codec=codec.get(binary=True),
+    )
+    return {
+        "time": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "codecs": results,
+        "offload": {
+            "codec": codec.get(binary=True).name,
+            "bytes": len(data),
+            "inline": loop.run_until_complete(
+                offload(data, count=count, threaded=False)
+            ),
+            "thread": loop.run_until_complete(
+                offload(data, count=count, threaded=True)
+            ),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="benchmarks.codec", description="Benchmark the installed codecs"
+    )
+    parser.add_argument("--nodes", type=int, default=10, help="scenario nodes")
+    parser.add_argument(
+        "--calls", type=int, default=1000, help="calls per node in partials"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=1.0, help="seconds of each measure"
+    )
+    parser.add_argument(
+        "--count", type=int, default=20, help="partials decoded to measure lag"
+    )
+    parser.add_argument(
+        "--offload-nodes",
+        type=int,
+        default=200,
+        help="scenario nodes in partials decoded to measure lag",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, help="file to write results to"
+    )
+    args = parser.parse_args(args=argv)
+
+    results = run(
+        nodes=args.nodes,
+        calls=args.calls,
+        duration=args.duration,
+        count=args.count,
+        offload_nodes=args.offload_nodes,
+    )
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
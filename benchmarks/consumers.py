@@ -0,0 +1,109 @@
+"""Headless dashboards connected to the viewer."""
+
+__all__ = ["Consumer", "PassiveConsumer"]
+import asyncio
+import json
+import logging
+import time
+import aiohttp
+from aiotesttoolkit_remoteviewer import protocol
+from aiotesttoolkit_remoteviewer.aggregation import Histogram
+from benchmarks.slaves import probe_time
+
+logger = logging.getLogger("remoteviewer.benchmarks.consumers")
+
+
+class Consumer:
+    """Dashboard receiving messages without rendering them.
+
+    Latency of probes, from the bot sending them to this consumer
+    receiving them, and lag of window summaries, from the end of the
+    window to their reception, are recorded in histograms.
+
+    :param url: url of the websocket
+    :param delay: seconds to wait after each message, to be a slow client
+    :param binary: if the binary protocol is negotiated
+    """
+
+    def __init__(self, url: str, *, delay: float = 0.0, binary: bool = False):
+        self.url = url
+        self.delay = delay
+        self.binary = binary
+        self.messages = 0
+        self.latency = Histogram()
+        self.window_lag = Histogram()
+
+    def reset(self):
+        """Forget what was received, after warming up."""
+        self.messages = 0
+        self.latency = Histogram()
+        self.window_lag = Histogram()
+
+    async def run(self, session):
+        """Receive messages until the connection is closed.
+
+        :param session: `aiohttp.ClientSession` to connect with
+        """
+        decoder = protocol.Decoder()
+        async with session.ws_connect(
+            self.url,
+            protocols=[protocol.BINARY if self.binary else protocol.JSON],
+        ) as ws:
+            async for message in ws:
+                if message.type not in (
+                    aiohttp.WSMsgType.TEXT,
+                    aiohttp.WSMsgType.BINARY,
+                ):
+                    continue
+                now = time.time()
+                decoded = decoder.decode(message.data)
+                if decoded is None:
+                    continue
+                self.messages += 1
+                kind = decoded.get("type", None)
+                if kind == "window":
+                    self.window_lag.add(now - decoded["start"] - decoded["window"])
+                elif kind != "backfill":
+                    sent = probe_time(decoded)
+                    if sent is not None:
+                        self.latency.add(now - sent)
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+
+
+class PassiveConsumer:
+    """Passive dashboard reading the event stream.
+
+    Lag of window summaries, from the end of the window to their
+    reception, is recorded in a histogram. Probes are raw stats, that
+    are not in the event stream, so `latency` stays empty.
+
+    :param url: url of the event stream
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.messages = 0
+        self.latency = Histogram()
+        self.window_lag = Histogram()
+
+    def reset(self):
+        """Forget what was received, after warming up."""
+        self.messages = 0
+        self.latency = Histogram()
+        self.window_lag = Histogram()
+
+    async def run(self, session):
+        """Receive events until the connection is closed.
+
+        :param session: `aiohttp.ClientSession` to connect with
+        """
+        async with session.get(self.url) as response:
+            async for line in response.content:
+                if not line.startswith(b"data: "):
+                    continue
+                now = time.time()
+                for message in json.loads(line[6:]):
+                    self.messages += 1
+                    if message.get("type", None) == "window":
+                        self.window_lag.add(now - message["start"] - message["window"])
@@ -0,0 +1,170 @@
+"""Synthetic slaves reporting to the viewer like real bots do.
+
+Each slave is a process with its own `reporting.SlaveReporter` and a
+number of bots calling profiled scenario nodes at a fixed rate. Bots also
+send probes with `reporter.info`: raw messages carrying their send time,
+used by consumers to measure the ingest to client latency.
+"""
+
+__all__ = ["PROBE_PREFIX", "probe_time", "Slaves"]
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import time
+
+logger = logging.getLogger("remoteviewer.benchmarks.slaves")
+
+PROBE_PREFIX = "remoteviewer-probe:"
+# Bots never sleep less than this between two batches of calls
+_MIN_TICK = 0.01
+
+
+def probe_time(message) -> float:
+    """Send time of a probe found in a received raw message.
+
+    :param message: decoded message
+    :return: time in seconds or `None` if this is not a probe
+    """
+    for value in message.values():
+        if isinstance(value, str) and value.startswith(PROBE_PREFIX):
+            return float(value[len(PROBE_PREFIX) :])
+    return None
+
+
+async def _bot(scenario_nodes, rate: float, probe_interval: float, reporter, until):
+    loop = asyncio.get_event_loop()
+    tick = max(1.0 / rate, _MIN_TICK)
+    per_tick = rate * tick
+    nodes = itertools.cycle(scenario_nodes)
+    credit = 0.0
+    next_tick = loop.time()
+    next_probe = next_tick
+    while next_tick < until:
+        credit += per_tick
+        while credit >= 1.0:
+            await next(nodes)()
+            credit -= 1.0
+        if next_tick >= next_probe:
+            await reporter.info("{}{!r}".format(PROBE_PREFIX, time.time()))
+            next_probe += probe_interval
+        next_tick += tick
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+
+def _run_slave(
+    host: str,
+    port: int,
+    *,
+    bots: int,
+    rate: float,
+    nodes: int,
+    probe_interval: float,
+    duration: float
+):
+    """Entry point of a slave process."""
+    from aiotesttoolkit import reporting, _scenario
+
+    async def main():
+        reporter = reporting.MetaReporter()
+        reporter.add_reporter(reporting.SlaveReporter(host, port))
+        await reporter.start()
+        scenario = _scenario.Scenario()
+
+        def create_node(name):
+            @scenario.with_node(name)
+            @reporter.profile()
+            async def node():
+                await asyncio.sleep(0)
+
+            return node
+
+        scenario_nodes = [create_node("node{}".format(_)) for _ in range(0, nodes)]
+        until = asyncio.get_event_loop().time() + duration
+        await asyncio.gather(
+            *(
+                _bot(scenario_nodes, rate, probe_interval, reporter, until)
+                for _ in range(0, bots)
+            )
+        )
+        await reporter.stop()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(main())
+    except KeyboardInterrupt:
+        pass
+
+
+class Slaves:
+    """Processes running synthetic slaves.
+
+    :param count: number of slaves
+    :param host: host of the master reporter
+    :param port: port of the master reporter
+    :param bots: number of bots per slave
+    :param rate: profiled calls per second per bot
+    :param nodes: number of distinct scenario nodes
+    :param probe_interval: seconds between two probes sent by a bot
+    :param duration: seconds bots run for
+    """
+
+    def __init__(
+        self,
+        count: int,
+        *,
+        host: str,
+        port: int,
+        bots: int,
+        rate: float,
+        nodes: int,
+        probe_interval: float,
+        duration: float
+    ):
+        if count <= 0 or bots <= 0 or rate <= 0:
+            raise ValueError("count, bots and rate must be positive")
+        self.count = count
+        self.host = host
+        self.port = port
+        self.bots = bots
+        self.rate = rate
+        self.nodes = nodes
+        self.probe_interval = probe_interval
+        self.duration = duration
+        self._processes = []
+
+    @property
+    def target_rate(self) -> float:
+        """Profiled calls per second sent by all slaves."""
+        return self.count * self.bots * self.rate
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        for _ in range(0, self.count):
+            process = context.Process(
+                target=_run_slave,
+                args=(self.host, self.port),
+                kwargs={
+                    "bots": self.bots,
+                    "rate": self.rate,
+                    "nodes": self.nodes,
+                    "probe_interval": self.probe_interval,
+                    "duration": self.duration,
+                },
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        logger.info(
+            "Started {} slaves with {} bots at {}/s".format(
+                self.count, self.bots, self.rate
+            )
+        )
+
+    def stop(self):
+        for _ in self._processes:
+            _.terminate()
+        for _ in self._processes:
+            _.join()
+        self._processes = []
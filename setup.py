@@ -35,8 +35,15 @@ setup(
     description="aiotesttoolkit-remoteviewer",
     long_description=readme(),
     long_description_content_type="text/markdown",
-    packages=find_packages(exclude=["tests"]),
-    install_requires=["aiohttp", "aiohttp-cors", "aiohttp-jinja2", "websockets"],
+    packages=find_packages(exclude=["tests", "benchmarks"]),
+    install_requires=["aiohttp", "aiohttp-cors", "aiohttp-jinja2"],
+    extras_require={
+        "uvloop": ["uvloop"],
+        "psutil": ["psutil"],
+        "brotli": ["brotli"],
+        "orjson": ["orjson"],
+        "msgpack": ["msgpack>=1.0"],
+    },
     test_suite="test",
     tests_require=["nose", "nose-cover3"],
     include_package_data=True,
@@ -1,9 +1,624 @@
-$(document).ready(function() {
-    var root = $("#messages");
-    var socket = new WebSocket("ws://127.0.0.1:8082");
-    socket.onopen = function (event) {
+// Live dashboard.
+//
+// Messages received from the websocket are only buffered, they are
+// applied once per animation frame. Charts are drawn on canvas and the
+// log keeps a bounded ring of rows of which only the visible ones are
+// in the DOM, so the page keeps up with high update rates.
+(function() {
+    "use strict";
+
+    // Points kept per chart series
+    var HISTORY = 300;
+    // Rows kept in the log
+    var LOG_CAPACITY = 10000;
+    var ROW_HEIGHT = 20;
+    // Height of lanes and width of labels of the timeline
+    var TIMELINE_ROW = 16;
+    var TIMELINE_LEFT = 120;
+    var COLORS = ["#007bff", "#28a745", "#dc3545", "#ffc107", "#17a2b8", "#6f42c1", "#fd7e14", "#20c997", "#e83e8c", "#6c757d"];
+
+    function Ring(capacity) {
+        this.capacity = capacity;
+        this.items = new Array(capacity);
+        this.start = 0;
+        this.length = 0;
+    }
+
+    Ring.prototype.push = function(item) {
+        if (this.length < this.capacity) {
+            this.items[(this.start + this.length) % this.capacity] = item;
+            this.length++;
+        } else {
+            this.items[this.start] = item;
+            this.start = (this.start + 1) % this.capacity;
+        }
+    };
+
+    Ring.prototype.get = function(i) {
+        return this.items[(this.start + i) % this.capacity];
+    };
+
+    Ring.prototype.last = function() {
+        return this.length ? this.get(this.length - 1) : null;
+    };
+
+    // Line chart of several series sharing the same time axis
+    function Chart(canvas) {
+        this.canvas = canvas;
+        this.context = canvas.getContext("2d");
+        this.series = {};
+        this.dirty = true;
+    }
+
+    Chart.prototype.add = function(name, t, value) {
+        var series = this.series[name];
+        if (!series) {
+            series = this.series[name] = {
+                "ring": new Ring(HISTORY),
+                "color": COLORS[Object.keys(this.series).length % COLORS.length]
+            };
+        }
+        var last = series.ring.last();
+        if (last && last.t === t) {
+            last.v = value;
+        } else {
+            series.ring.push({"t": t, "v": value});
+        }
+        this.dirty = true;
+    };
+
+    Chart.prototype.draw = function(format) {
+        if (!this.dirty) {
+            return;
+        }
+        this.dirty = false;
+        var canvas = this.canvas;
+        var ratio = window.devicePixelRatio || 1;
+        var width = canvas.clientWidth;
+        var height = canvas.clientHeight;
+        if (canvas.width !== width * ratio || canvas.height !== height * ratio) {
+            canvas.width = width * ratio;
+            canvas.height = height * ratio;
+        }
+        var ctx = this.context;
+        ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+        ctx.clearRect(0, 0, width, height);
+
+        var names = Object.keys(this.series);
+        var minT = Infinity, maxT = -Infinity, maxV = 0;
+        names.forEach(function(name) {
+            var ring = this.series[name].ring;
+            for (var i = 0; i < ring.length; i++) {
+                var point = ring.get(i);
+                minT = Math.min(minT, point.t);
+                maxT = Math.max(maxT, point.t);
+                maxV = Math.max(maxV, point.v);
+            }
+        }, this);
+        if (minT === Infinity) {
+            return;
+        }
+        var left = 60, bottom = 20, top = 10;
+        var spanT = Math.max(maxT - minT, 1);
+        maxV = maxV || 1;
+        var x = function(t) { return left + (t - minT) / spanT * (width - left - 10); };
+        var y = function(v) { return top + (1 - v / maxV) * (height - top - bottom); };
+
+        ctx.strokeStyle = "#dee2e6";
+        ctx.fillStyle = "#6c757d";
+        ctx.font = "11px sans-serif";
+        ctx.lineWidth = 1;
+        for (var g = 0; g <= 4; g++) {
+            var value = maxV * g / 4;
+            ctx.beginPath();
+            ctx.moveTo(left, y(value));
+            ctx.lineTo(width - 10, y(value));
+            ctx.stroke();
+            ctx.fillText(format(value), 4, y(value) + 4);
+        }
+
+        var legend = left;
+        names.forEach(function(name) {
+            var series = this.series[name];
+            var ring = series.ring;
+            ctx.strokeStyle = series.color;
+            ctx.lineWidth = 1.5;
+            ctx.beginPath();
+            for (var i = 0; i < ring.length; i++) {
+                var point = ring.get(i);
+                if (i === 0) {
+                    ctx.moveTo(x(point.t), y(point.v));
+                } else {
+                    ctx.lineTo(x(point.t), y(point.v));
+                }
+            }
+            ctx.stroke();
+            ctx.fillStyle = series.color;
+            ctx.fillText(name, legend, height - 4);
+            legend += ctx.measureText(name).width + 12;
+        }, this);
+    };
+
+    // Log of messages, only visible rows are in the DOM
+    function Log(container) {
+        this.container = container;
+        this.rows = new Ring(LOG_CAPACITY);
+        this.spacer = document.createElement("div");
+        this.content = document.createElement("div");
+        this.content.className = "log-rows";
+        container.appendChild(this.spacer);
+        container.appendChild(this.content);
+        this.dirty = true;
+        this.follow = true;
+        var self = this;
+        container.addEventListener("scroll", function() {
+            self.follow = container.scrollTop + container.clientHeight >= container.scrollHeight - ROW_HEIGHT;
+            self.dirty = true;
+        });
+    }
+
+    Log.prototype.add = function(text) {
+        this.rows.push(text);
+        this.dirty = true;
+    };
+
+    Log.prototype.draw = function() {
+        if (!this.dirty) {
+            return;
+        }
+        this.dirty = false;
+        var container = this.container;
+        this.spacer.style.height = (this.rows.length * ROW_HEIGHT) + "px";
+        if (this.follow) {
+            container.scrollTop = container.scrollHeight;
+        }
+        var first = Math.floor(container.scrollTop / ROW_HEIGHT);
+        var count = Math.ceil(container.clientHeight / ROW_HEIGHT) + 1;
+        var last = Math.min(first + count, this.rows.length);
+        var fragment = document.createDocumentFragment();
+        for (var i = first; i < last; i++) {
+            var row = document.createElement("div");
+            row.className = "log-row";
+            row.textContent = this.rows.get(i);
+            fragment.appendChild(row);
+        }
+        this.content.style.top = (first * ROW_HEIGHT) + "px";
+        this.content.textContent = "";
+        this.content.appendChild(fragment);
+    };
+
+    // Gantt view of spans, zoomed with the mouse wheel. It is queried
+    // from the server at the resolution of the canvas, so the size of
+    // responses doesn't depend on the number of spans.
+    function Timeline(canvas, url) {
+        this.canvas = canvas;
+        this.context = canvas.getContext("2d");
+        this.url = url;
+        this.length = 60;
+        this.data = null;
+        this.loading = false;
+        var self = this;
+        canvas.addEventListener("wheel", function(event) {
+            event.preventDefault();
+            self.length = Math.min(Math.max(self.length * (event.deltaY > 0 ? 2 : 0.5), 0.1), 86400);
+            self.load();
+        });
+    }
+
+    Timeline.prototype.load = function() {
+        if (this.loading) {
+            return;
+        }
+        this.loading = true;
+        var self = this;
+        var width = Math.max(this.canvas.clientWidth - TIMELINE_LEFT, 1);
+        var rows = Math.max(Math.floor(this.canvas.clientHeight / TIMELINE_ROW), 1);
+        fetch(this.url + "?length=" + this.length + "&width=" + Math.round(width) + "&rows=" + rows)
+            .then(function(response) { return response.json(); })
+            .then(function(data) { self.data = data; self.draw(); })
+            .catch(function() {})
+            .then(function() { self.loading = false; });
+    };
+
+    Timeline.prototype.draw = function() {
+        var data = this.data;
+        var canvas = this.canvas;
+        var ratio = window.devicePixelRatio || 1;
+        var width = canvas.clientWidth;
+        var height = canvas.clientHeight;
+        if (canvas.width !== width * ratio || canvas.height !== height * ratio) {
+            canvas.width = width * ratio;
+            canvas.height = height * ratio;
+        }
+        var ctx = this.context;
+        ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+        ctx.clearRect(0, 0, width, height);
+        if (!data) {
+            return;
+        }
+        var scale = (width - TIMELINE_LEFT) / (data.until - data.since);
+        var x = function(t) { return TIMELINE_LEFT + Math.max(t - data.since, 0) * scale; };
+        var rows = {};
+        ctx.font = "11px sans-serif";
+        ctx.fillStyle = "#6c757d";
+        data.lanes.forEach(function(lane, i) {
+            rows[lane[0]] = i * TIMELINE_ROW;
+            ctx.fillText(lane[1] || "", 4, i * TIMELINE_ROW + TIMELINE_ROW - 4);
+        });
+        // Buckets are shaded by their number of spans
+        var maxCount = 1;
+        data.buckets.forEach(function(bucket) { maxCount = Math.max(maxCount, bucket[2]); });
+        data.buckets.forEach(function(bucket) {
+            ctx.globalAlpha = 0.2 + 0.8 * bucket[2] / maxCount;
+            ctx.fillStyle = bucket[5] ? COLORS[2] : COLORS[0];
+            ctx.fillRect(x(bucket[1]), rows[bucket[0]] + 2, Math.max(data.step * scale, 1), TIMELINE_ROW - 4);
+        });
+        ctx.globalAlpha = 1;
+        var nodes = {};
+        data.spans.forEach(function(span) {
+            if (!(span[3] in nodes)) {
+                nodes[span[3]] = COLORS[Object.keys(nodes).length % COLORS.length];
+            }
+            ctx.fillStyle = span[4] ? COLORS[2] : nodes[span[3]];
+            ctx.fillRect(x(span[1]), rows[span[0]] + 2, Math.max(x(span[2]) - x(span[1]), 1), TIMELINE_ROW - 4);
+        });
+    };
+
+    function formatCount(value) {
+        return value >= 1000 ? (value / 1000).toFixed(1) + "k" : value.toFixed(value < 10 ? 1 : 0);
+    }
+
+    function formatDuration(value) {
+        return value >= 1 ? value.toFixed(2) + " s" : (value * 1000).toFixed(value < 0.01 ? 2 : 0) + " ms";
+    }
+
+    function Dashboard(root) {
+        this.throughput = new Chart(root.querySelector("#throughput"));
+        this.latency = new Chart(root.querySelector("#latency"));
+        this.latencyField = root.querySelector("#latency-field");
+        this.nodes = root.querySelector("#nodes tbody");
+        this.log = new Log(root.querySelector("#log"));
+        this.alerts = root.querySelector("#alerts");
+        this.sampling = root.querySelector("#sampling");
+        this.edges = root.querySelector("#callgraph tbody");
+        this.edgeRows = {};
+        this.clocks = root.querySelector("#clocks tbody");
+        this.clockRows = {};
+        this.firing = {};
+        this.rows = {};
+        this.windows = {};
+        this.pending = [];
+        this.scheduled = false;
+        var self = this;
+        this.latencyField.addEventListener("change", function() {
+            self.latency = new Chart(root.querySelector("#latency"));
+        });
+    }
+
+    Dashboard.prototype.receive = function(message) {
+        this.pending.push(message);
+        if (!this.scheduled) {
+            this.scheduled = true;
+            var self = this;
+            window.requestAnimationFrame(function() { self.frame(); });
+        }
     };
-    socket.onmessage = function (event) {
-        root.append($("<p>", {"text": event.data}));
+
+    Dashboard.prototype.frame = function() {
+        this.scheduled = false;
+        var pending = this.pending;
+        this.pending = [];
+        for (var i = 0; i < pending.length; i++) {
+            this.apply(pending[i]);
+        }
+        this.throughput.draw(formatCount);
+        this.latency.draw(formatDuration);
+        this.log.draw();
+    };
+
+    Dashboard.prototype.apply = function(message) {
+        if (message.type === "window") {
+            this.applyWindow(message);
+        } else if (message.type === "backfill") {
+            for (var metric in message.series) {
+                var series = message.series[metric];
+                for (var i = 0; i < series.t.length; i++) {
+                    this.latency.add(metric + " (mean)", series.t[i], series.v[i]);
+                }
+            }
+        } else if (message.type === "callgraph") {
+            this.applyCallGraph(message);
+        } else if (message.type === "clock") {
+            this.applyClock(message);
+        } else if (message.type === "sampling") {
+            this.applySampling(message);
+        } else if (message.type === "alert") {
+            this.applyAlert(message);
+            this.log.add(JSON.stringify(message));
+        } else {
+            this.log.add(JSON.stringify(message));
+        }
+    };
+
+    Dashboard.prototype.clearAlerts = function() {
+        // Firing alerts are sent again on connection
+        this.alerts.textContent = "";
+        this.firing = {};
+    };
+
+    Dashboard.prototype.applyAlert = function(message) {
+        // Only alerts currently firing are shown
+        var key = message.rule + "/" + message.node;
+        var item = this.firing[key];
+        if (message.status !== "firing") {
+            if (item) {
+                this.alerts.removeChild(item);
+                delete this.firing[key];
+            }
+            return;
+        }
+        if (!item) {
+            item = this.firing[key] = document.createElement("div");
+            item.className = "alert alert-danger";
+            this.alerts.appendChild(item);
+        }
+        item.textContent = message.rule + " (" + message.node + "): " + message.text;
+    };
+
+    Dashboard.prototype.applyCallGraph = function(message) {
+        // Only updated edges are sent, with totals since the viewer started
+        for (var i = 0; i < message.edges.length; i++) {
+            var edge = message.edges[i];
+            var key = edge.parent + "\u2192" + edge.node;
+            var row = this.edgeRows[key];
+            if (!row) {
+                row = this.edgeRows[key] = document.createElement("tr");
+                for (var j = 0; j < 7; j++) {
+                    row.appendChild(document.createElement("td"));
+                }
+                this.edges.appendChild(row);
+            }
+            var cells = row.children;
+            cells[0].textContent = edge.parent === null ? "-" : edge.parent;
+            cells[1].textContent = edge.node;
+            cells[2].textContent = edge.count;
+            cells[3].textContent = edge.errors;
+            cells[4].textContent = formatDuration(edge.mean);
+            cells[5].textContent = formatDuration(edge.p95);
+            cells[6].textContent = formatDuration(edge.p99);
+        }
+    };
+
+    Dashboard.prototype.applyClock = function(message) {
+        // Offsets include the smallest network delay of each slave
+        for (var i = 0; i < message.slaves.length; i++) {
+            var slave = message.slaves[i];
+            var row = this.clockRows[slave.slave];
+            if (!row) {
+                row = this.clockRows[slave.slave] = document.createElement("tr");
+                for (var j = 0; j < 4; j++) {
+                    row.appendChild(document.createElement("td"));
+                }
+                this.clocks.appendChild(row);
+            }
+            var cells = row.children;
+            cells[0].textContent = slave.slave === null ? "-" : slave.slave;
+            cells[1].textContent = (slave.offset * 1000).toFixed(1) + " ms" +
+                (slave.uncertainty === null ? "" : " \u00b1 " + (slave.uncertainty * 1000).toFixed(1));
+            cells[2].textContent = (slave.drift * 1e6).toFixed(1) + " ppm";
+            cells[3].textContent = slave.samples;
+        }
+    };
+
+    Dashboard.prototype.applySampling = function(message) {
+        // Window summaries stay exact, only raw samples and the log are sampled
+        if (message.ratio > 1) {
+            this.sampling.textContent = "Viewer overloaded: keeping 1 in " + message.ratio +
+                " raw events, window summaries are exact";
+            this.sampling.hidden = false;
+        } else {
+            this.sampling.hidden = true;
+        }
+    };
+
+    Dashboard.prototype.applyWindow = function(message) {
+        // Sum all nodes of the same window
+        var total = this.windows[message.start];
+        if (!total) {
+            total = this.windows[message.start] = {"count": 0, "errors": 0};
+            var starts = Object.keys(this.windows);
+            if (starts.length > 10) {
+                delete this.windows[starts[0]];
+            }
+        }
+        total.count += message.count;
+        total.errors += message.errors;
+        this.throughput.add("calls/s", message.start, total.count / message.window);
+        this.throughput.add("errors/s", message.start, total.errors / message.window);
+
+        var field = this.latencyField.value;
+        if (message[field] !== null && message[field] !== undefined) {
+            this.latency.add(message.node, message.start, message[field]);
+        }
+
+        var row = this.rows[message.node];
+        if (!row) {
+            row = this.rows[message.node] = document.createElement("tr");
+            for (var i = 0; i < 8; i++) {
+                row.appendChild(document.createElement("td"));
+            }
+            this.nodes.appendChild(row);
+        }
+        var cells = row.children;
+        cells[0].textContent = message.node;
+        cells[1].textContent = formatCount(message.count / message.window);
+        cells[2].textContent = message.errors;
+        cells[3].textContent = formatDuration(message.mean);
+        cells[4].textContent = formatDuration(message.p50);
+        cells[5].textContent = formatDuration(message.p95);
+        cells[6].textContent = formatDuration(message.p99);
+        cells[7].textContent = formatDuration(message.max);
+    };
+
+    function formatChange(change) {
+        return change === null ? "-" : (change > 0 ? "+" : "") + (change * 100).toFixed(1) + "%";
+    }
+
+    // Side by side comparison of two saved runs. Changes of mean latency
+    // and throughput are only highlighted when their t-test is significant.
+    function Runs(root, url) {
+        this.panel = root.querySelector("#runs");
+        this.base = root.querySelector("#run-base");
+        this.run = root.querySelector("#run-compared");
+        this.rows = root.querySelector("#runs tbody");
+        this.summary = root.querySelector("#runs-throughput");
+        this.url = url;
+        var self = this;
+        root.querySelector("#run-compare").addEventListener("click", function() { self.compare(); });
+        root.querySelector("#run-save").addEventListener("click", function() { self.save(); });
+    }
+
+    Runs.prototype.load = function() {
+        var self = this;
+        fetch(this.url)
+            .then(function(response) {
+                // Runs are not saved by this viewer
+                if (!response.ok) {
+                    self.panel.hidden = true;
+                    return null;
+                }
+                return response.json();
+            })
+            .then(function(data) {
+                if (!data) {
+                    return;
+                }
+                [self.base, self.run].forEach(function(select, i) {
+                    var selected = select.value;
+                    select.textContent = "";
+                    data.runs.forEach(function(run) {
+                        var option = document.createElement("option");
+                        option.value = run.id;
+                        option.textContent = run.id + (run.tags.length ? " [" + run.tags.join(", ") + "]" : "");
+                        select.appendChild(option);
+                    });
+                    // Most recent run compared to the previous one by default
+                    select.value = selected || (data.runs[1 - i] || data.runs[0] || {}).id || "";
+                });
+            })
+            .catch(function() {});
+    };
+
+    Runs.prototype.save = function() {
+        var self = this;
+        fetch(this.url, {"method": "POST", "headers": {"Content-Type": "application/json"}, "body": JSON.stringify({"reset": true})})
+            .then(function() { self.load(); })
+            .catch(function() {});
+    };
+
+    Runs.prototype.compare = function() {
+        if (!this.base.value || !this.run.value) {
+            return;
+        }
+        var self = this;
+        fetch(this.url + "/compare?base=" + encodeURIComponent(this.base.value) + "&run=" + encodeURIComponent(this.run.value))
+            .then(function(response) { return response.json(); })
+            .then(function(data) { self.draw(data); })
+            .catch(function() {});
+    };
+
+    Runs.prototype.draw = function(data) {
+        var throughput = data.throughput;
+        this.summary.textContent = "Throughput: " + formatCount(throughput.base || 0) + "/s \u2192 " +
+            formatCount(throughput.run || 0) + "/s (" + formatChange(throughput.change) + ")" +
+            (throughput.significant ? "" : ", not significant");
+        this.rows.textContent = "";
+        for (var i = 0; i < data.nodes.length; i++) {
+            var node = data.nodes[i];
+            var row = document.createElement("tr");
+            if (node.significant) {
+                row.className = node.mean_delta > 0 ? "table-danger" : "table-success";
+            }
+            [
+                node.node,
+                node.base ? formatDuration(node.base.mean) : "-",
+                node.run ? formatDuration(node.run.mean) : "-",
+                formatChange(node.mean_change),
+                node.base ? formatDuration(node.base.p95) : "-",
+                node.run ? formatDuration(node.run.p95) : "-",
+                formatChange(node.p95_change),
+                node.p_value === null ? "-" : node.p_value.toPrecision(2)
+            ].forEach(function(text) {
+                var cell = document.createElement("td");
+                cell.textContent = text;
+                row.appendChild(cell);
+            });
+            this.rows.appendChild(row);
+        }
+    };
+
+    // Read-only dashboards, such as wall screens, read batches of
+    // messages from the event stream shared by all of them
+    function listen(dashboard) {
+        var source = new EventSource(document.body.getAttribute("data-base-url") + "events");
+        source.onopen = function(event) {
+            dashboard.clearAlerts();
+        };
+        source.onmessage = function(event) {
+            var messages = JSON.parse(event.data);
+            for (var i = 0; i < messages.length; i++) {
+                dashboard.receive(messages[i]);
+            }
+        };
+    }
+
+    function connect(dashboard) {
+        var body = document.body;
+        var url = (location.protocol === "https:" ? "wss://" : "ws://") + location.host + body.getAttribute("data-base-url") + "ws";
+        var decoder = new RemoteViewerProtocol.Decoder();
+        var socket = new WebSocket(url, RemoteViewerProtocol.SUBPROTOCOLS);
+        socket.binaryType = "arraybuffer";
+        socket.onopen = function (event) {
+            dashboard.clearAlerts();
+            // Subscribe to what is selected in the query string,
+            // for example ?nodes=match,create*&metrics=window
+            var params = new URLSearchParams(location.search);
+            var subscription = {"type": "subscribe"};
+            ["slaves", "nodes", "metrics"].forEach(function(dimension) {
+                if (params.has(dimension)) {
+                    subscription[dimension] = params.get(dimension).split(",");
+                }
+            });
+            socket.send(JSON.stringify(subscription));
+        };
+        socket.onmessage = function (event) {
+            var message = decoder.decode(event.data);
+            if (message !== null) {
+                dashboard.receive(message);
+            }
+        };
+        socket.onclose = function (event) {
+            // Reconnect with a new decoder as symbols are per connection
+            setTimeout(function() { connect(dashboard); }, 1000);
+        };
     }
-});
\ No newline at end of file
+
+    // Seconds between two queries of the timeline
+    var TIMELINE_REFRESH = 2;
+
+    document.addEventListener("DOMContentLoaded", function() {
+        var dashboard = new Dashboard(document.body);
+        if (new URLSearchParams(location.search).has("passive")) {
+            listen(dashboard);
+        } else {
+            connect(dashboard);
+        }
+        var timeline = new Timeline(
+            document.body.querySelector("#timeline"),
+            document.body.getAttribute("data-base-url") + "api/timeline"
+        );
+        timeline.load();
+        window.setInterval(function() { timeline.load(); }, TIMELINE_REFRESH * 1000);
+        new Runs(document.body, document.body.getAttribute("data-base-url") + "api/runs").load();
+    });
+})();
@@ -0,0 +1,123 @@
+// Decoder for the binary protocol, see aiotesttoolkit_remoteviewer/protocol.py
+var RemoteViewerProtocol = (function() {
+    var JSON_PROTOCOL = "remoteviewer.json";
+    var BINARY_PROTOCOL = "remoteviewer.binary";
+    var DEFINE = 1;
+    var WINDOW = 2;
+    var BACKFILL = 3;
+
+    function Reader(buffer) {
+        this.view = new DataView(buffer);
+        this.pos = 0;
+    }
+
+    Reader.prototype.u8 = function() {
+        return this.view.getUint8(this.pos++);
+    };
+
+    Reader.prototype.f32 = function() {
+        var value = this.view.getFloat32(this.pos, true);
+        this.pos += 4;
+        return value;
+    };
+
+    Reader.prototype.f64 = function() {
+        var value = this.view.getFloat64(this.pos, true);
+        this.pos += 8;
+        return value;
+    };
+
+    Reader.prototype.varint = function() {
+        var value = 0;
+        var scale = 1;
+        var b;
+        do {
+            b = this.view.getUint8(this.pos++);
+            value += (b & 0x7f) * scale;
+            scale *= 128;
+        } while (b & 0x80);
+        return value;
+    };
+
+    Reader.prototype.zigzag = function() {
+        var value = this.varint();
+        return value % 2 ? -(value + 1) / 2 : value / 2;
+    };
+
+    Reader.prototype.string = function() {
+        var length = this.varint();
+        var bytes = new Uint8Array(this.view.buffer, this.pos, length);
+        this.pos += length;
+        return new TextDecoder("utf-8").decode(bytes);
+    };
+
+    function Decoder() {
+        this.symbols = {};
+    }
+
+    // Decode a frame into the same message as the JSON protocol,
+    // returns null for frames that only update the decoder state
+    Decoder.prototype.decode = function(data) {
+        if (typeof data === "string") {
+            return JSON.parse(data);
+        }
+        var reader = new Reader(data);
+        var kind = reader.u8();
+        if (kind === DEFINE) {
+            for (var n = reader.varint(); n > 0; n--) {
+                var id = reader.varint();
+                this.symbols[id] = reader.string();
+            }
+            return null;
+        }
+        if (kind === WINDOW) {
+            var message = {"type": "window", "start": reader.f64(), "window": reader.f32()};
+            message.node = this.symbols[reader.varint()];
+            message.count = reader.varint();
+            message.errors = reader.varint();
+            var low = reader.zigzag();
+            var value = low;
+            message.min = low / 1e6;
+            value += reader.zigzag();
+            message.p50 = value / 1e6;
+            value += reader.zigzag();
+            message.p95 = value / 1e6;
+            value += reader.zigzag();
+            message.p99 = value / 1e6;
+            value += reader.zigzag();
+            message.max = value / 1e6;
+            message.mean = (low + reader.zigzag()) / 1e6;
+            return message;
+        }
+        if (kind === BACKFILL) {
+            var since = reader.f64();
+            var backfill = {"type": "backfill", "since": since, "until": reader.f64(), "series": {}};
+            for (var s = reader.varint(); s > 0; s--) {
+                var metric = this.symbols[reader.varint()];
+                var count = reader.varint();
+                var t = new Float64Array(count);
+                var v = new Float64Array(count);
+                var previous = Math.round(since * 1e3);
+                for (var i = 0; i < count; i++) {
+                    previous += reader.zigzag();
+                    t[i] = previous / 1e3;
+                }
+                previous = 0;
+                for (var j = 0; j < count; j++) {
+                    previous += reader.zigzag();
+                    v[j] = previous / 1e6;
+                }
+                backfill.series[metric] = {"t": t, "v": v};
+            }
+            return backfill;
+        }
+        throw new Error("Unknown frame type " + kind);
+    };
+
+    return {
+        "JSON": JSON_PROTOCOL,
+        "BINARY": BINARY_PROTOCOL,
+        "SUBPROTOCOLS": [BINARY_PROTOCOL, JSON_PROTOCOL],
+        "Decoder": Decoder
+    };
+})();
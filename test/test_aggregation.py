@@ -0,0 +1,58 @@
+"""Tests for the aggregation module"""
+
+import random
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import aggregation
+from aiotesttoolkit_remoteviewer import stats
+
+
+class AggregationTestCase(aiotesttoolkit.TestCase):
+    def test_percentiles(self):
+        histogram = aggregation.Histogram()
+        values = [random.uniform(0.001, 2.0) for _ in range(0, 10000)]
+        for _ in values:
+            histogram.add(_)
+
+        values.sort()
+        for rank, value in zip((50, 95, 99), histogram.percentiles(50, 95, 99)):
+            expected = values[int(rank / 100.0 * len(values)) - 1]
+            self.assertAlmostEqual(value, expected, delta=expected * 0.05)
+
+    def test_merge(self):
+        merged = aggregation.WindowStats("match")
+        single = aggregation.WindowStats("match")
+        for _ in range(0, 4):
+            partial = aggregation.WindowStats("match")
+            for i in range(0, 100):
+                value = random.expovariate(10)
+                partial.add(value, error=i % 10 == 0)
+                single.add(value, error=i % 10 == 0)
+            # Partials go through their lossless representation
+            merged.merge(aggregation.WindowStats.from_dict(partial.to_dict()))
+
+        self.assertEqual(merged.count, 400)
+        self.assertEqual(merged.errors, 40)
+        self.assertEqual(merged.histogram.counts, single.histogram.counts)
+        self.assertEqual(
+            merged.histogram.percentiles(50, 95, 99),
+            single.histogram.percentiles(50, 95, 99),
+        )
+        self.assertAlmostEqual(merged.mean, single.mean)
+
+    def test_aggregator(self):
+        aggregator = aggregation.Aggregator(window=1.0)
+        self.assertTrue(
+            aggregator.add(stats.record({"name": "match", "duration": 0.1}))
+        )
+        self.assertTrue(
+            aggregator.add(stats.record({"name": "match", "duration": 0.3}))
+        )
+        self.assertFalse(
+            aggregator.add(stats.record({"type": "info", "message": "started"}))
+        )
+
+        _, windows = aggregator.flush()
+        self.assertEqual(len(windows), 1)
+        self.assertEqual(windows[0].count, 2)
+        self.assertAlmostEqual(windows[0].mean, 0.2)
+        self.assertEqual(aggregator.flush()[1], [])
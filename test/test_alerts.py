@@ -0,0 +1,93 @@
+"""Tests for the alerts module"""
+
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import alerts
+from aiotesttoolkit_remoteviewer.aggregation import WindowStats
+
+
+def window(node, values, errors=0):
+    result = WindowStats(node)
+    for i, value in enumerate(values):
+        result.add(value, error=i < errors)
+    return result
+
+
+class AlertsTestCase(aiotesttoolkit.TestCase):
+    def test_parse(self):
+        rule = alerts.parse_rule("latency", "p99 of match > 250ms for 30s")
+        self.assertEqual(rule.metric, "p99")
+        self.assertEqual(rule.node, "match")
+        self.assertEqual(rule.op, ">")
+        self.assertAlmostEqual(rule.threshold, 0.25)
+        self.assertEqual(rule.duration, 30.0)
+
+        rule = alerts.parse_rule("errors", "error_rate of create* above 1%")
+        self.assertAlmostEqual(rule.threshold, 0.01)
+        self.assertTrue(rule.matches("create_game"))
+        self.assertFalse(rule.matches("match"))
+
+        for text in ("p99 of match", "rate of match > 1%", "p999x of match > 1s"):
+            with self.assertRaises(ValueError):
+                alerts.parse_rule("invalid", text)
+
+    def test_percentile(self):
+        evaluator = alerts.AlertEvaluator.from_config(
+            {"latency": "p99 of match > 250ms for 3s"}
+        )
+        # 4% of slow calls in a single window fires
+        fired = evaluator.evaluate(0.0, [window("match", [0.01] * 96 + [1.0] * 4)], 1.0)
+        self.assertEqual([_["status"] for _ in fired], [alerts.FIRING])
+        # The value is the p99 latency
+        self.assertAlmostEqual(fired[0]["value"], 1.0, delta=0.02)
+        self.assertEqual(len(evaluator.active()), 1)
+        # Still above 1% over the last 3 windows
+        for start in (1.0, 2.0):
+            fired = evaluator.evaluate(start, [window("match", [0.01] * 100)], 1.0)
+            self.assertEqual(fired, [])
+        fired = evaluator.evaluate(3.0, [window("match", [0.01] * 100)], 1.0)
+        self.assertEqual([_["status"] for _ in fired], [alerts.RESOLVED])
+        self.assertEqual(evaluator.active(), [])
+
+    def test_sliding(self):
+        evaluator = alerts.AlertEvaluator.from_config(
+            {"errors": "error_rate of match > 10% for 2s", "rate": "rate of * below 5"}
+        )
+        self.assertEqual(
+            evaluator.evaluate(0.0, [window("match", [0.1] * 10, errors=1)], 1.0), []
+        )
+        fired = evaluator.evaluate(1.0, [window("match", [0.1] * 10, errors=3)], 1.0)
+        self.assertEqual([_["rule"] for _ in fired], ["errors"])
+        self.assertAlmostEqual(fired[0]["value"], 0.2)
+        # A node without calls has a rate of zero
+        fired = evaluator.evaluate(2.0, [], 1.0)
+        self.assertEqual([_["rule"] for _ in fired], ["rate"])
+        # Errors of the second window are out of the sliding window
+        fired = evaluator.evaluate(3.0, [], 1.0)
+        self.assertEqual(
+            [(_["rule"], _["status"]) for _ in fired], [("errors", alerts.RESOLVED)]
+        )
+
+    def test_boundary(self):
+        evaluator = alerts.AlertEvaluator.from_config(
+            {
+                "ge": "max of match >= 250ms",
+                "gt": "max of match > 250ms",
+                "le": "count of match <= 2",
+                "lt": "count of match < 2",
+            }
+        )
+        fired = evaluator.evaluate(0.0, [window("match", [0.1, 0.25])], 1.0)
+        self.assertEqual(sorted(_["rule"] for _ in fired), ["ge", "le"])
+
+    def test_min(self):
+        evaluator = alerts.AlertEvaluator.from_config(
+            {"slow": "min of match > 100ms", "fast": "max of match < 100ms"}
+        )
+        fired = evaluator.evaluate(0.0, [window("match", [0.5, 0.6, 0.7])], 1.0)
+        self.assertEqual([_["rule"] for _ in fired], ["slow"])
+        self.assertAlmostEqual(fired[0]["value"], 0.5)
+        fired = evaluator.evaluate(1.0, [window("match", [0.01, 0.05])], 1.0)
+        self.assertEqual(
+            [(_["rule"], _["status"], _["value"]) for _ in fired],
+            [("slow", alerts.RESOLVED, 0.01), ("fast", alerts.FIRING, 0.05)],
+        )
@@ -0,0 +1,52 @@
+"""Tests for the assets module"""
+
+import gzip
+import os
+import tempfile
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import assets
+
+
+class AssetsTestCase(aiotesttoolkit.TestCase):
+    def test_accepted_encodings(self):
+        self.assertEqual(
+            assets.accepted_encodings("gzip, deflate;q=0.5, br;q=0"),
+            {"gzip", "deflate"},
+        )
+        self.assertEqual(assets.accepted_encodings(""), set())
+        self.assertEqual(assets.accepted_encodings("*"), set(assets.ENCODINGS))
+
+    def test_select(self):
+        data = b"body { color: red; }\n" * 100
+        asset = assets.Asset(data, content_type="text/css")
+
+        encoding, body, etag = asset.select("gzip, deflate")
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(gzip.decompress(body), data)
+        identity = asset.select("identity")
+        self.assertEqual(identity[0], None)
+        self.assertEqual(identity[1], data)
+        # Each representation has its own strong ETag
+        self.assertNotEqual(etag, identity[2])
+
+        # Small or binary files are not compressed
+        self.assertEqual(
+            assets.Asset(b"\x89PNG" * 100, content_type="image/png").select("gzip")[0],
+            None,
+        )
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, "js"))
+            with open(os.path.join(directory, "js", "a.js"), "wb") as f:
+                f.write(b"var a = 1;")
+            store = assets.AssetStore(directory)
+            url = store.url("/static/", "js/a.js")
+            with open(os.path.join(directory, "js", "a.js"), "wb") as f:
+                f.write(b"var a = 2;")
+            changed = assets.AssetStore(directory).url("/static/", "js/a.js")
+
+        self.assertIn("js/a.js", store)
+        self.assertTrue(url.startswith("/static/js/a.js?v="))
+        self.assertNotEqual(url, changed)
+        self.assertEqual(store.url("/static/", "missing.js"), "/static/missing.js")
@@ -0,0 +1,95 @@
+""" Tests for the broadcast module """
+import asyncio
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import broadcast
+from aiotesttoolkit_remoteviewer.connections import ConnectionRegistry
+from aiotesttoolkit_remoteviewer.subscriptions import SubscriptionIndex
+
+
+class FakeWebSocket:
+    ws_protocol = None
+
+
+class BroadcastTestCase(aiotesttoolkit.TestCase):
+    def test_drop_oldest(self):
+        queue = broadcast.ClientQueue(maxsize=2, policy=broadcast.DROP_OLDEST)
+        for _ in range(0, 3):
+            queue.put(_, key="a")
+
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.dropped, 1)
+        loop = asyncio.new_event_loop()
+        self.assertEqual(loop.run_until_complete(queue.get()), 1)
+        self.assertEqual(loop.run_until_complete(queue.get()), 2)
+        loop.close()
+
+    def test_coalesce(self):
+        queue = broadcast.ClientQueue(maxsize=2, policy=broadcast.COALESCE)
+        queue.put(0, key="a")
+        queue.put(1, key="b")
+        queue.put(2, key="a")
+
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.dropped, 1)
+        loop = asyncio.new_event_loop()
+        # "a" keeps its position but holds the latest value
+        self.assertEqual(loop.run_until_complete(queue.get()), 2)
+        self.assertEqual(loop.run_until_complete(queue.get()), 1)
+        loop.close()
+
+    def test_publish(self):
+        clients = ConnectionRegistry(
+            queue_factory=lambda: broadcast.ClientQueue(maxsize=1)
+        )
+        broadcaster = broadcast.Broadcaster(clients)
+        slow = clients.add(FakeWebSocket())
+        fast = clients.add(FakeWebSocket())
+        broadcaster.publish({"name": "match"})
+        broadcaster.publish({"name": "disconnect"})
+
+        # Both clients share the same encoded data
+        self.assertIs(slow.queue._pending[("s", 2)], fast.queue._pending[("s", 2)])
+        self.assertEqual(slow.queue.dropped, 1)
+
+    def test_subscriptions(self):
+        clients = ConnectionRegistry()
+        broadcaster = broadcast.Broadcaster(clients)
+        everything = clients.add(FakeWebSocket())
+        focused = clients.add(FakeWebSocket())
+        broadcaster.subscribe(focused, nodes=["match"], metrics=["win*"])
+        broadcaster.publish({}, node="match", metric="window")
+        broadcaster.publish({}, node="create_game", metric="window")
+        broadcaster.publish({}, node="match", metric="info")
+        broadcaster.publish({})
+
+        self.assertEqual(len(everything.queue), 4)
+        self.assertEqual(len(focused.queue), 2)
+
+        clients.remove(focused.websocket)
+        self.assertEqual(len(broadcaster.subscriptions), 1)
+
+    def test_subscription_index(self):
+        index = SubscriptionIndex()
+        index.subscribe("all")
+        index.subscribe("node", nodes=["match"])
+        index.subscribe("prefix", slaves=["eu-*"], metrics=["window"])
+        index.subscribe("slave", slaves=["eu-1"])
+        self.assertEqual(
+            sorted(index.match(slave="eu-1", node="match", metric="window")),
+            ["all", "node", "prefix", "slave"],
+        )
+        self.assertEqual(
+            sorted(index.match(slave="us-1", node="match", metric="window")),
+            ["all", "node"],
+        )
+        self.assertEqual(
+            sorted(index.match(slave="eu-2", metric="info")), ["all", "node"]
+        )
+        self.assertEqual(sorted(index.match()), ["all", "node", "prefix", "slave"])
+
+        # A string is not a list of patterns
+        with self.assertRaises(ValueError):
+            index.subscribe("node", nodes="match")
+        self.assertEqual(sorted(index.match(node="m")), ["all", "prefix", "slave"])
+        index.unsubscribe("all")
+        self.assertEqual(sorted(index.match(node="m")), ["prefix", "slave"])
@@ -0,0 +1,94 @@
+"""Tests for the callgraph module"""
+
+import time
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import stats
+from aiotesttoolkit_remoteviewer.aggregation import WindowStats
+from aiotesttoolkit_remoteviewer.callgraph import CallGraph
+
+
+def edges(message):
+    return {(_["parent"], _["node"]): _ for _ in message["edges"]}
+
+
+class CallGraphTestCase(aiotesttoolkit.TestCase):
+    def test_enter_exit(self):
+        graph = CallGraph()
+        for bot in ("1", "2"):
+            for kind, node, time in (
+                ("enter", "host", 10.0),
+                ("enter", "create_game", 10.0),
+                ("exit", "create_game", 11.0),
+                ("enter", "match", 11.0),
+                ("exit", "match", 14.0),
+                ("exit", "host", 15.0),
+            ):
+                graph.add(
+                    stats.record({"type": kind, "bot": bot, "name": node, "time": time})
+                )
+
+        snapshot = edges(graph.snapshot())
+        self.assertEqual(
+            set(snapshot), {(None, "host"), ("host", "create_game"), ("host", "match")}
+        )
+        self.assertEqual(snapshot[("host", "match")]["count"], 2)
+        self.assertEqual(snapshot[("host", "match")]["mean"], 3.0)
+        self.assertEqual(snapshot[(None, "host")]["max"], 5.0)
+
+    def test_missing_exit(self):
+        graph = CallGraph(timeout=60.0)
+        for kind, node in (("enter", "host"), ("enter", "match"), ("exit", "host")):
+            graph.add(stats.record({"type": kind, "bot": "1", "name": node}))
+        # Exit of host is lost
+        graph.add(stats.record({"type": "enter", "bot": "2", "name": "host"}))
+        self.assertEqual(len(graph._stacks), 1)
+
+        graph.prune(time.time())
+        self.assertEqual(len(graph._stacks), 1)
+        graph.prune(time.time() + 120.0)
+        self.assertEqual(graph._stacks, {})
+        self.assertEqual(graph._seen, {})
+        # Exits of forgotten stacks are ignored
+        self.assertFalse(
+            graph.add(stats.record({"type": "exit", "bot": "2", "name": "host"}))
+        )
+
+    def test_merge(self):
+        graph = CallGraph()
+        graph.add(stats.record({"name": "match", "duration": 0.1}))
+        window = WindowStats("match")
+        window.add(0.3, error=True)
+        graph.merge(window)
+
+        snapshot = edges(graph.snapshot())
+        self.assertEqual(snapshot[(None, "match")]["count"], 2)
+        self.assertEqual(snapshot[(None, "match")]["errors"], 1)
+        self.assertEqual(graph.diff()["nodes"][0]["count"], 2)
+
+    def test_parent(self):
+        graph = CallGraph()
+        graph.add(stats.record({"name": "match", "parent": "host", "duration": 0.1}))
+        graph.add(stats.record({"name": "match", "duration": 0.2}))
+        self.assertFalse(graph.add(stats.record({"type": "info", "message": "x"})))
+
+        message = graph.diff()
+        self.assertEqual(len(message["nodes"]), 1)
+        self.assertEqual(message["nodes"][0]["count"], 2)
+        self.assertEqual(set(edges(message)), {("host", "match"), (None, "match")})
+
+    def test_diff(self):
+        graph = CallGraph()
+        graph.add(stats.record({"name": "match", "parent": "host", "duration": 0.1}))
+        graph.add(
+            stats.record({"name": "create_game", "parent": "host", "duration": 0.1})
+        )
+        graph.diff()
+        self.assertIsNone(graph.diff())
+
+        # Only the updated node and edge are sent again
+        graph.add(stats.record({"name": "match", "parent": "host", "duration": 0.3}))
+        message = graph.diff()
+        self.assertEqual([_["node"] for _ in message["nodes"]], ["match"])
+        self.assertEqual(list(edges(message)), [("host", "match")])
+        self.assertEqual(message["edges"][0]["count"], 2)
+        self.assertEqual(len(graph.snapshot()["edges"]), 2)
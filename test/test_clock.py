@@ -0,0 +1,49 @@
+"""Tests for the clock module"""
+
+import random
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer.clock import SlaveClock, ClockEstimator
+
+
+def observe(clock, *, offset, drift=0.0, seconds=120, rate=20):
+    # Stats sent by a slave whose clock is `offset` seconds late and
+    # gains `drift` seconds per second, with random network delays
+    rng = random.Random(1)
+    for i in range(0, seconds * rate):
+        arrival = 1000.0 + i / rate
+        delay = 0.001 + rng.expovariate(1 / 0.02)
+        clock.observe(arrival - delay - offset - drift * (arrival - 1000.0), arrival)
+
+
+class ClockTestCase(aiotesttoolkit.TestCase):
+    def test_offset(self):
+        clock = SlaveClock(bucket=5.0, buckets=24)
+        observe(clock, offset=0.05)
+        # The smallest delay is part of the offset
+        self.assertAlmostEqual(clock.offset, 0.051, delta=0.002)
+        self.assertAlmostEqual(clock.drift, 0.0, delta=1e-4)
+        self.assertLess(clock.uncertainty, 0.002)
+
+    def test_drift(self):
+        clock = SlaveClock(bucket=5.0, buckets=24)
+        observe(clock, offset=-0.2, drift=1e-3)
+        self.assertAlmostEqual(clock.drift, 1e-3, delta=1e-4)
+        # Offset at the last closed bucket, drifted for almost two minutes
+        self.assertAlmostEqual(clock.offset, -0.2 + 0.001 + 0.1125, delta=0.005)
+
+    def test_correct(self):
+        clocks = ClockEstimator(bucket=1.0, buckets=8)
+        for i in range(0, 100):
+            arrival = 1000.0 + i / 10
+            clocks.correct("a", arrival - 0.011 - 3.0, arrival)
+            clocks.correct("b", arrival - 0.011 + 2.0, arrival)
+        # Both slaves are corrected to the viewer clock, plus the delay
+        self.assertAlmostEqual(clocks.correct("a", 1007.0, 1010.0), 1010.011, 3)
+        self.assertAlmostEqual(clocks.correct("b", 1012.0, 1010.0), 1010.011, 3)
+
+        message = clocks.message()
+        self.assertEqual(message["type"], "clock")
+        slaves = {_["slave"]: _ for _ in message["slaves"]}
+        self.assertAlmostEqual(slaves["a"]["offset"], 3.011, 3)
+        self.assertAlmostEqual(slaves["b"]["offset"], -1.989, 3)
+        self.assertEqual(slaves["a"]["samples"], 101)
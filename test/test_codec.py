@@ -0,0 +1,49 @@
+"""Tests for the codec module"""
+
+import json
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import codec
+from aiotesttoolkit_remoteviewer.aggregation import (
+    WindowStats,
+    encode_partial,
+    decode_partial,
+)
+
+
+class CodecTestCase(aiotesttoolkit.TestCase):
+    def test_round_trip(self):
+        message = {"type": "window", "node": "match", "p99": 0.25, "values": [1, 2]}
+        for name, backend in codec.CODECS.items():
+            data = backend.dumps(message)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(backend.loads(data), message, name)
+            if backend.text:
+                self.assertEqual(json.loads(data), message, name)
+
+    def test_get(self):
+        self.assertTrue(codec.get().text)
+        self.assertEqual(codec.get("json").name, "json")
+        self.assertIn(codec.get(binary=True).name, codec.CODECS)
+        with self.assertRaises(ValueError):
+            codec.get("unknown")
+        if "msgpack" in codec.CODECS:
+            with self.assertRaises(ValueError):
+                codec.get("msgpack")
+        # Integers too big for orjson are still encoded
+        self.assertEqual(json.loads(codec.get().dumps({"a": 1 << 70})), {"a": 1 << 70})
+
+    def test_partial(self):
+        window = WindowStats("match")
+        for _ in (0.1, 0.2, 0.3):
+            window.add(_)
+        for backend in codec.CODECS.values():
+            data = encode_partial(10.0, [window], [{"type": "info"}], codec=backend)
+            # Detected from the data
+            windows, others = decode_partial(data)
+            self.assertEqual(windows[0].to_dict(), window.to_dict())
+            self.assertEqual(others, [{"type": "info"}])
+        # Text received from a relay
+        windows, _ = decode_partial(
+            encode_partial(10.0, [window], codec=codec.get("json")).decode("utf-8")
+        )
+        self.assertEqual(windows[0].count, 3)
@@ -0,0 +1,66 @@
+"""Tests for the monitoring module"""
+
+import asyncio
+import time
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer.broadcast import Broadcaster
+from aiotesttoolkit_remoteviewer.clock import ClockEstimator
+from aiotesttoolkit_remoteviewer.connections import ConnectionRegistry
+from aiotesttoolkit_remoteviewer.monitoring import Monitor
+
+
+class FakeWebSocket:
+    ws_protocol = None
+
+
+class MonitoringTestCase(aiotesttoolkit.TestCase):
+    def test_render(self):
+        clients = ConnectionRegistry()
+        broadcaster = Broadcaster(clients)
+        monitor = Monitor(clients, broadcaster)
+        client = clients.add(FakeWebSocket())
+        broadcaster.publish({"type": "stat"})
+        broadcaster.publish({"type": "stat"})
+        monitor.observe_stat(0.5)
+        monitor.observe_ingested(9)
+
+        text = monitor.render()
+        self.assertIn("remoteviewer_stats_ingested_total 10\n", text)
+        self.assertIn("remoteviewer_handle_stat_seconds_count 1\n", text)
+        self.assertIn("remoteviewer_clients 1\n", text)
+        self.assertIn("remoteviewer_encoded_total 2\n", text)
+        self.assertIn(
+            'remoteviewer_client_queue_depth{{client="{}"}} 2\n'.format(client.number),
+            text,
+        )
+
+    def test_labels(self):
+        clients = ConnectionRegistry()
+        clocks = ClockEstimator()
+        clocks.correct('slave "1"\\\n', 100.0, 100.5)
+        monitor = Monitor(clients, Broadcaster(clients), clocks=clocks)
+
+        text = monitor.render()
+        self.assertIn(
+            'remoteviewer_slave_clock_offset_seconds{slave="slave \\"1\\"\\\\\\n"}',
+            text,
+        )
+
+    def test_lag(self):
+        clients = ConnectionRegistry()
+        monitor = Monitor(clients, Broadcaster(clients), interval=0.01)
+        monitor.observe_ingested(5)
+
+        async def block():
+            await asyncio.sleep(0.005)
+            # Block the loop so the timer wakes up late
+            time.sleep(0.05)
+            await asyncio.sleep(0.02)
+
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(monitor.run())
+        loop.run_until_complete(block())
+        task.cancel()
+        loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+        loop.close()
+        self.assertGreater(monitor.lags.max, 0.02)
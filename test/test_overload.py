@@ -0,0 +1,65 @@
+"""Tests for the overload module"""
+
+import asyncio
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer.overload import OverloadController
+from aiotesttoolkit_remoteviewer.pipeline import Pipeline
+
+
+class OverloadTestCase(aiotesttoolkit.TestCase):
+    def test_sampling(self):
+        controller = OverloadController(maxsize=10)
+        controller.ratio = 4
+        queued = [controller.offer(_) for _ in range(0, 8)]
+
+        # Counted sampling keeps 1 in 4
+        self.assertEqual(queued.count(True), 2)
+        self.assertEqual(controller.sampled_out, 6)
+
+        # The oldest events are shed when the queue is full
+        controller.ratio = 1
+        for _ in range(0, 10):
+            controller.offer(_)
+        self.assertEqual(len(controller), 10)
+        self.assertEqual(controller.shed, 2)
+
+    def test_update(self):
+        controller = OverloadController(maxsize=100, max_lag=0.1, max_ratio=4)
+
+        self.assertTrue(controller.update(0.2))
+        self.assertEqual(controller.ratio, 2)
+        for _ in range(0, 120):
+            controller.offer(_)
+        self.assertTrue(controller.update(0.0))
+        self.assertEqual(controller.ratio, 4)
+        self.assertFalse(controller.update(0.5))
+        self.assertEqual(controller.ratio, 4)
+
+        # The ratio only decreases after a few calm measures
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(controller.get(100))
+        loop.close()
+        changes = [controller.update(0.0) for _ in range(0, 4)]
+        self.assertEqual(changes, [False, False, False, True])
+        self.assertEqual(controller.ratio, 2)
+
+    def test_pipeline(self):
+        async def run():
+            pipeline = Pipeline()
+            await pipeline.start()
+            pipeline.overload.ratio = 4
+            for _ in range(0, 100):
+                await pipeline.handle_stat(
+                    {"name": "match", "time": 1.0 + _, "duration": 0.1}
+                )
+            await asyncio.sleep(0.01)
+            await pipeline.stop()
+            return pipeline
+
+        loop = asyncio.new_event_loop()
+        pipeline = loop.run_until_complete(run())
+        loop.close()
+
+        # Aggregates are exact, raw samples are sampled
+        self.assertEqual(pipeline.aggregator.flush()[1][0].count, 100)
+        self.assertEqual(len(pipeline.store["match"]), 25)
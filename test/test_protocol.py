@@ -0,0 +1,57 @@
+""" Tests for the protocol module """
+import json
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import protocol
+
+
+class ProtocolTestCase(aiotesttoolkit.TestCase):
+    def test_window(self):
+        message = {
+            "type": "window",
+            "start": 1588000000.0,
+            "window": 1.0,
+            "node": "match",
+            "count": 1200,
+            "errors": 3,
+            "min": 0.001,
+            "max": 0.25,
+            "mean": 0.012,
+            "p50": 0.01,
+            "p95": 0.05,
+            "p99": 0.1,
+        }
+        encoder = protocol.Encoder()
+        frame = encoder.encode(message)
+        self.assertLess(len(frame.data), len(json.dumps(message)) / 4)
+
+        decoder = protocol.Decoder()
+        self.assertIsNone(decoder.decode(protocol.define(frame.symbols)))
+        decoded = decoder.decode(frame.data)
+        self.assertEqual(set(decoded), set(message))
+        for name, value in message.items():
+            if isinstance(value, float):
+                self.assertAlmostEqual(decoded[name], value, places=6)
+            else:
+                self.assertEqual(decoded[name], value)
+
+    def test_backfill(self):
+        message = {
+            "type": "backfill",
+            "since": 1000.0,
+            "until": 1010.0,
+            "series": {
+                "match": {"t": [1000.5, 1001.0, 1001.5], "v": [0.01, 0.02, 0.015]}
+            },
+        }
+        encoder = protocol.Encoder()
+        frame = encoder.encode(message)
+
+        decoder = protocol.Decoder()
+        decoder.decode(protocol.define(frame.symbols))
+        decoded = decoder.decode(frame.data)
+        self.assertEqual(decoded["series"]["match"]["t"], [1000.5, 1001.0, 1001.5])
+        for a, b in zip(decoded["series"]["match"]["v"], [0.01, 0.02, 0.015]):
+            self.assertAlmostEqual(a, b, places=6)
+
+    def test_no_binary_encoding(self):
+        self.assertIsNone(protocol.Encoder().encode({"type": "info"}))
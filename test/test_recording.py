@@ -0,0 +1,72 @@
+""" Tests for the recording module """
+import asyncio
+import os
+import tempfile
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import recording
+
+
+class RecordingTestCase(aiotesttoolkit.TestCase):
+    def test_segments(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = recording.Recorder(directory, segment_size=64)
+            for _ in range(0, 10):
+                recorder.write({"name": "match", "duration": _}, arrival=float(_))
+            recorder.close()
+
+            self.assertGreater(len(os.listdir(directory)), 1)
+            records = list(recording.iter_records(directory))
+            self.assertEqual([_[0] for _ in records], [float(_) for _ in range(0, 10)])
+            self.assertEqual([_[1]["duration"] for _ in records], list(range(0, 10)))
+
+    def test_roll(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = recording.Recorder(directory, segment_size=64)
+
+            async def write():
+                for _ in range(0, 10):
+                    recorder.write({"name": "match", "duration": _})
+                    # Segments closed in a thread while syncing
+                    await recorder.sync()
+                await recorder.stop()
+
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(write())
+            loop.close()
+            self.assertGreater(len(os.listdir(directory)), 1)
+            records = list(recording.iter_records(directory))
+            self.assertEqual([_[1]["duration"] for _ in records], list(range(0, 10)))
+
+    def test_truncated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = recording.Recorder(directory)
+            recorder.write({"name": "match"})
+            recorder.write({"name": "disconnect"})
+            recorder.close()
+            segment = os.path.join(directory, os.listdir(directory)[0])
+            with open(segment, "r+b") as f:
+                f.truncate(os.path.getsize(segment) - 1)
+
+            records = list(recording.iter_records(directory))
+            self.assertEqual([_[1]["name"] for _ in records], ["match"])
+
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = recording.Recorder(directory)
+            for _ in range(0, 3):
+                recorder.write({"name": "match"}, arrival=_ * 10.0)
+            recorder.close()
+
+            received = []
+
+            async def handle_stat(stat):
+                received.append(stat)
+
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(
+                asyncio.wait_for(
+                    recording.replay(directory, handle_stat, speed=1000), timeout=1
+                )
+            )
+            loop.close()
+            self.assertEqual(len(received), 3)
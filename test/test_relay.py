@@ -0,0 +1,74 @@
+"""Tests for the relay module"""
+
+import asyncio
+import socket
+import aiohttp
+import aiotesttoolkit
+from aiohttp import web
+from aiotesttoolkit_remoteviewer.app import Application
+from aiotesttoolkit_remoteviewer.pipeline import Pipeline
+from aiotesttoolkit_remoteviewer.relay import Relay
+
+
+class RelayTestCase(aiotesttoolkit.TestCase):
+    def test_relay(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+
+        async def run():
+            parent = Pipeline()
+            app = Application(
+                jinja2_templates_dir="etc/templates",
+                static_dir="static",
+                relay=parent.handle_partial,
+                relay_token="secret",
+            )
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", port).start()
+
+            children = [
+                Relay(
+                    "http://127.0.0.1:{}".format(port),
+                    pipeline=Pipeline(),
+                    interval=0.05,
+                    token="secret",
+                )
+                for _ in range(0, 2)
+            ]
+            tasks = [asyncio.ensure_future(_.run()) for _ in children]
+            # Relays without the token are refused
+            async with aiohttp.ClientSession() as session:
+                with self.assertRaises(aiohttp.WSServerHandshakeError) as error:
+                    await session.ws_connect("http://127.0.0.1:{}/relay".format(port))
+                self.assertEqual(error.exception.status, 401)
+            for i, child in enumerate(children):
+                for j in range(0, 100):
+                    await child.handle_stat(
+                        {"name": "match", "duration": 0.001 * (i * 100 + j + 1)}
+                    )
+            # Wait for partials to be sent
+            for _ in range(0, 100):
+                if all(_.sent for _ in children):
+                    break
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.05)
+            for _ in tasks:
+                _.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await runner.cleanup()
+
+            # Children keep serving their own dashboards
+            self.assertEqual(children[0].pipeline.aggregator.flush()[1][0].count, 100)
+            return parent.aggregator.flush()[1]
+
+        loop = asyncio.new_event_loop()
+        windows = loop.run_until_complete(run())
+        loop.close()
+
+        self.assertEqual(len(windows), 1)
+        self.assertEqual(windows[0].count, 200)
+        self.assertAlmostEqual(windows[0].max, 0.2)
+        (p50,) = windows[0].histogram.percentiles(50)
+        self.assertAlmostEqual(p50, 0.1, delta=0.1 * 0.05)
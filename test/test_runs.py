@@ -0,0 +1,89 @@
+"""Tests for the runs module"""
+
+import random
+import tempfile
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import stats
+from aiotesttoolkit_remoteviewer.aggregation import WindowStats
+from aiotesttoolkit_remoteviewer.runs import RunSummary, RunIndex, welch_t_test
+
+
+def window(node, values):
+    result = WindowStats(node)
+    for _ in values:
+        result.add(_)
+    return result
+
+
+def run(mean, *, seconds=20, rate=50, seed=1):
+    # Latencies around a mean, as received in 1s windows
+    rng = random.Random(seed)
+    summary = RunSummary()
+    for i in range(0, seconds):
+        summary.add_window(
+            1000.0 + i,
+            1.0,
+            [
+                window("match", [rng.gauss(mean, mean / 10) for _ in range(0, rate)]),
+                window("host", [rng.gauss(0.1, 0.01) for _ in range(0, rate)]),
+            ],
+        )
+    return summary
+
+
+class RunsTestCase(aiotesttoolkit.TestCase):
+    def test_summary(self):
+        summary = RunSummary(max_points=4)
+        summary.add_record(
+            stats.record({"type": "options", "slave": "a", "size": 100, "server": "s"})
+        )
+        summary.add_record(stats.record({"type": "info", "size": 1}))
+        self.assertEqual(summary.config, {"size": 100, "server": "s"})
+        self.assertFalse(summary)
+
+        for i in range(0, 6):
+            summary.add_window(10.0 + i, 1.0, [window("match", [0.1] * (i + 1))])
+        self.assertEqual(summary.duration, 6.0)
+        self.assertEqual(summary.nodes["match"].count, 21)
+        # Points are merged by pairs once there are too many
+        self.assertEqual(summary.step, 2.0)
+        self.assertEqual(
+            summary.throughput, [[10.0, 3, 0], [12.0, 7, 0], [14.0, 11, 0]]
+        )
+
+        copy = RunSummary.from_dict(summary.to_dict())
+        self.assertEqual(copy.to_dict(), summary.to_dict())
+
+    def test_welch_t_test(self):
+        t, df, p = welch_t_test(30, 1.0, 0.04, 30, 1.1, 0.04)
+        self.assertAlmostEqual(t, 1.9365, 4)
+        self.assertAlmostEqual(df, 58.0, 4)
+        self.assertAlmostEqual(p, 0.0577, 4)
+        self.assertEqual(welch_t_test(1, 1.0, 0.0, 30, 1.1, 0.04), (None, None, None))
+
+    def test_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index = RunIndex(directory)
+            base = index.save(run(0.2), run_id="base", tags=["v1"])
+            self.assertEqual(base["count"], 2000)
+            index.save(run(0.2, seed=2), run_id="same", tags=["v2"])
+            index.save(run(0.3, seed=3), run_id="slower", tags=["v2"])
+            with self.assertRaises(ValueError):
+                index.save(run(0.2), run_id="base")
+            for run_id in ("../base", "compare", "index"):
+                with self.assertRaises(ValueError):
+                    index.save(run(0.2), run_id=run_id)
+
+            # Reloaded from the index file
+            index = RunIndex(directory)
+            self.assertEqual([_["id"] for _ in index.list(tags=["v1"])], ["base"])
+            self.assertEqual(len(index.list()), 3)
+
+            nodes = {_["node"]: _ for _ in index.compare("base", "slower")["nodes"]}
+            self.assertTrue(nodes["match"]["significant"])
+            self.assertAlmostEqual(nodes["match"]["mean_change"], 0.5, 1)
+            self.assertFalse(nodes["host"]["significant"])
+            nodes = {_["node"]: _ for _ in index.compare("base", "same")["nodes"]}
+            self.assertFalse(nodes["match"]["significant"])
+            with self.assertRaises(KeyError):
+                index.compare("base", "unknown")
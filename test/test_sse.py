@@ -0,0 +1,107 @@
+"""Tests for the sse module"""
+
+import asyncio
+import json
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import stats
+from aiotesttoolkit_remoteviewer.sse import EventStream
+
+
+class Transport:
+    def __init__(self, *, buffered=0):
+        self.writes = []
+        self.buffered = buffered
+        self.closing = False
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def is_closing(self):
+        return self.closing
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+    def close(self):
+        self.closing = True
+
+
+def decode(event):
+    assert event.startswith(b"data: ") and event.endswith(b"\n\n")
+    return json.loads(event[6:])
+
+
+class SSETestCase(aiotesttoolkit.TestCase):
+    def test_batch(self):
+        stream = EventStream()
+        stream.publish({"node": "a", "count": 1}, key=("window", "a"), metric="window")
+        stream.publish({"rule": "r"}, metric="alert")
+        stream.publish({"node": "a", "count": 2}, key=("window", "a"), metric="window")
+        # Raw stats are not sent by default
+        stream.publish(stats.record({"type": "info", "name": "x"}), metric="info")
+        self.assertTrue(stream.flush())
+        self.assertFalse(stream.flush())
+        self.assertEqual(stream.events, 1)
+
+        # New subscribers get the last message of each key
+        self.assertTrue(stream.snapshot().startswith(b"retry: "))
+        self.assertEqual(
+            decode(stream.snapshot().split(b"\n\n", 1)[1]), [{"node": "a", "count": 2}]
+        )
+
+    def test_write(self):
+        async def run():
+            stream = EventStream()
+            transports = [Transport() for _ in range(0, 3)]
+            tasks = [
+                asyncio.ensure_future(stream.handle(_, chunked=i > 0))
+                for i, _ in enumerate(transports)
+            ]
+            await asyncio.sleep(0)
+            self.assertEqual(len(stream), 3)
+
+            stream.publish({"ratio": 2}, key="sampling", metric="sampling")
+            stream.publish({"rule": "r"}, metric="alert")
+            stream.flush()
+            event = transports[0].writes[0]
+            self.assertEqual(decode(event), [{"ratio": 2}, {"rule": "r"}])
+            # Chunked transports share the same framed bytes
+            self.assertIs(transports[1].writes[0], transports[2].writes[0])
+            self.assertEqual(
+                transports[1].writes[0],
+                b"%x\r\n" % len(event) + event + b"\r\n",
+            )
+
+            # Closed transports are forgotten
+            transports[0].closing = True
+            stream.flush()
+            await asyncio.sleep(0)
+            self.assertEqual(len(stream), 2)
+            self.assertTrue(tasks[0].done())
+
+            stream.close()
+            await asyncio.gather(*tasks)
+            self.assertEqual(len(stream), 0)
+
+        asyncio.new_event_loop().run_until_complete(run())
+
+    def test_slow(self):
+        async def run():
+            stream = EventStream(max_buffer=100)
+            fast = Transport()
+            slow = Transport(buffered=1000)
+            tasks = [
+                asyncio.ensure_future(stream.handle(_, chunked=True))
+                for _ in (fast, slow)
+            ]
+            await asyncio.sleep(0)
+            stream.publish({"ratio": 2}, key="sampling", metric="sampling")
+            stream.flush()
+            self.assertEqual(len(fast.writes), 1)
+            self.assertEqual(slow.writes, [])
+            self.assertTrue(slow.closing)
+            self.assertEqual(stream.dropped, 1)
+            stream.close()
+            await asyncio.gather(*tasks)
+
+        asyncio.new_event_loop().run_until_complete(run())
@@ -0,0 +1,50 @@
+"""Tests for the stats module"""
+
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import stats
+
+
+class StatsTestCase(aiotesttoolkit.TestCase):
+    def test_record(self):
+        stat = {
+            "slave": "slave-1",
+            "type": "profile",
+            "name": "match",
+            "time": 10.0,
+            "duration": 0.1,
+            "error": True,
+        }
+        record = stats.record(stat)
+
+        self.assertEqual(record.node_name, "match")
+        self.assertEqual(record.kind_name, "profile")
+        self.assertEqual(record.duration, 0.1)
+        self.assertTrue(record.error)
+        self.assertEqual(record.to_dict(), stat)
+
+    def test_interning(self):
+        first = stats.record({"name": "match", "duration": 0.1})
+        second = stats.record({"name": "match", "duration": 0.2})
+
+        # Names are shared, missing ones have the empty id
+        self.assertEqual(first.node, second.node)
+        self.assertEqual(first.slave, 0)
+        self.assertIsNone(first.slave_name)
+
+        # Bot ids are not interned, new bots keep coming in long tests
+        size = len(stats.SYMBOLS.names)
+        record = stats.record({"name": "match", "bot": 42, "duration": 0.1})
+        self.assertEqual(record.bot, "42")
+        self.assertEqual(len(stats.SYMBOLS.names), size)
+        self.assertEqual(record.to_dict()["bot"], "42")
+
+    def test_extra(self):
+        stat = {"type": "info", "message": "started", "time": 1.0}
+        record = stats.record(stat)
+
+        # Other keys are only kept for stats that are not profiled calls
+        self.assertEqual(record.extra, {"message": "started"})
+        self.assertEqual(record.to_dict(), stat)
+        self.assertIsNone(
+            stats.record({"name": "match", "duration": 0.1, "x": 1}).extra
+        )
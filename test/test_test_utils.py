@@ -0,0 +1,89 @@
+"""Tests for the _test_utils module"""
+
+import json
+import os
+import tempfile
+import time
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import _test_utils
+
+
+class Sample(aiotesttoolkit.TestCase):
+    # Only run by the tests below
+    __test__ = False
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ready = True
+
+    def test_short(self):
+        pass
+
+    def test_long(self):
+        time.sleep(self.options["delay"])
+
+    def test_fail(self):
+        self.fail("failed")
+
+    def test_fixture(self):
+        self.assertTrue(self.ready)
+
+
+class TestUtilsTestCase(aiotesttoolkit.TestCase):
+    def test_run_parallel(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = os.path.join(directory, "Config.json")
+            timings = os.path.join(directory, "timings.json")
+            with open(config, "w") as f:
+                f.write(
+                    json.dumps(
+                        {
+                            "options": {"delay": 0.2},
+                            "children": [
+                                {
+                                    "name": "test.test_test_utils",
+                                    "test_cases": [
+                                        {
+                                            "name": "Sample",
+                                            "tests": [
+                                                {"name": "test_short"},
+                                                {"name": "test_long"},
+                                                {"name": "test_fail"},
+                                                {"name": "test_fixture"},
+                                            ],
+                                        }
+                                    ],
+                                }
+                            ],
+                        }
+                    )
+                )
+
+            passed = _test_utils.run(
+                config,
+                parent_module=None,
+                workers=2,
+                timings=timings,
+                with_coverage=False,
+            )
+
+            self.assertFalse(passed)
+            with open(timings, "r") as f:
+                report = json.loads(f.read())
+            self.assertEqual(report["workers"], 2)
+            tests = report["tests"]
+            prefix = "test.test_test_utils.Sample."
+            self.assertEqual(tests[prefix + "test_short"]["status"], "ok")
+            self.assertEqual(tests[prefix + "test_fail"]["status"], "fail")
+            # Class fixtures run in workers too
+            self.assertEqual(tests[prefix + "test_fixture"]["status"], "ok")
+            self.assertGreaterEqual(tests[prefix + "test_long"]["duration"], 0.2)
+            # The report is sorted longest first, for the next run
+            self.assertEqual(list(tests)[0], prefix + "test_long")
+            self.assertEqual(
+                _test_utils.load_timings(timings)[prefix + "test_long"],
+                tests[prefix + "test_long"]["duration"],
+            )
+
+    def test_load_timings(self):
+        self.assertEqual(_test_utils.load_timings("missing.json"), {})
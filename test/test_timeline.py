@@ -0,0 +1,127 @@
+"""Tests for the timeline module"""
+
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import stats
+from aiotesttoolkit_remoteviewer.timeline import SpanIndex
+
+
+def span(bot, node, end, duration, error=False):
+    return stats.record(
+        {
+            "slave": "slave",
+            "bot": bot,
+            "name": node,
+            "time": end,
+            "duration": duration,
+            "error": error,
+        }
+    )
+
+
+class TimelineTestCase(aiotesttoolkit.TestCase):
+    def test_spans(self):
+        index = SpanIndex(base=0.01)
+        index.add(span(1, "match", 100.05, 0.05))
+        index.add(span(2, "create_game", 100.2, 0.01, error=True))
+        index.add(span(1, "host", 101.0, 1.0))
+
+        # Spans as-is at the finest zoom, long ones included
+        result = index.query(100.0, 100.1, width=1000)
+        self.assertIsNone(result["level"])
+        self.assertEqual(
+            sorted((_[0], _[3]) for _ in result["spans"]), [(0, "host"), (0, "match")]
+        )
+        self.assertEqual(result["lanes"], [[0, "slave/1"], [1, "slave/2"]])
+
+        # Only the second lane
+        result = index.query(100.0, 100.5, width=1000, first=1, rows=1)
+        self.assertEqual(result["spans"], [[1, 100.19, 100.2, "create_game", True]])
+
+    def test_levels(self):
+        index = SpanIndex(base=0.01, factor=4)
+        for bot in range(0, 10):
+            for i in range(0, 1000):
+                index.add(span(bot, "match", 1000.0 + i * 0.1, 0.05))
+
+        # 100 seconds on 100 pixels use buckets of at least one second
+        result = index.query(1000.0, 1100.0, width=100, rows=5)
+        self.assertEqual(result["step"], 2.56)
+        self.assertEqual(len(result["lanes"]), 5)
+        self.assertLessEqual(len(result["buckets"]), 5 * 41)
+        # Spans are counted in each bucket they overlap
+        lane = [_ for _ in result["buckets"] if _[0] == 0]
+        self.assertGreaterEqual(sum(_[2] for _ in lane), 1000)
+        self.assertLessEqual(sum(_[2] for _ in lane), 1000 + len(lane))
+        self.assertFalse(result["spans"])
+
+        # Too many spans for the limit fall back to buckets
+        result = index.query(1000.0, 1010.0, width=10000, rows=10, limit=50)
+        self.assertEqual(result["level"], 0)
+        self.assertTrue(result["truncated"])
+        self.assertEqual(len(result["buckets"]), 50)
+
+    def test_bounds(self):
+        index = SpanIndex(base=0.01)
+        # Nothing indexed yet
+        result = index.query(0.0, 1e13, width=1)
+        self.assertEqual(result["buckets"], [])
+        self.assertEqual(result["lanes"], [])
+
+        index.add(span(1, "match", 100.0, 0.05))
+        index.add(span(1, "match", 1e6, 0.05))
+        for since, until, count in (
+            (-1e13, 1e13, 2),
+            (0.0, 1e13, 2),
+            (-1e13, 200.0, 1),
+        ):
+            result = index.query(since, until, width=1)
+            self.assertEqual(sum(_[2] for _ in result["buckets"]), count)
+        result = index.query(-1e13, 1e13, width=4000)
+        self.assertEqual(sum(_[2] for _ in result["buckets"]), 2)
+
+    def test_prune(self):
+        index = SpanIndex(base=0.01, retention=10.0)
+        index.add(span(1, "match", 100.0, 0.05))
+        index.add(span(1, "host", 100.0, 50.0))
+        index.add(span(1, "match", 200.0, 0.05))
+        index.prune(200.0)
+
+        for level in index.levels:
+            self.assertTrue(all((_ + 1) * level.width >= 190.0 for _ in level.buckets))
+        result = index.query(0.0, 300.0, width=10, rows=1)
+        self.assertEqual(sum(_[2] for _ in result["buckets"]), 1)
+
+    def test_prune_lanes(self):
+        index = SpanIndex(base=0.01, levels=4, capacity=1, retention=10.0)
+        # Bots that are gone
+        for bot in range(0, 2000):
+            index.add(span(bot, "match", 100.0, 0.05))
+        index.add(span("last", "match", 200.0, 0.05))
+        index.prune(200.0)
+        self.assertEqual(len(index._lanes), 1)
+
+        # Numbers of freed lanes are reused
+        index.add(span("new", "match", 201.0, 0.05))
+        self.assertLess(max(index._lanes.values()), 2001)
+        result = index.query(195.0, 205.0, width=10, rows=3000)
+        self.assertEqual(
+            sorted(_[1] for _ in result["lanes"]), ["slave/last", "slave/new"]
+        )
+
+    def test_prune_levels(self):
+        index = SpanIndex(base=0.01, factor=4, levels=3, retention=100.0, buckets=100)
+        # Received out of order
+        index.add(span(1, "match", 50.0, 0.05))
+        index.add(span(1, "match", 10.0, 0.05))
+        index.prune(60.0)
+
+        # Fine levels keep less history than coarse ones
+        self.assertEqual([_.retention for _ in index.levels], [1.0, 4.0, 16.0])
+        self.assertEqual([len(_.buckets) for _ in index.levels], [0, 0, 1])
+        # Zooms on pruned times use a coarser level
+        result = index.query(49.0, 50.0, width=50)
+        self.assertEqual(result["level"], 2)
+        self.assertEqual(sum(_[2] for _ in result["buckets"]), 1)
+        # Spans older than the pruned levels are ignored
+        index.add(span(1, "match", 20.0, 0.05))
+        self.assertEqual([len(_.buckets) for _ in index.levels], [0, 0, 1])
@@ -0,0 +1,76 @@
+""" Tests for the timeseries module """
+import aiotesttoolkit
+from aiotesttoolkit_remoteviewer import timeseries
+
+
+class TimeSeriesTestCase(aiotesttoolkit.TestCase):
+    def test_ring_buffer(self):
+        ring = timeseries.RingBuffer(4)
+        for _ in range(0, 6):
+            ring.append(float(_), _ * 10.0)
+
+        # Only the 4 newest samples are kept
+        self.assertEqual(len(ring), 4)
+        times, values = ring.range()
+        self.assertEqual(times.tolist(), [2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(values.tolist(), [20.0, 30.0, 40.0, 50.0])
+        times, values = ring.range(3.0, 5.0)
+        self.assertEqual(times.tolist(), [3.0, 4.0])
+
+    def test_out_of_order(self):
+        ring = timeseries.RingBuffer(4)
+        ring.append(2.0, 1.0)
+        ring.append(1.0, 1.0)
+
+        self.assertEqual(ring.range()[0].tolist(), [2.0, 2.0])
+
+    def test_downsample(self):
+        ring = timeseries.RingBuffer(100)
+        for _ in range(0, 10):
+            ring.append(_ * 0.5, float(_))
+
+        times, values = ring.downsample(0.0, 5.0, 1.0)
+        self.assertEqual(times.tolist(), [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(values.tolist(), [0.5, 2.5, 4.5, 6.5, 8.5])
+
+    def test_backfill(self):
+        store = timeseries.TimeSeriesStore(capacity=10)
+        store.append("match", 1.0, 0.1)
+        store.append("match", 1.5, 0.3)
+
+        backfill = store.backfill(0.0, 10.0, points=5)
+        self.assertEqual(list(backfill), ["match"])
+        self.assertEqual(backfill["match"]["t"], [0.0])
+        self.assertAlmostEqual(backfill["match"]["v"][0], 0.2)
+
+    def test_chunks(self):
+        ring = timeseries.RingBuffer(10)
+        for _ in range(0, 10):
+            ring.append(float(_), float(_))
+
+        chunks = ring.chunks(2.0, None, size=3)
+        times, _ = next(chunks)
+        self.assertEqual(times.tolist(), [2.0, 3.0, 4.0])
+        # Samples overwritten while reading are skipped
+        for _ in range(10, 16):
+            ring.append(float(_), float(_))
+        self.assertEqual(
+            [_ for times, _ in chunks for _ in times.tolist()], [6.0, 7.0, 8.0, 9.0]
+        )
+
+    def test_growth(self):
+        ring = timeseries.RingBuffer(100)
+        self.assertEqual(len(ring.times), 64)
+        for _ in range(0, 150):
+            ring.append(float(_), float(_))
+        # Grown up to the capacity, then the oldest samples are overwritten
+        self.assertEqual(len(ring.times), 100)
+        self.assertEqual(ring.range()[0].tolist(), [float(_) for _ in range(50, 150)])
+
+    def test_max_metrics(self):
+        store = timeseries.TimeSeriesStore(capacity=10, max_metrics=2)
+        for metric in ("a", "b", "c", "a"):
+            store.append(metric, 1.0, 0.1)
+        self.assertEqual(store.metrics(), ["a", "b"])
+        self.assertEqual(store.rejected, 1)
+        self.assertEqual(len(store["a"]), 2)